@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+import json
+import shutil
+import uuid
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config import STATE_DIR
+from precos import OVERLAP_DIAS
+
+
+JANELA_VOL = 21  # pregões (~1 mês)
+ANUALIZACAO = 252
+MIN_OBS_CORR = 20
+SERIES = ["Retorno", "Retorno_Acum", "Vol_Anual", "Drawdown"]
+
+
+@dataclass
+class Estado:
+    """
+    Estado acumulado até a data `ate` (inclusive), por ticker (vetores) e por par (matrizes):
+    o suficiente para continuar as séries só com as datas novas. As colunas de cada ticker
+    são independentes: dá para tirar um ticker (selecionar) sem recalcular os outros.
+    """
+    tickers: list[str]
+    janela: int
+    ate: pd.Timestamp | None
+    ultimo: np.ndarray  # último preço válido (base do próximo retorno, mesmo depois de dias sem pregão)
+    primeiro: np.ndarray  # primeiro preço válido (base do retorno acumulado)
+    pico: np.ndarray  # máximo histórico do preço
+    mdd: np.ndarray  # pior drawdown até aqui
+    cauda: np.ndarray  # (janela - 1, k): últimos retornos válidos de cada ticker, alinhados embaixo
+    # estatísticas suficientes da correlação (pares com as duas pontas válidas)
+    n: np.ndarray
+    sx: np.ndarray
+    sxx: np.ndarray
+    sxy: np.ndarray
+    partes: list[str] = field(default_factory=list)  # partes das séries gravadas junto com este estado
+
+    @classmethod
+    def vazio(cls, tickers: list[str], janela: int = JANELA_VOL) -> Estado:
+        k = len(tickers)
+        nan = np.full(k, np.nan)
+        zeros = np.zeros((k, k))
+        return cls(
+            list(tickers), janela, None, nan.copy(), nan.copy(), nan.copy(), nan.copy(),
+            np.full((janela - 1, k), np.nan), zeros.copy(), zeros.copy(), zeros.copy(), zeros.copy(),
+        )
+
+    def selecionar(self, tickers: list[str]) -> Estado:
+        """Só as colunas de `tickers` (todos já no estado), nessa ordem."""
+        i = [self.tickers.index(t) for t in tickers]
+        par = np.ix_(i, i)
+        return replace(
+            self, tickers=list(tickers), ultimo=self.ultimo[i], primeiro=self.primeiro[i], pico=self.pico[i],
+            mdd=self.mdd[i], cauda=self.cauda[:, i], n=self.n[par], sx=self.sx[par], sxx=self.sxx[par], sxy=self.sxy[par],
+        )
+
+    def save(self, path: Path):
+        meta = {
+            "tickers": self.tickers, "janela": self.janela,
+            "ate": self.ate.isoformat() if self.ate is not None else None, "partes": self.partes,
+        }
+        tmp = path.with_name(path.stem + ".tmp.npz")
+        np.savez(
+            tmp, meta=np.array(json.dumps(meta)), ultimo=self.ultimo, primeiro=self.primeiro, pico=self.pico,
+            mdd=self.mdd, cauda=self.cauda, n=self.n, sx=self.sx, sxx=self.sxx, sxy=self.sxy,
+        )
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> Estado | None:
+        if not path.exists():
+            return None
+        with np.load(path, allow_pickle=False) as z:
+            meta = json.loads(str(z["meta"]))
+            arrays = {k: z[k] for k in ("ultimo", "primeiro", "pico", "mdd", "cauda", "n", "sx", "sxx", "sxy")}
+        ate = pd.Timestamp(meta["ate"]) if meta["ate"] else None
+        return cls(meta["tickers"], meta["janela"], ate, **arrays, partes=meta.get("partes", []))
+
+
+def _rolling_std(buf: np.ndarray, janela: int) -> np.ndarray:
+    return pd.DataFrame(buf).rolling(janela, min_periods=janela).std().to_numpy()
+
+
+def _ffill(a: np.ndarray) -> np.ndarray:
+    """Repete o último valor válido de cada coluna para baixo."""
+    idx = np.where(np.isnan(a), 0, np.arange(len(a))[:, None])
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return a[idx, np.arange(a.shape[1])]
+
+
+def _somas(ret: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """n, sx, sxx, sxy da correlação: para cada par, só as datas com os dois retornos válidos."""
+    mask = ~np.isnan(ret)
+    x = np.where(mask, ret, 0.0)
+    mf = mask.astype("float64")
+    return mf.T @ mf, x.T @ mf, (x * x).T @ mf, x.T @ x
+
+
+def fold(estado: Estado, precos: pd.DataFrame) -> tuple[Estado, pd.DataFrame]:
+    """
+    Dobra as linhas novas (Data x tickers, datas > estado.ate, colunas na ordem de
+    estado.tickers) no estado. Devolve o novo estado (o anterior não é alterado) e as
+    séries diárias das linhas novas, em formato largo com colunas (série, ticker).
+    NaN = o ticker não negociou na data: a linha não entra em nenhuma série dele, e o retorno
+    seguinte é contra o último preço válido. A volatilidade usa os últimos `janela` retornos
+    de cada ticker (não as últimas `janela` linhas do calendário).
+    Tudo vetorizado nas linhas e nos tickers; o custo depende só do número de linhas novas.
+    """
+    p = precos.to_numpy(dtype="float64")
+    m, k = p.shape
+    cols = np.arange(k)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        anterior = _ffill(np.vstack([estado.ultimo[None], p]))
+        ret = p / anterior[:-1] - 1
+
+        validos = ~np.isnan(p)
+        primeiro_novo = np.where(validos.any(axis=0), p[validos.argmax(axis=0), cols], np.nan)
+        primeiro = np.where(np.isnan(estado.primeiro), primeiro_novo, estado.primeiro)
+        acum = p / primeiro - 1
+
+        # retornos válidos de cada coluna compactados no topo, para a janela móvel contar retornos
+        buf = np.vstack([estado.cauda, ret])
+        ok = ~np.isnan(buf)
+        pos = np.cumsum(ok, axis=0) - 1
+        compacto = np.full(buf.shape, np.nan)
+        compacto[pos[ok], np.broadcast_to(cols, buf.shape)[ok]] = buf[ok]
+        std = _rolling_std(compacto, estado.janela)
+        vol = np.where(ok, std[np.maximum(pos, 0), cols], np.nan)[-m:] * np.sqrt(ANUALIZACAO)
+        fim = ok.sum(axis=0)[None] - (estado.janela - 1) + np.arange(estado.janela - 1)[:, None]
+        cauda = np.where(fim >= 0, compacto[np.maximum(fim, 0), cols], np.nan)
+
+        pico = np.fmax.accumulate(np.vstack([estado.pico[None], p]), axis=0)[1:]
+        dd = p / pico - 1
+
+    n, sx, sxx, sxy = _somas(ret)
+    novo = replace(
+        estado,
+        ate=pd.Timestamp(precos.index[-1]),
+        ultimo=anterior[-1].copy(),
+        primeiro=primeiro,
+        pico=pico[-1].copy(),
+        mdd=np.fmin(estado.mdd, np.fmin.reduce(dd, axis=0)),
+        cauda=cauda,
+        n=estado.n + n,
+        sx=estado.sx + sx,
+        sxx=estado.sxx + sxx,
+        sxy=estado.sxy + sxy,
+    )
+    series = pd.concat(
+        {nome: pd.DataFrame(v, index=precos.index, columns=estado.tickers)
+         for nome, v in zip(SERIES, (ret, acum, vol, dd))},
+        axis=1,
+    )
+    return novo, series
+
+
+def correlacao(estado: Estado, min_obs: int = MIN_OBS_CORR) -> pd.DataFrame:
+    """Correlação dos retornos diários de todo o histórico, a partir das somas acumuladas."""
+    n, sx, sxx, sxy = estado.n, estado.sx, estado.sxx, estado.sxy
+    sy, syy = sx.T, sxx.T
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = (n * sxy - sx * sy) / np.sqrt((n * sxx - sx ** 2) * (n * syy - sy ** 2))
+    corr = np.where(n >= min_obs, np.clip(corr, -1, 1), np.nan)
+    return pd.DataFrame(corr, index=estado.tickers, columns=estado.tickers)
+
+
+def _long(series: pd.DataFrame) -> pd.DataFrame:
+    if series.empty:
+        return pd.DataFrame(columns=["Data", "Ticker", *SERIES])
+    out = series.stack(level=1, future_stack=True).rename_axis(["Data", "Ticker"]).reset_index()
+    return out[["Data", "Ticker", *SERIES]].dropna(subset=SERIES, how="all")
+
+
+@dataclass
+class Analise:
+    diaria: pd.DataFrame  # longo: Data, Ticker, Retorno, Retorno_Acum, Vol_Anual, Drawdown
+    resumo: pd.DataFrame  # uma linha por ticker
+    correlacao: pd.DataFrame
+
+
+class Analisador:
+    """
+    Retornos, volatilidade móvel, drawdown e correlação sobre o close_brl, de forma incremental.
+    - o estado (analise/estado.npz) e as séries diárias já calculadas (analise/series/*.parquet)
+      ficam no STATE_DIR; cada execução só dobra as datas depois de estado.ate
+    - as últimas `assentamento_dias` datas ainda podem ser revisadas (o PriceStore rebaixa esse
+      trecho), então entram como provisórias: calculadas a partir do estado, mas não gravadas
+    - o estado é por ticker: ticker novo entra com o próprio histórico (e as somas cruzadas
+      com os retornos já gravados dos outros); ticker que saiu do universo sai do estado
+    - ticker do universo que falhou nesta execução (fora do close_brl) continua no estado; até
+      ele voltar nada é assentado, para as datas dele não serem dobradas como "sem pregão"
+    - mudou a janela: recalcula do zero (uma vez)
+    - gravação: partes novas em arquivo temporário, depois o estado (que lista as partes), depois
+      o rename; uma queda no meio é completada (ou descartada) na execução seguinte
+    """
+
+    def __init__(self, root: str | Path | None = None, janela: int = JANELA_VOL, assentamento_dias: int = OVERLAP_DIAS):
+        self.root = Path(root) if root else STATE_DIR / "analise"
+        self.janela = janela
+        self.assentamento = timedelta(days=assentamento_dias)
+
+    @property
+    def estado_path(self) -> Path:
+        return self.root / "estado.npz"
+
+    @property
+    def series_dir(self) -> Path:
+        return self.root / "series"
+
+    def reset(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _gravadas(self) -> pd.DataFrame:
+        if not self.series_dir.exists() or not any(self.series_dir.glob("*.parquet")):
+            return _long(pd.DataFrame())
+        # partes em ordem de nome (= de gravação): um ticker que saiu e voltou fica com as linhas novas
+        return pd.read_parquet(self.series_dir).drop_duplicates(["Data", "Ticker"], keep="last")
+
+    def _tmp(self, parte: str) -> Path:
+        # prefixo "." : o leitor de datasets do pyarrow ignora
+        return self.series_dir / f".{parte}.tmp"
+
+    def _recuperar(self, estado: Estado | None):
+        """Completa o rename das partes do estado gravado; descarta as que ficaram sem estado."""
+        if not self.series_dir.exists():
+            return
+        for parte in estado.partes if estado is not None else []:
+            tmp = self._tmp(parte)
+            if tmp.exists() and not (self.series_dir / parte).exists():
+                tmp.replace(self.series_dir / parte)
+        for tmp in self.series_dir.glob(".part-*.tmp"):
+            tmp.unlink()
+
+    def _gravar(self, estado: Estado, series: list[pd.DataFrame]) -> Estado:
+        self.series_dir.mkdir(parents=True, exist_ok=True)
+        partes = []
+        for df in series:
+            parte = f"part-{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}.parquet"
+            df.to_parquet(self._tmp(parte), index=False)
+            partes.append(parte)
+        estado = replace(estado, partes=partes)
+        estado.save(self.estado_path)
+        for parte in partes:
+            self._tmp(parte).replace(self.series_dir / parte)
+        return estado
+
+    def _adicionar(self, estado: Estado, precos: pd.DataFrame, novos: list[str]) -> tuple[Estado, pd.DataFrame]:
+        """Tickers novos num estado já avançado: histórico deles até estado.ate, sem refazer os outros."""
+        hist = precos.loc[precos.index <= estado.ate, novos]
+        if hist.empty:
+            return _juntar(estado, Estado.vazio(novos, estado.janela), None), pd.DataFrame()
+        est_novos, series = fold(Estado.vazio(novos, estado.janela), hist)
+        gravadas = self._gravadas()
+        antigos = (
+            gravadas.pivot(index="Data", columns="Ticker", values="Retorno")
+            .reindex(index=hist.index, columns=estado.tickers)
+            .to_numpy(dtype="float64")
+        )
+        somas = _somas(np.hstack([antigos, series["Retorno"].to_numpy(dtype="float64")]))
+        return _juntar(estado, est_novos, somas), series
+
+    def atualizar(self, close_brl: pd.DataFrame, tickers: list[str] | None = None) -> Analise:
+        """
+        close_brl: Data x tickers (NaN = sem pregão). tickers: o universo; None = os do estado
+        mais os do close_brl (ninguém sai).
+        """
+        precos = close_brl.set_index("Data") if "Data" in close_brl.columns else close_brl
+        precos.index = pd.DatetimeIndex(precos.index).astype("datetime64[us]")
+        precos = precos.sort_index()
+        presentes = list(precos.columns)
+
+        estado = Estado.load(self.estado_path)
+        self._recuperar(estado)
+        if estado is not None and estado.janela != self.janela:
+            print("[AVISO] Janela mudou; recalculando a análise do histórico todo.")
+            estado = None
+        if estado is None:
+            self.reset()
+            estado = Estado.vazio([], self.janela)
+
+        universo = list(dict.fromkeys(tickers)) if tickers is not None else estado.tickers + presentes
+        universo = list(dict.fromkeys(universo))
+        estado = estado.selecionar([t for t in estado.tickers if t in universo])
+        novos = [t for t in universo if t in presentes and t not in estado.tickers]
+        series_novas: list[pd.DataFrame] = []
+        if novos and estado.ate is None:
+            estado = _juntar(estado, Estado.vazio(novos, self.janela), None)
+        elif novos:
+            estado, series = self._adicionar(estado, precos, novos)
+            series_novas.append(_long(series))
+        ausentes = [t for t in estado.tickers if t not in presentes]
+        precos = precos.reindex(columns=estado.tickers)
+
+        novas = precos if estado.ate is None else precos[precos.index > estado.ate]
+        if ausentes and len(novas):
+            print(f"[AVISO] Sem preços de {ausentes} nesta execução; a análise das datas novas fica provisória.")
+            limite = None
+        else:
+            limite = precos.index.max() - self.assentamento if len(precos) else None
+        assentadas = novas[novas.index <= limite] if limite is not None else novas.iloc[:0]
+        provisorias = novas[novas.index > limite] if limite is not None else novas
+
+        if len(assentadas) and estado.tickers:
+            estado, series = fold(estado, assentadas)
+            series_novas.append(_long(series))
+        if series_novas:
+            estado = self._gravar(estado, series_novas)
+
+        final, diaria = estado, self._gravadas()
+        diaria = diaria[diaria["Ticker"].isin(estado.tickers)]
+        if len(provisorias) and estado.tickers:
+            final, series = fold(estado, provisorias)
+            diaria = pd.concat([diaria, _long(series)], ignore_index=True)
+        diaria = diaria.sort_values(["Ticker", "Data"], ignore_index=True)
+        return Analise(diaria, resumo(final, diaria), correlacao(final))
+
+
+def _juntar(estado: Estado, novos: Estado, somas: tuple | None) -> Estado:
+    """Estado com as colunas de `novos` acrescentadas; somas: matrizes completas (antigos + novos)."""
+    k = len(estado.tickers)
+    if somas is None:
+        total = k + len(novos.tickers)
+        somas = tuple(np.zeros((total, total)) for _ in range(4))
+    matrizes = []
+    for antiga, nova in zip((estado.n, estado.sx, estado.sxx, estado.sxy), somas):
+        m = nova.copy()
+        m[:k, :k] = antiga
+        matrizes.append(m)
+    return replace(
+        estado,
+        tickers=estado.tickers + novos.tickers,
+        ultimo=np.concatenate([estado.ultimo, novos.ultimo]),
+        primeiro=np.concatenate([estado.primeiro, novos.primeiro]),
+        pico=np.concatenate([estado.pico, novos.pico]),
+        mdd=np.concatenate([estado.mdd, novos.mdd]),
+        cauda=np.hstack([estado.cauda, novos.cauda]),
+        n=matrizes[0], sx=matrizes[1], sxx=matrizes[2], sxy=matrizes[3],
+    )
+
+
+def resumo(estado: Estado, diaria: pd.DataFrame) -> pd.DataFrame:
+    ultimos = diaria.groupby("Ticker", sort=False)[SERIES].last()
+    datas = diaria.dropna(subset=["Retorno_Acum"]).groupby("Ticker", sort=False)["Data"].last()
+    out = pd.DataFrame(index=pd.Index(estado.tickers, name="Ticker"))
+    out["Data"] = datas
+    out["Ultimo_Retorno"] = ultimos["Retorno"]
+    out["Retorno_Acum"] = ultimos["Retorno_Acum"]
+    out["Vol_Anual"] = ultimos["Vol_Anual"]
+    out["Drawdown_Atual"] = ultimos["Drawdown"]
+    out["Max_Drawdown"] = estado.mdd
+    return out.reset_index()
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import argparse
+import uuid
+from datetime import date, datetime
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from config import STATE_DIR
+from texto import normalize
+
+
+CATEGORICAS = ["Nome_Fundo", "Codigo_Fundo", "Categoria", "Tipo", "Especie", "Status", "Modalidade de Envio"]
+
+_PARTITIONING = ds.partitioning(pa.schema([("ano", pa.int16()), ("mes", pa.int8())]), flavor="hive")
+
+
+def _with_stable_types(table: pa.Table) -> pa.Table:
+    # tipos fixos para que arquivos de execuções diferentes tenham o mesmo schema
+    fields = []
+    for f in table.schema:
+        if pa.types.is_dictionary(f.type):
+            f = f.with_type(pa.dictionary(pa.int32(), pa.string()))
+        elif pa.types.is_large_string(f.type) or pa.types.is_null(f.type):
+            f = f.with_type(pa.string())
+        elif pa.types.is_timestamp(f.type):
+            f = f.with_type(pa.timestamp("us"))
+        fields.append(f)
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+
+class Archive:
+    """
+    Histórico local dos documentos coletados, em Parquet particionado por
+    ano/mês da Data de Entrega (hive: ano=2026/mes=10/part-*.parquet).
+    - append() só acrescenta arquivos novos (nada é sobrescrito)
+    - query() filtra por partição (poda) e empurra ticker/datas para o leitor
+    """
+
+    def __init__(self, root: str | Path | None = None):
+        self.root = Path(root) if root else STATE_DIR / "arquivo"
+        self.text_root = self.root.with_name(f"{self.root.name}_textos")
+
+    def append(self, df: pd.DataFrame) -> int:
+        if df.empty:
+            return 0
+        df = df.copy()
+        dt = pd.to_datetime(df["Dt_Entrega"], dayfirst=True, errors="coerce") if "Dt_Entrega" in df else pd.NaT
+        df["Dt_Entrega"] = dt
+        if "Dt_Ref" in df.columns:
+            df["Dt_Ref"] = pd.to_datetime(df["Dt_Ref"], dayfirst=True, errors="coerce")
+        df["ano"] = df["Dt_Entrega"].dt.year.fillna(0).astype("int16")
+        df["mes"] = df["Dt_Entrega"].dt.month.fillna(0).astype("int8")
+        df["Coletado_Em"] = pd.Timestamp(datetime.now())
+        for col in CATEGORICAS:
+            if col in df.columns:
+                df[col] = df[col].astype("string").astype("category")
+
+        table = _with_stable_types(pa.Table.from_pandas(df, preserve_index=False))
+        ds.write_dataset(
+            table,
+            self.root,
+            format="parquet",
+            partitioning=_PARTITIONING,
+            basename_template=f"part-{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        return len(df)
+
+    def append_texts(self, df: pd.DataFrame) -> int:
+        """Texto extraído dos documentos baixados (DocNumber, sha256, Texto)."""
+        if df.empty:
+            return 0
+        self.text_root.mkdir(parents=True, exist_ok=True)
+        out = self.text_root / f"part-{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}.parquet"
+        pq.write_table(_with_stable_types(pa.Table.from_pandas(df, preserve_index=False)), out)
+        return len(df)
+
+    def texts(self, docs: list[str] | None = None, columns: list[str] | None = None) -> pd.DataFrame:
+        if not self.text_root.exists() or not any(self.text_root.glob("*.parquet")):
+            return pd.DataFrame(columns=columns or ["DocNumber", "sha256", "Texto"])
+        dataset = ds.dataset(self.text_root, format="parquet")
+        expr = pc.field("DocNumber").isin([str(d) for d in docs]) if docs else None
+        return dataset.to_table(filter=expr, columns=columns).to_pandas().drop_duplicates("DocNumber", keep="last")
+
+    def dataset(self) -> ds.Dataset | None:
+        if not self.root.exists() or not any(self.root.rglob("*.parquet")):
+            return None
+        return ds.dataset(self.root, format="parquet", partitioning=_PARTITIONING)
+
+    def query(
+        self,
+        ticker: str | list[str] | None = None,
+        categoria: str | None = None,
+        tipo: str | None = None,
+        inicio: date | None = None,
+        fim: date | None = None,
+        columns: list[str] | None = None,
+    ) -> pd.DataFrame:
+        """
+        Consulta o histórico.
+        - ticker: igualdade (um ou vários); inicio/fim: faixa da Data de Entrega (inclusiva)
+        - categoria/tipo: "contém", sem acento/caixa (aplicado só nas categorias distintas)
+        """
+        dataset = self.dataset()
+        if dataset is None:
+            return pd.DataFrame()
+
+        expr = None
+
+        def _and(e):
+            nonlocal expr
+            expr = e if expr is None else expr & e
+
+        ano, mes = pc.field("ano"), pc.field("mes")
+        if inicio is not None:
+            _and((ano > inicio.year) | ((ano == inicio.year) & (mes >= inicio.month)))
+            _and(pc.field("Dt_Entrega") >= pd.Timestamp(inicio))
+        if fim is not None:
+            _and((ano < fim.year) | ((ano == fim.year) & (mes <= fim.month)))
+            _and(pc.field("Dt_Entrega") < pd.Timestamp(fim) + pd.Timedelta(days=1))
+        if ticker:
+            tickers = [ticker] if isinstance(ticker, str) else list(ticker)
+            _and(pc.field("Codigo_Fundo").isin([t.upper() for t in tickers]))
+
+        df = dataset.to_table(filter=expr, columns=columns).to_pandas()
+
+        for col, termo in (("Categoria", categoria), ("Tipo", tipo)):
+            if termo and col in df.columns:
+                s = df[col].astype("category")
+                alvo = normalize(termo)
+                ok = [c for c in s.cat.categories if alvo in normalize(c)]
+                df = df[s.isin(ok)]
+
+        if "DocNumber" in df.columns:
+            sort_col = "Coletado_Em" if "Coletado_Em" in df.columns else "DocNumber"
+            df = df.sort_values(sort_col).drop_duplicates("DocNumber", keep="last")
+        if "Dt_Entrega" in df.columns:
+            df = df.sort_values("Dt_Entrega", ascending=False)
+        return df.reset_index(drop=True)
+
+    def compact(self):
+        """Reescreve cada partição num arquivo só, ordenado por fundo (melhora a poda por estatística)."""
+        dataset = self.dataset()
+        if dataset is None:
+            return
+        for part_dir in sorted({p.parent for p in self.root.rglob("*.parquet")}):
+            files = sorted(part_dir.glob("*.parquet"))
+            if len(files) < 2:
+                continue
+            table = pa.concat_tables([pq.read_table(f) for f in files], promote_options="permissive")
+            df = table.to_pandas()
+            if "DocNumber" in df.columns:
+                df = df.sort_values("Coletado_Em").drop_duplicates("DocNumber", keep="last")
+            df = df.sort_values([c for c in ("Codigo_Fundo", "Dt_Entrega") if c in df.columns])
+            out = part_dir / f"part-compact-{uuid.uuid4().hex[:8]}.parquet"
+            pq.write_table(_with_stable_types(pa.Table.from_pandas(df, preserve_index=False)), out)
+            for f in files:
+                f.unlink()
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Consulta o arquivo local de documentos do FNET.")
+    parser.add_argument("--ticker", action="append", help="pode repetir")
+    parser.add_argument("--categoria")
+    parser.add_argument("--tipo")
+    parser.add_argument("--inicio", type=date.fromisoformat)
+    parser.add_argument("--fim", type=date.fromisoformat)
+    parser.add_argument("--root", default=None)
+    parser.add_argument("--csv", default=None, help="salva o resultado em CSV")
+    parser.add_argument("--compact", action="store_true", help="compacta as partições e sai")
+    args = parser.parse_args(argv)
+
+    archive = Archive(args.root)
+    if args.compact:
+        archive.compact()
+        return
+
+    df = archive.query(args.ticker, args.categoria, args.tipo, args.inicio, args.fim)
+    if args.csv:
+        df.to_csv(args.csv, index=False)
+        print(f"Salvo: {args.csv} ({len(df)} linhas)")
+        return
+    cols = [c for c in ["Dt_Entrega", "Codigo_Fundo", "Categoria", "Tipo", "DocNumber"] if c in df.columns]
+    with pd.option_context("display.max_rows", 200, "display.width", 200):
+        print(df[cols].to_string(index=False) if cols else df)
+    print(f"{len(df)} documento(s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterator
+
+import numpy as np
+import pandas as pd
+
+from texto import compile_contains, factorize_normalized
+
+
+CONFIG_PATH = "assinantes.json"
+
+
+@dataclass
+class Assinante:
+    nome: str
+    emails: list[str]
+    fundos: list[str] = field(default_factory=list)  # tickers; vazio = todos os monitorados
+    categorias: list[str] = field(default_factory=list)  # vazio = qualquer categoria
+    tipos: list[str] = field(default_factory=list)  # vazio = qualquer tipo
+    assunto: str = ""
+
+
+def parse_config(data) -> list[Assinante]:
+    """
+    {"assinantes": [{"nome": ..., "emails": [...], "fundos": ["HGLG11", ...],
+                     "categorias": [...], "tipos": [...], "assunto": ...}, ...]}
+    Levanta ValueError se a configuração for inválida.
+    """
+    items = data.get("assinantes") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        raise ValueError("esperava uma lista em 'assinantes'")
+    out = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f"assinante #{i} não é um objeto")
+        nome = str(item.get("nome") or f"assinante_{i}")
+        emails = item.get("emails") or []
+        if isinstance(emails, str):
+            emails = [emails]
+        if not emails:
+            raise ValueError(f"assinante {nome!r} sem emails")
+        out.append(Assinante(
+            nome=nome,
+            emails=[str(e) for e in emails],
+            fundos=[str(t).strip().upper() for t in item.get("fundos") or []],
+            categorias=[str(t) for t in item.get("categorias") or []],
+            tipos=[str(t) for t in item.get("tipos") or []],
+            assunto=str(item.get("assunto") or ""),
+        ))
+    nomes = [a.nome for a in out]
+    if len(set(nomes)) != len(nomes):
+        raise ValueError("nomes de assinante repetidos")
+    return out
+
+
+def _term_matrix(texto: pd.Series | None, termos: list[list[str]], n: int) -> np.ndarray:
+    """(linhas x assinantes): cada valor distinto do texto é testado uma vez por padrão distinto."""
+    out = np.ones((n, len(termos)), dtype=bool)
+    patterns = [compile_contains(tuple(t)) for t in termos]
+    if texto is None or all(p is None for p in patterns):
+        return out
+    codes, norm = factorize_normalized(texto)
+    hits: dict = {}
+    for j, pattern in enumerate(patterns):
+        if pattern is None:
+            continue
+        if pattern not in hits:
+            hits[pattern] = np.fromiter((pattern.search(u) is not None for u in norm), dtype=bool, count=len(norm))
+        out[:, j] = hits[pattern][codes]
+    return out
+
+
+class Regras:
+    """
+    Regras de todos os assinantes compiladas num matcher só: cada critério vira uma tabela
+    (valor distinto x assinante) e as linhas são roteadas por indexação, numa passada.
+    """
+
+    def __init__(self, assinantes: list[Assinante], tickers: list[str]):
+        self.assinantes = assinantes
+        self.tickers = pd.Index(sorted(set(tickers)))
+        # última linha = fundo não monitorado (get_indexer devolve -1)
+        fundos = np.zeros((len(self.tickers) + 1, len(assinantes)), dtype=bool)
+        for j, a in enumerate(assinantes):
+            if a.fundos:
+                pos = self.tickers.get_indexer(a.fundos)
+                desconhecidos = [t for t, p in zip(a.fundos, pos) if p < 0]
+                if desconhecidos:
+                    print(f"[AVISO] Assinante {a.nome}: tickers fora da lista monitorada {desconhecidos}")
+                fundos[pos[pos >= 0], j] = True
+            else:
+                fundos[:-1, j] = True
+        self.fundos = fundos
+
+    def match(self, codigo: np.ndarray, categoria: pd.Series | None, tipo: pd.Series | None) -> np.ndarray:
+        """Matriz booleana (linhas x assinantes)."""
+        n = len(codigo)
+        mask = self.fundos[self.tickers.get_indexer(codigo)]
+        mask &= _term_matrix(categoria, [a.categorias for a in self.assinantes], n)
+        mask &= _term_matrix(tipo, [a.tipos for a in self.assinantes], n)
+        return mask
+
+
+@dataclass
+class Roteamento:
+    df: pd.DataFrame  # linhas aceitas por pelo menos um assinante (coluna "Assinantes")
+    matriz: np.ndarray  # (linhas de df x assinantes)
+    assinantes: list[Assinante]
+
+    def por_assinante(self) -> Iterator[tuple[Assinante, pd.DataFrame]]:
+        for j, a in enumerate(self.assinantes):
+            rows = self.matriz[:, j]
+            if rows.any():
+                yield a, self.df.loc[rows]
+
+
+def route(
+    regras: Regras,
+    df: pd.DataFrame,
+    codigo: np.ndarray,
+    categoria: pd.Series | None,
+    tipo: pd.Series | None,
+) -> Roteamento:
+    matriz = regras.match(codigo, categoria, tipo)
+    keep = matriz.any(axis=1)
+    out = df.loc[keep].copy()
+    nomes = np.array([a.nome for a in regras.assinantes], dtype=object)
+    out["Assinantes"] = [", ".join(nomes[row]) for row in matriz[keep]]
+    return Roteamento(out, matriz[keep], regras.assinantes)
+
+
+class RuleBook:
+    """
+    Configuração dos assinantes com hot reload: a cada get() confere o mtime do arquivo
+    e recompila se mudou. Config inválida mantém as regras anteriores; sem arquivo,
+    usa default() (o assinante único com as listas do módulo).
+    """
+
+    def __init__(self, path: str | Path, default: Callable[[], list[Assinante]]):
+        self.path = Path(path)
+        self.default = default
+        self._mtime: float | None = None
+        self._assinantes: list[Assinante] | None = None
+        self._tickers: tuple[str, ...] = ()
+        self._regras: Regras | None = None
+
+    @classmethod
+    def from_env(cls, default: Callable[[], list[Assinante]]) -> RuleBook:
+        return cls(os.environ.get("FNET_ASSINANTES", CONFIG_PATH), default)
+
+    def _load(self) -> list[Assinante] | None:
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if self._assinantes is not None and mtime == self._mtime:
+            return None
+        self._mtime = mtime
+        if mtime is None:
+            return self.default()
+        try:
+            return parse_config(json.loads(self.path.read_text(encoding="utf-8")))
+        except (OSError, ValueError) as e:
+            if self._assinantes is None:
+                raise
+            print(f"[AVISO] {self.path} inválido ({e}); mantendo as regras anteriores.")
+            return None
+
+    def assinantes(self) -> list[Assinante]:
+        loaded = self._load()
+        if loaded is not None:
+            self._assinantes = loaded
+            self._regras = None
+        return self._assinantes
+
+    def get(self, tickers: list[str]) -> Regras:
+        assinantes = self.assinantes()
+        key = tuple(sorted(set(tickers)))
+        if self._regras is None or key != self._tickers:
+            self._regras = Regras(assinantes, list(key))
+            self._tickers = key
+        return self._regras
@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import argparse
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable, Iterator
+
+import pandas as pd
+
+from arquivo import Archive
+from config import STATE_DIR
+from fnet_http import FnetClient
+from navegador import DriverManager
+from retrive_fii import DRIVERS, archive_frame, concat_pages, make_driver, query_selenium
+
+
+FREQS = {"day": 1, "week": 7}
+SHARD_RETRIES = 2
+
+
+def date_shards(inicio: date, fim: date, freq: str = "week") -> list[tuple[date, date]]:
+    """Quebra [inicio, fim] em janelas fechadas de 1 (day) ou 7 (week) dias."""
+    step = timedelta(days=FREQS[freq])
+    shards = []
+    ini = inicio
+    while ini <= fim:
+        shard_fim = min(ini + step - timedelta(days=1), fim)
+        shards.append((ini, shard_fim))
+        ini = shard_fim + timedelta(days=1)
+    return shards
+
+
+class DriverPool:
+    """
+    Pool limitado de drivers reutilizáveis: cria sob demanda até `size`
+    e devolve ao pool depois de cada shard. Driver que falhou é descartado.
+    """
+
+    def __init__(self, size: int, factory: Callable | None = None):
+        # drivers independentes, sem daemon/perfil compartilhado (um perfil = um Chrome)
+        if factory is None:
+            # mesmas opções do manager global (capture_network: paginação via CDP/XhrCapture)
+            manager = DriverManager(block_css=DRIVERS.block_css, capture_network=DRIVERS.capture_network)
+            factory = lambda: make_driver(manager)  # noqa: E731
+        self.size = size
+        self.factory = factory
+        self._idle: queue.Queue = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._all: list = []
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    driver = self.factory()
+                except Exception:
+                    self._created -= 1
+                    raise
+                self._all.append(driver)
+                return driver
+        return self._idle.get()
+
+    def _discard(self, driver):
+        with self._lock:
+            self._created -= 1
+            if driver in self._all:
+                self._all.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    @contextmanager
+    def borrow(self) -> Iterator:
+        driver = self._acquire()
+        try:
+            yield driver
+        except Exception:
+            self._discard(driver)
+            raise
+        self._idle.put(driver)
+
+    def close(self):
+        with self._lock:
+            drivers, self._all = self._all, []
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+
+class Checkpoint:
+    """Um CSV por shard concluído; na retomada os shards já gravados são pulados."""
+
+    def __init__(self, directory: str | Path):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, shard: tuple[date, date]) -> Path:
+        ini, fim = shard
+        return self.dir / f"{ini:%Y%m%d}_{fim:%Y%m%d}.csv"
+
+    def done(self, shard: tuple[date, date]) -> bool:
+        return self._path(shard).exists()
+
+    def save(self, shard: tuple[date, date], df: pd.DataFrame):
+        path = self._path(shard)
+        tmp = path.with_suffix(".tmp")
+        df.to_csv(tmp, index=False)
+        tmp.replace(path)
+
+    def load(self, shard: tuple[date, date]) -> pd.DataFrame:
+        try:
+            return pd.read_csv(self._path(shard), dtype=str, keep_default_na=False)
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame()
+
+
+def default_workers() -> int:
+    # um Chrome headless por núcleo é o teto razoável
+    return max(1, os.cpu_count() or 1)
+
+
+def backfill(
+    inicio: date,
+    fim: date,
+    freq: str = "week",
+    workers: int | None = None,
+    backend: str = "selenium",
+    checkpoint_dir: str | Path | None = None,
+) -> pd.DataFrame:
+    """Backfill completo num DataFrame só (ver run_backfill)."""
+    ckpt, shards = run_backfill(inicio, fim, freq, workers, backend, checkpoint_dir)
+    return concat_pages(iter_shards(ckpt, shards))
+
+
+def run_backfill(
+    inicio: date,
+    fim: date,
+    freq: str = "week",
+    workers: int | None = None,
+    backend: str = "selenium",
+    checkpoint_dir: str | Path | None = None,
+) -> tuple[Checkpoint, list[tuple[date, date]]]:
+    """
+    Reconstrói o histórico de [inicio, fim] em shards concorrentes.
+    - backend "selenium": pool limitado de drivers reaproveitados entre shards
+    - backend "http": um FnetClient por thread
+    Cada shard concluído fica em checkpoint (rodar de novo depois de uma queda retoma de
+    onde parou); devolve o checkpoint e os shards, para leitura com iter_shards.
+    """
+    shards = date_shards(inicio, fim, freq)
+    workers = min(workers or default_workers(), len(shards)) or 1
+    ckpt = Checkpoint(checkpoint_dir or STATE_DIR / "backfill" / f"{inicio:%Y%m%d}_{fim:%Y%m%d}_{freq}")
+
+    pendentes = [s for s in shards if not ckpt.done(s)]
+    print(f"Backfill {inicio} a {fim}: {len(shards)} shards, {len(shards) - len(pendentes)} já em checkpoint, "
+          f"{workers} worker(s).")
+
+    pool = DriverPool(workers) if backend == "selenium" else None
+    local = threading.local()
+    clients: list[FnetClient] = []
+
+    def run_shard(shard: tuple[date, date]) -> pd.DataFrame:
+        ini, shard_fim = shard
+        if pool is not None:
+            with pool.borrow() as driver:
+                return query_selenium(driver, ini, shard_fim)
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = FnetClient()
+            clients.append(client)
+        return client.collect(ini, shard_fim)
+
+    def run_with_retry(shard: tuple[date, date]) -> pd.DataFrame:
+        for tentativa in range(SHARD_RETRIES + 1):
+            try:
+                df = run_shard(shard)
+                ckpt.save(shard, df)
+                return df
+            except Exception as e:
+                if tentativa == SHARD_RETRIES:
+                    raise
+                print(f"[AVISO] Shard {shard[0]}..{shard[1]} falhou ({e}); tentando de novo.")
+
+    falhas = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(run_with_retry, s): s for s in pendentes}
+            for fut in as_completed(futures):
+                shard = futures[fut]
+                try:
+                    df = fut.result()
+                    print(f"  shard {shard[0]}..{shard[1]}: {len(df)} linhas")
+                except Exception as e:
+                    falhas.append(shard)
+                    print(f"[ERRO] Shard {shard[0]}..{shard[1]} falhou: {e}")
+    finally:
+        if pool is not None:
+            pool.close()
+        for client in clients:
+            client.close()
+
+    if falhas:
+        print(f"[AVISO] {len(falhas)} shard(s) falharam; rode de novo para retomar.")
+
+    return ckpt, shards
+
+
+def iter_shards(ckpt: Checkpoint, shards: list[tuple[date, date]]) -> Iterator[pd.DataFrame]:
+    """Um shard do checkpoint por vez, sem DocNumbers repetidos entre shards."""
+    vistos: set[str] = set()
+    for shard in shards:
+        if not ckpt.done(shard):
+            continue
+        df = ckpt.load(shard)
+        if df.empty:
+            continue
+        if "DocNumber" in df.columns:
+            df = df.loc[~df["DocNumber"].isin(vistos)].drop_duplicates(subset="DocNumber")
+            vistos.update(df["DocNumber"])
+        if not df.empty:
+            yield df.reset_index(drop=True)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Backfill paralelo do FNET por faixa de datas.")
+    parser.add_argument("inicio", type=date.fromisoformat)
+    parser.add_argument("fim", type=date.fromisoformat)
+    parser.add_argument("--freq", choices=sorted(FREQS), default="week")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--backend", choices=["selenium", "http"], default="selenium")
+    parser.add_argument("--checkpoint-dir", default=None)
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--no-archive", action="store_true", help="não grava no arquivo Parquet")
+    args = parser.parse_args(argv)
+
+    ckpt, shards = run_backfill(args.inicio, args.fim, args.freq, args.workers, args.backend, args.checkpoint_dir)
+    out = args.out or f"backfill_{args.inicio:%Y%m%d}_{args.fim:%Y%m%d}.csv"
+    archive = None if args.no_archive else Archive()
+
+    # um shard por vez: memória constante, qualquer que seja o tamanho do intervalo
+    linhas = 0
+    for df in iter_shards(ckpt, shards):
+        df.to_csv(out, mode="a" if linhas else "w", header=not linhas, index=False)
+        linhas += len(df)
+        if archive is not None:
+            archive.append(archive_frame(df))
+    print(f"Salvo: {out} ({linhas} linhas)")
+
+
+if __name__ == "__main__":
+    main()
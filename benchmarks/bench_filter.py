@@ -0,0 +1,94 @@
+"""
+Benchmark do filter_df: versão antiga (normalize linha a linha via .apply,
+dois passes com cópias) vs. versão vetorizada atual.
+
+Uso: python benchmarks/bench_filter.py [n_linhas ...]
+"""
+from __future__ import annotations
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import retrive_fii as rf  # noqa: E402
+
+
+CATEGORIAS = [
+    "Fato Relevante", "Aviso aos Cotistas - Estruturado", "Relatórios",
+    "Informes Periódicos", "Assembleia", "Comunicado ao Mercado",
+]
+TIPOS = ["", "AGE", "AGO", "Relatório Gerencial", "Informe Mensal Estruturado", "Rendimentos e Amortizações"]
+
+
+def make_df(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    nomes = [nome for nome, _ in rf.NOMES_RAW] + [f"FUNDO NAO MONITORADO {i} FII" for i in range(400)]
+    return pd.DataFrame({
+        "Nome do Fundo": rng.choice(nomes, n),
+        "Categoria": rng.choice(CATEGORIAS, n),
+        "Tipo": rng.choice(TIPOS, n),
+        "Espécie": "",
+        "Data de Referência": "01/10/2026",
+        "Data de Entrega": "15/10/2026 18:30",
+        "Status": "Ativo com visualização",
+        "Versão": "1",
+        "Modalidade de Envio": "Apresentação",
+        "DocNumber": np.arange(n).astype(str),
+    })
+
+
+def legacy_filter_df(df: pd.DataFrame) -> pd.DataFrame:
+    # cópia da implementação anterior (row-wise), usada só como referência
+    df = df.rename(columns={k: v for k, v in rf.RENAME_MAP.items() if k in df.columns})
+    if "Dt_Entrega" in df.columns:
+        df["Dt_Entrega"] = pd.to_datetime(df["Dt_Entrega"], dayfirst=True, errors="coerce")
+    if "Dt_Ref" in df.columns:
+        df["Dt_Ref"] = pd.to_datetime(df["Dt_Ref"], dayfirst=True, errors="coerce")
+
+    nome_para_codigo = {rf.normalize(nome): codigo for (nome, codigo) in rf.NOMES_RAW}
+    df["nome_norm"] = df.get("Nome_Fundo", "").apply(rf.normalize)
+    filtered = df[df["nome_norm"].isin(nome_para_codigo.keys())].copy()
+    filtered["Codigo_Fundo"] = filtered["nome_norm"].map(nome_para_codigo).fillna("")
+
+    pattern_cat = rf.build_contains_pattern(rf.FRASES_CATEGORIA)
+    filtered["cat_norm"] = filtered["Categoria"].apply(rf.normalize)
+    filtered = filtered[filtered["cat_norm"].str.contains(pattern_cat, na=False)].copy()
+
+    pattern_tipo = rf.build_contains_pattern(rf.CHAVES_TIPO)
+    filtered["tipo_norm"] = filtered["Tipo"].apply(rf.normalize)
+    filtered = filtered[filtered["tipo_norm"].str.contains(pattern_tipo, na=False)].copy()
+
+    return filtered.drop(columns=["nome_norm", "cat_norm", "tipo_norm"])
+
+
+def timeit(fn, df: pd.DataFrame, repeat: int = 3) -> tuple[float, pd.DataFrame]:
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(df)
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main(sizes: list[int]):
+    print(f"{'linhas':>10} {'antigo (s)':>12} {'novo (s)':>10} {'ganho':>8}")
+    for n in sizes:
+        df = make_df(n)
+        t_old, old = timeit(legacy_filter_df, df, repeat=1 if n >= 1_000_000 else 3)
+        t_new, new = timeit(rf.filter_df, df)
+        pd.testing.assert_frame_equal(
+            old.reset_index(drop=True),
+            new.drop(columns=["Score_Fundo"]).reset_index(drop=True),
+            check_dtype=False,
+        )
+        print(f"{n:>10} {t_old:>12.3f} {t_new:>10.3f} {t_old / t_new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [100_000, 1_000_000])
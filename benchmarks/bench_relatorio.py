@@ -0,0 +1,94 @@
+"""
+Benchmark da exportação do relatório (formato longo Data/Série/Valor, como o melt do espanhola):
+openpyxl via pandas (versão antiga do exportar_excel) vs. XLSX em streaming (xlsxwriter
+constant_memory) vs. Parquet vs. csv.gz. Mede tempo, tamanho e pico de memória da escrita
+(alocações Python/numpy pelo tracemalloc + as do Arrow num pool próprio; o DataFrame de
+entrada não conta). O pico é medido numa segunda escrita: o tracemalloc deixa tudo mais lento.
+
+Uso: python benchmarks/bench_relatorio.py [n_linhas ...]   (padrão: 10k 100k 1M)
+     --sem-openpyxl pula a versão antiga (lenta a partir de ~500k linhas)
+     --sem-memoria  só o tempo (sem a segunda escrita)
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from relatorio import write_csv_gz, write_parquet, write_xlsx  # noqa: E402
+
+
+def make_long(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    n_tickers = max(1, n // 2500)
+    dias = pd.bdate_range("2000-01-03", periods=-(-n // n_tickers))
+    datas = np.tile(dias.date, n_tickers)[:n]
+    series = np.repeat([f"T{i:04d}.MC" for i in range(n_tickers)], len(dias))[:n]
+    return pd.DataFrame({"Data": datas, "Série": series, "Valor": rng.lognormal(3, 0.5, n)})
+
+
+def openpyxl_xlsx(df: pd.DataFrame, path: Path):
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        df.to_excel(writer, index=False, sheet_name="melt")
+
+
+def timed(fn, df: pd.DataFrame, path: Path) -> tuple[float, int]:
+    t0 = time.perf_counter()
+    fn(df, path)
+    return time.perf_counter() - t0, path.stat().st_size
+
+
+def peak_memory(fn, df: pd.DataFrame, path: Path) -> int:
+    """Pico de memória (bytes) alocado durante uma escrita."""
+    anterior = pa.default_memory_pool()
+    pool = pa.proxy_memory_pool(anterior)
+    pa.set_memory_pool(pool)
+    tracemalloc.start()
+    try:
+        fn(df, path)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        pa.set_memory_pool(anterior)
+    return pico + pool.max_memory()
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sizes", nargs="*", type=int, default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--sem-openpyxl", action="store_true")
+    parser.add_argument("--sem-memoria", action="store_true")
+    args = parser.parse_args(argv)
+
+    writers = {
+        "openpyxl": openpyxl_xlsx,
+        "xlsx_stream": lambda df, p: write_xlsx(p, {"melt": df}),
+        "parquet": write_parquet,
+        "csv.gz": write_csv_gz,
+    }
+    if args.sem_openpyxl:
+        writers.pop("openpyxl")
+    suffix = {"openpyxl": ".xlsx", "xlsx_stream": ".xlsx", "parquet": ".parquet", "csv.gz": ".csv.gz"}
+
+    print(f"{'linhas':>10} {'formato':>12} {'tempo (s)':>10} {'linhas/s':>12} {'MB':>8} {'pico MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            df = make_long(n)
+            for nome, fn in writers.items():
+                path = Path(tmp) / f"{nome}_{n}{suffix[nome]}"
+                secs, size = timed(fn, df, path)
+                pico = "-" if args.sem_memoria else f"{peak_memory(fn, df, path) / 1e6:.1f}"
+                print(f"{n:>10,} {nome:>12} {secs:>10.2f} {n / secs:>12,.0f} {size / 1e6:>8.1f} {pico:>8}")
+
+
+if __name__ == "__main__":
+    main()
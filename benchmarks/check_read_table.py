@@ -0,0 +1,29 @@
+"""
+Leitura das fixtures de tabela (benchmarks/fixtures/*.html) para o run.py.
+A equivalência dos modos do read_table (bs4/lxml e, com Chrome, js) é testada em
+tests/test_read_table.py.
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import retrive_fii as rf  # noqa: E402
+
+
+def table_html(path: Path) -> str:
+    soup = BeautifulSoup(path.read_text(encoding="utf-8"), "html.parser")
+    return str(soup.find(id="tblDocumentosEnviados"))
+
+
+def check_offline(path: Path) -> pd.DataFrame:
+    html = table_html(path)
+    ref = rf.table_data_to_df(rf.parse_table_html(html))
+    fast = rf.table_data_to_df(rf.parse_table_html_lxml(html))
+    pd.testing.assert_frame_equal(ref, fast)
+    return ref
@@ -0,0 +1,163 @@
+"""
+Servidor HTTP local que reproduz as respostas gravadas do FNET (benchmarks/fixtures).
+- /fnet/publico/abrirGerenciadorDocumentosCVM        -> página HTML gravada (+ <select> de categorias)
+- /fnet/publico/pesquisarGerenciadorDocumentosDados  -> JSON paginado (s/l), com os
+  registros gravados replicados até `n_records` (ids únicos, mais novo primeiro);
+  respeita idCategoriaDocumento/idTipoDocumento
+- /fnet/publico/listarTodosTiposPorCategoriaETipoFundo?idCategoria=... -> tipos da categoria
+- /fnet/publico/downloadDocumento?id=...              -> documento HTML sintético
+
+Uso: python benchmarks/replay_server.py [--port 8765] [--records 5000]
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+PREFIX = "/fnet/publico"
+
+
+def load_records(n_records: int) -> list[dict]:
+    payload = json.loads((FIXTURES / "pesquisarGerenciadorDocumentosDados_p1.json").read_text(encoding="utf-8"))
+    base = payload["data"]
+    top = max(r["id"] for r in base)
+    records = []
+    for i in range(n_records):
+        rec = copy.copy(base[i % len(base)])
+        rec["id"] = top + n_records - i
+        records.append(rec)
+    return records
+
+
+def build_catalogo(records: list[dict]) -> tuple[dict[str, int], dict[tuple[str, str], int]]:
+    """IDs sintéticos (estáveis) para as categorias e os tipos presentes nos registros."""
+    categorias = sorted({r["categoriaDocumento"] for r in records})
+    tipos = sorted({(r["categoriaDocumento"], r["tipoDocumento"]) for r in records if r["tipoDocumento"]})
+    return (
+        {nome: i for i, nome in enumerate(categorias, start=1)},
+        {par: i for i, par in enumerate(tipos, start=1)},
+    )
+
+
+def categorias_select(categorias: dict[str, int]) -> bytes:
+    options = ['<option value="0">Todos</option>']
+    options += [f'<option value="{i}">{nome}</option>' for nome, i in categorias.items()]
+    return f'<select id="categoriaDocumento">{"".join(options)}</select>'.encode("utf-8")
+
+
+class ReplayServer:
+    """Sobe o servidor numa thread; use como context manager e leia .base_url."""
+
+    def __init__(self, n_records: int = 1000, port: int = 0, latency_s: float = 0.0):
+        self.records = load_records(n_records)
+        self.categorias, self.tipos = build_catalogo(self.records)
+        page = (FIXTURES / "tblDocumentosEnviados_p1.html").read_bytes()
+        self.page_html = page.replace(b"<body>", b"<body>" + categorias_select(self.categorias), 1)
+        self._filtrados: dict[tuple[int, int], list[dict]] = {}
+        self.latency_s = latency_s
+        self.requests = 0
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_port}{PREFIX}"
+
+    def __enter__(self) -> ReplayServer:
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def filtrados(self, id_categoria: int, id_tipo: int) -> list[dict]:
+        key = (id_categoria, id_tipo)
+        if key not in self._filtrados:
+            self._filtrados[key] = [
+                r for r in self.records
+                if (not id_categoria or self.categorias[r["categoriaDocumento"]] == id_categoria)
+                and (not id_tipo or self.tipos.get((r["categoriaDocumento"], r["tipoDocumento"])) == id_tipo)
+            ]
+        return self._filtrados[key]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # cabeçalho e corpo saem em writes separados: com Nagle + delayed ACK, respostas
+            # pequenas (sondagens, tipos) levariam ~40 ms cada
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, code: int, body: bytes, ctype: str):
+                self.send_response(code)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                server.requests += 1
+                if server.latency_s:
+                    threading.Event().wait(server.latency_s)
+                url = urlparse(self.path)
+                q = {k: v[0] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+                path = url.path.removeprefix(PREFIX)
+
+                if path == "/abrirGerenciadorDocumentosCVM":
+                    self._send(200, server.page_html, "text/html; charset=utf-8")
+                elif path == "/pesquisarGerenciadorDocumentosDados":
+                    start, length = int(q.get("s", 0)), int(q.get("l", 10))
+                    records = server.filtrados(int(q.get("idCategoriaDocumento") or 0), int(q.get("idTipoDocumento") or 0))
+                    body = json.dumps({
+                        "draw": int(q.get("d", 1)),
+                        "recordsTotal": len(server.records),
+                        "recordsFiltered": len(records),
+                        "data": records[start:start + length],
+                    }, ensure_ascii=False).encode("utf-8")
+                    self._send(200, body, "application/json; charset=utf-8")
+                elif path == "/listarTodosTiposPorCategoriaETipoFundo":
+                    id_cat = int(q.get("idCategoria") or 0)
+                    tipos = [
+                        {"id": i, "descricao": tipo}
+                        for (cat, tipo), i in server.tipos.items()
+                        if server.categorias[cat] == id_cat
+                    ]
+                    self._send(200, json.dumps(tipos, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8")
+                elif path == "/downloadDocumento":
+                    doc = q.get("id", "")
+                    body = f"<html><body><p>Documento {doc}</p></body></html>".encode()
+                    self._send(200, body, "text/html; charset=utf-8")
+                else:
+                    self._send(404, b"not found", "text/plain")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--records", type=int, default=5000)
+    args = parser.parse_args()
+
+    with ReplayServer(args.records, args.port) as srv:
+        print(f"Replay em {srv.base_url} ({args.records} registros). Ctrl+C para sair.")
+        try:
+            srv.thread.join()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
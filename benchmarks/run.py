@@ -0,0 +1,273 @@
+"""
+Suíte de benchmark/regressão sobre as fixtures gravadas do FNET.
+
+Checagens de correção (sempre rodam):
+- read_table: bs4 == lxml nas páginas HTML gravadas
+- backend HTTP: JSON gravado == HTML gravado (mesmo schema/valores)
+- coleta ponta a ponta via replay server devolve todos os registros, sem duplicata
+- pushdown (planejador): as consultas filtradas devolvem o mesmo que coleta completa + filtro
+- roteamento (assinantes): o assinante padrão recebe exatamente as linhas de filter_df
+
+Benchmarks (linhas/s): parse (bs4, lxml), filter_df, roteamento para N assinantes e
+coleta HTTP ponta a ponta (completa e com pushdown), em alguns tamanhos. Os resultados são comparados com benchmarks/baseline.json;
+queda acima da tolerância conta como regressão (exit code 1).
+
+Uso:
+  python benchmarks/run.py                 # roda e compara com o baseline
+  python benchmarks/run.py --save-baseline # grava os números atuais no baseline (junta com os
+                                           # que já estão lá: --quick acrescenta os tamanhos menores)
+  python benchmarks/run.py --quick         # tamanhos menores
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import random
+import re
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+sys.path.insert(0, str(HERE))
+
+import retrive_fii as rf  # noqa: E402
+from assinantes import Assinante, RuleBook  # noqa: E402
+from bench_filter import CATEGORIAS, TIPOS, make_df  # noqa: E402
+from check_read_table import check_offline, table_html  # noqa: E402
+from fnet_http import FnetClient, records_to_df  # noqa: E402
+from planejador import Planejador  # noqa: E402
+from replay_server import FIXTURES, ReplayServer  # noqa: E402
+
+
+BASELINE = HERE / "baseline.json"
+TOLERANCE = 0.25
+
+# regras de teste do pushdown (as de produção não casam com nenhum registro das fixtures);
+# aceitam 2 dos 6 modelos de registro
+PUSHDOWN_CATEGORIAS = ["Relatórios", "Assembleia"]
+PUSHDOWN_TIPOS = ["AGE", "Relatório Gerencial"]
+# categoria cujo endpoint de tipos volta vazio: tipos desconhecidos, consulta só pela categoria
+SEM_TIPOS = "Fato Relevante"
+N_ASSINANTES = 48
+
+SIZES = {
+    "parse": [100, 1000],
+    "filter": [10_000, 100_000, 1_000_000],
+    "collect": [1_000, 10_000, 50_000],
+}
+QUICK_SIZES = {
+    "parse": [100],
+    "filter": [10_000, 100_000],
+    "collect": [1_000, 5_000],
+}
+
+
+def best_of(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+# --- correção -----------------------------------------------------------------
+
+def run_checks():
+    for path in sorted(FIXTURES.glob("*.html")):
+        html_df = check_offline(path)
+        json_path = FIXTURES / path.name.replace("tblDocumentosEnviados", "pesquisarGerenciadorDocumentosDados")
+        json_path = json_path.with_suffix(".json")
+        if json_path.exists():
+            records = json.loads(json_path.read_text(encoding="utf-8"))["data"]
+            pd.testing.assert_frame_equal(html_df, records_to_df(records))
+    print("ok  fixtures: bs4 == lxml == JSON")
+
+    with ReplayServer(n_records=1234) as srv:
+        df = FnetClient(base_url=srv.base_url, page_size=200).collect(date.today())
+    assert len(df) == 1234 and df["DocNumber"].is_unique, (len(df), df["DocNumber"].is_unique)
+    print("ok  coleta via replay server (1234 registros, sem duplicata)")
+
+    cat = rf.compile_contains(tuple(PUSHDOWN_CATEGORIAS))
+    tipo = rf.compile_contains(tuple(PUSHDOWN_TIPOS))
+
+    def aceitos(df: pd.DataFrame) -> set:
+        return set(df.loc[rf.contains_mask(df["Categoria"], cat) & rf.contains_mask(df["Tipo"], tipo), "DocNumber"])
+
+    for n in (1234, 5000):
+        with ReplayServer(n_records=n) as srv:
+            full = FnetClient(base_url=srv.base_url).collect(date.today())
+            requests_full = srv.requests
+            planner = Planejador(base_url=srv.base_url)
+            planner.consultas(PUSHDOWN_CATEGORIAS, PUSHDOWN_TIPOS)  # catálogo (em cache por 7 dias)
+            requests_catalogo = srv.requests - requests_full
+            pushed = planner.collect(date.today(), categorias=PUSHDOWN_CATEGORIAS, tipos=PUSHDOWN_TIPOS)
+            requests_pushed = srv.requests - requests_full - requests_catalogo
+        assert set(pushed["DocNumber"]) == aceitos(full), (len(pushed), n)
+        assert pushed["DocNumber"].is_unique
+        assert requests_pushed <= requests_full, (requests_pushed, requests_full)
+        print(f"ok  pushdown: {len(pushed)} de {len(full)} registros, {requests_pushed} requisições "
+              f"(coleta completa: {requests_full}; catálogo: {requests_catalogo})")
+
+    # dia pequeno (uma página): o plano não compensa, vira a coleta completa sem requisição extra
+    with ReplayServer(n_records=150) as srv:
+        planner = Planejador(base_url=srv.base_url)
+        planner.consultas(PUSHDOWN_CATEGORIAS, PUSHDOWN_TIPOS)
+        antes = srv.requests
+        pushed = planner.collect(date.today(), categorias=PUSHDOWN_CATEGORIAS, tipos=PUSHDOWN_TIPOS)
+        assert len(pushed) == 150 and srv.requests - antes == 2, (len(pushed), srv.requests - antes)
+    print("ok  pushdown: plano mais caro que a coleta completa -> coleta completa (2 requisições)")
+
+    consultas = planner.consultas([*PUSHDOWN_CATEGORIAS, SEM_TIPOS], PUSHDOWN_TIPOS)
+    id_sem_tipos = next(i for i, nome in planner.catalogo.categorias.items() if nome == SEM_TIPOS)
+    assert any(c.id_categoria == id_sem_tipos and c.id_tipo == 0 for c in consultas), consultas
+    print(f"ok  pushdown: categoria sem tipos no catálogo ({SEM_TIPOS}) consultada inteira")
+
+    df = make_df(20_000)
+    rules, rf.RULES = rf.RULES, RuleBook(HERE / "nao_existe.json", rf.default_assinantes)
+    try:
+        roteado = rf.route_df(df).df
+    finally:
+        rf.RULES = rules
+    filtrado = rf.filter_df(df)
+    assert roteado["DocNumber"].tolist() == filtrado["DocNumber"].tolist(), (len(roteado), len(filtrado))
+    print(f"ok  roteamento do assinante padrão == filter_df ({len(filtrado)} linhas)")
+
+
+# --- benchmarks -----------------------------------------------------------------
+
+def scaled_table_html(n_rows: int) -> str:
+    html = table_html(FIXTURES / "tblDocumentosEnviados_p1.html")
+    body = re.search(r"<tbody>(.*)</tbody>", html, re.S).group(1)
+    rows = re.findall(r"<tr.*?</tr>", body, re.S)
+    new_body = "".join(rows[i % len(rows)] for i in range(n_rows))
+    return html.replace(body, new_body)
+
+
+def bench_parse(sizes: list[int]) -> dict[str, float]:
+    out = {}
+    for n in sizes:
+        html = scaled_table_html(n)
+        for name, fn in (("bs4", rf.parse_table_html), ("lxml", rf.parse_table_html_lxml)):
+            t = best_of(lambda: rf.table_data_to_df(fn(html)))
+            out[f"parse_{name}_{n}"] = n / t
+    return out
+
+
+def bench_filter(sizes: list[int]) -> dict[str, float]:
+    out = {}
+    rf.fund_index()  # monta o índice fora da medição
+    for n in sizes:
+        df = make_df(n)
+        t = best_of(lambda: rf.filter_df(df), repeat=1 if n >= 1_000_000 else 3)
+        out[f"filter_{n}"] = n / t
+    return out
+
+
+def synthetic_assinantes(n: int, seed: int = 0) -> list[Assinante]:
+    rng = random.Random(seed)
+    tickers = sorted({t for _, t in rf.NOMES_RAW})
+    return [
+        Assinante(
+            nome=f"mesa{i}",
+            emails=[f"mesa{i}@example.com"],
+            fundos=rng.sample(tickers, 10),
+            categorias=rng.sample(CATEGORIAS, 2),
+            tipos=rng.sample([t for t in TIPOS if t], rng.randint(0, 2)),
+        )
+        for i in range(n)
+    ]
+
+
+def bench_route(sizes: list[int]) -> dict[str, float]:
+    out = {}
+    assinantes = synthetic_assinantes(N_ASSINANTES)
+    rules, rf.RULES = rf.RULES, RuleBook(HERE / "nao_existe.json", lambda: assinantes)
+    try:
+        for n in sizes:
+            df = make_df(n)
+            t = best_of(lambda: rf.route_df(df), repeat=1 if n >= 1_000_000 else 3)
+            out[f"route_{N_ASSINANTES}_{n}"] = n / t
+    finally:
+        rf.RULES = rules
+    return out
+
+
+def bench_collect(sizes: list[int]) -> dict[str, float]:
+    out = {}
+    for n in sizes:
+        with ReplayServer(n_records=n) as srv:
+            def run():
+                with FnetClient(base_url=srv.base_url) as client:
+                    client.collect(date.today())
+            t = best_of(run)
+        out[f"collect_http_{n}"] = n / t
+
+        # linhas/s sobre o total do dia: o pushdown só transfere o que as regras aceitam
+        with ReplayServer(n_records=n) as srv:
+            planner = Planejador(base_url=srv.base_url)
+            planner.consultas(PUSHDOWN_CATEGORIAS, PUSHDOWN_TIPOS)  # catálogo fora da medição
+            t = best_of(lambda: planner.collect(date.today(), categorias=PUSHDOWN_CATEGORIAS, tipos=PUSHDOWN_TIPOS))
+        out[f"collect_pushdown_{n}"] = n / t
+    return out
+
+
+def compare(results: dict[str, float], baseline: dict[str, float], tolerance: float) -> list[str]:
+    regressions = []
+    print(f"\n{'benchmark':<28} {'linhas/s':>14} {'baseline':>14} {'delta':>8}")
+    for key, value in results.items():
+        base = baseline.get(key)
+        if base:
+            delta = value / base - 1
+            flag = "  <-- regressão" if delta < -tolerance else ""
+            print(f"{key:<28} {value:>14,.0f} {base:>14,.0f} {delta:>+7.0%}{flag}")
+            if flag:
+                regressions.append(key)
+        else:
+            print(f"{key:<28} {value:>14,.0f} {'-':>14} {'':>8}")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    run_checks()
+
+    sizes = QUICK_SIZES if args.quick else SIZES
+    results: dict[str, float] = {}
+    results.update(bench_parse(sizes["parse"]))
+    results.update(bench_filter(sizes["filter"]))
+    results.update(bench_route(sizes["filter"]))
+    results.update(bench_collect(sizes["collect"]))
+
+    saved = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    regressions = compare(results, saved.get("results", {}), args.tolerance)
+
+    if args.save_baseline:
+        BASELINE.write_text(json.dumps({
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "results": {**saved.get("results", {}), **{k: round(v, 1) for k, v in results.items()}},
+        }, indent=2) + "\n")
+        print(f"\nBaseline gravado em {BASELINE}")
+        return 0
+
+    if regressions:
+        print(f"\n{len(regressions)} regressão(ões) acima de {args.tolerance:.0%}.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
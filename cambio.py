@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+
+MOEDA_BASE = "BRL"
+MAX_DEFASAGEM = timedelta(days=5)  # cotação/câmbio mais velho que isso vira NaN
+
+# moeda de cotação pelo sufixo do Yahoo; sem sufixo = bolsa americana
+SUFIXOS = {
+    ".MC": "EUR", ".DE": "EUR", ".F": "EUR", ".PA": "EUR", ".AS": "EUR", ".MI": "EUR",
+    ".BR": "EUR", ".LS": "EUR", ".VI": "EUR", ".HE": "EUR", ".IR": "EUR",
+    ".L": "GBp", ".SW": "CHF", ".TO": "CAD", ".AX": "AUD", ".T": "JPY", ".HK": "HKD",
+    ".SA": "BRL",
+}
+# moedas cotadas em fração da moeda do câmbio (Londres cota em pence)
+SUBUNIDADES = {"GBp": ("GBP", 0.01), "GBX": ("GBP", 0.01), "ZAc": ("ZAR", 0.01), "ILA": ("ILS", 0.01)}
+
+
+def moeda_de(ticker: str, moedas: dict[str, str] | None = None) -> str:
+    """Moeda do ticker: mapa explícito, senão sufixo da bolsa, senão USD."""
+    if moedas and ticker in moedas:
+        return moedas[ticker]
+    _, dot, suffix = ticker.rpartition(".")
+    if dot and f".{suffix}" in SUFIXOS:
+        return SUFIXOS[f".{suffix}"]
+    return "USD"
+
+
+def par_fx(moeda: str, base: str = MOEDA_BASE) -> str | None:
+    """Ticker do câmbio moeda->base no Yahoo (EURBRL=X); None se já está na base."""
+    moeda = SUBUNIDADES.get(moeda, (moeda, 1.0))[0]
+    return None if moeda == base else f"{moeda}{base}=X"
+
+
+def pares(tickers: list[str], moedas: dict[str, str] | None = None, base: str = MOEDA_BASE) -> list[str]:
+    """Pares de câmbio necessários, cada um uma vez só."""
+    return sorted({p for t in tickers if (p := par_fx(moeda_de(t, moedas), base))})
+
+
+def _long(df: pd.DataFrame, valor: str) -> pd.DataFrame:
+    """Largo (Data x ticker) -> longo (Data, Ticker, valor), sem NaN."""
+    out = df.rename_axis("Data").reset_index().melt(id_vars="Data", var_name="Ticker", value_name=valor)
+    return out.dropna(subset=[valor])
+
+
+def converter(
+    precos: pd.DataFrame,
+    cambios: pd.DataFrame,
+    moedas: dict[str, str] | None = None,
+    base: str = MOEDA_BASE,
+    max_defasagem: timedelta = MAX_DEFASAGEM,
+    calendario: pd.DatetimeIndex | None = None,
+) -> pd.DataFrame:
+    """
+    Converte preços para a moeda base com junções as-of vetorizadas (uma para todos os tickers).
+    - precos: longo (Ticker, Data, Close); cambios: longo (Ticker = par, Data, Close)
+    - calendario: datas de saída; cada ticker pega o último preço até a data (no máximo
+      max_defasagem atrás). Sem calendario, usa as datas de pregão de cada ticker
+    - o câmbio é o último fechamento do par até a Data de saída (não a Data_Preco: um preço
+      repetido num feriado da bolsa vale o câmbio do dia), também limitado a max_defasagem
+    Devolve longo: Ticker, Data, Moeda, Close, Data_Preco, Cambio, Data_Cambio, Close_<base>.
+    """
+    tol = pd.Timedelta(max_defasagem)
+    precos = precos[["Ticker", "Data", "Close"]].dropna(subset=["Close"])
+    # chaves com tipo explícito: vazias, viram float64 e o merge_asof recusa o "by"
+    precos = precos.assign(
+        Ticker=precos["Ticker"].astype("str"),
+        Data=precos["Data"].astype("datetime64[us]"),
+        Data_Preco=precos["Data"].astype("datetime64[us]"),
+    )
+
+    if calendario is not None:
+        tickers = precos["Ticker"].unique()
+        datas = pd.DatetimeIndex(calendario).astype("datetime64[us]").unique().sort_values()
+        grade = pd.DataFrame({
+            "Data": np.tile(datas.values, len(tickers)),
+            "Ticker": pd.array(np.repeat(np.asarray(tickers, dtype=object), len(datas)), dtype="str"),
+        })
+        precos = pd.merge_asof(
+            grade.sort_values("Data", kind="stable"), precos.sort_values("Data"),
+            on="Data", by="Ticker", tolerance=tol, direction="backward",
+        )
+
+    moeda = {t: moeda_de(t, moedas) for t in precos["Ticker"].unique()}
+    precos["Moeda"] = precos["Ticker"].map(moeda)
+    fator = {m: SUBUNIDADES.get(m, (m, 1.0))[1] for m in set(moeda.values())}
+    precos["Par"] = precos["Moeda"].map({m: par_fx(m, base) or "" for m in fator}).astype("str")
+
+    fx = cambios[["Ticker", "Data", "Close"]].dropna(subset=["Close"])
+    fx = fx.rename(columns={"Ticker": "Par", "Close": "Cambio"}).astype({"Par": "str", "Data": "datetime64[us]"})
+    fx["Data_Cambio"] = fx["Data"]
+    out = pd.merge_asof(
+        precos.sort_values("Data", kind="stable"), fx.sort_values("Data"),
+        on="Data", by="Par", tolerance=tol, direction="backward",
+    )
+    na_base = out["Par"] == ""
+    out.loc[na_base, "Cambio"] = 1.0
+    out.loc[na_base, "Data_Cambio"] = out.loc[na_base, "Data"]
+    out[f"Close_{base}"] = out["Close"] * out["Moeda"].map(fator) * out["Cambio"]
+    cols = ["Ticker", "Data", "Moeda", "Close", "Data_Preco", "Cambio", "Data_Cambio", f"Close_{base}"]
+    return out[cols].sort_values(["Ticker", "Data"], ignore_index=True)
+
+
+def converter_largo(
+    close: pd.DataFrame,
+    tickers: list[str],
+    moedas: dict[str, str] | None = None,
+    base: str = MOEDA_BASE,
+    max_defasagem: timedelta = MAX_DEFASAGEM,
+) -> pd.DataFrame:
+    """
+    close: largo (Data x tickers e pares de câmbio), como o PriceStore.load devolve.
+    Saída larga (Data x tickers) na moeda base, no calendário da união dos pregões dos ativos.
+    Sem nenhum ativo (todos falharam, ou close vazio): frame vazio, índice Data.
+    """
+    ativos = [t for t in tickers if t in close.columns]
+    if not ativos:
+        return pd.DataFrame(index=pd.DatetimeIndex([], dtype="datetime64[us]", name="Data"), dtype="float64")
+    fx_cols = [p for p in pares(ativos, moedas, base) if p in close.columns]
+    sem_fx = [t for t in ativos if (p := par_fx(moeda_de(t, moedas), base)) and p not in fx_cols]
+    if sem_fx:
+        print(f"[AVISO] Sem câmbio para {sem_fx}; ficam sem valor em {base}.")
+    precos = _long(close[ativos], "Close")
+    calendario = pd.DatetimeIndex(precos["Data"].unique())
+    out = converter(precos, _long(close[fx_cols], "Close"), moedas, base, max_defasagem, calendario)
+    wide = out.pivot(index="Data", columns="Ticker", values=f"Close_{base}")
+    wide = wide.reindex(columns=ativos)
+    wide.columns.name = None
+    return wide
@@ -0,0 +1,14 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+
+# diretório de estado local (sqlite, caches, checkpoints); sobrescrevível por env
+STATE_DIR = Path(os.environ.get("SEIKO_STATE_DIR", ".seiko"))
+
+
+def state_path(*parts: str) -> Path:
+    path = STATE_DIR.joinpath(*parts)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
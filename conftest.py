@@ -0,0 +1 @@
+# raiz no sys.path: os testes importam os módulos do projeto direto (layout plano)
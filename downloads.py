@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import io
+import random
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+
+import aiohttp
+import pandas as pd
+
+from config import STATE_DIR
+from fnet_http import BASE_URL
+
+
+CONCURRENCY = 8
+RETRIES = 3
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class DocumentCache:
+    """
+    Cache de documentos endereçado por conteúdo:
+    - blobs/ab/abcdef... (sha256 do conteúdo); documentos iguais ocupam um arquivo só
+    - índice SQLite DocNumber -> sha256, com último acesso para a evicção (LRU por tamanho)
+    """
+
+    def __init__(self, root: str | Path | None = None, max_bytes: int = MAX_CACHE_BYTES):
+        self.root = Path(root) if root else STATE_DIR / "documentos"
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(self.root / "index.sqlite3")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " doc_number TEXT PRIMARY KEY,"
+            " sha256 TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " content_type TEXT,"
+            " last_access REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self) -> DocumentCache:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def blob_path(self, sha: str) -> Path:
+        return self.root / "blobs" / sha[:2] / sha
+
+    def get(self, doc) -> Path | None:
+        row = self.conn.execute("SELECT sha256 FROM docs WHERE doc_number = ?", (str(doc),)).fetchone()
+        if row is None:
+            return None
+        path = self.blob_path(row[0])
+        if not path.exists():
+            self.conn.execute("DELETE FROM docs WHERE doc_number = ?", (str(doc),))
+            self.conn.commit()
+            return None
+        self.conn.execute("UPDATE docs SET last_access = ? WHERE doc_number = ?", (time.time(), str(doc)))
+        self.conn.commit()
+        return path
+
+    def put(self, doc, content: bytes, content_type: str | None = None) -> Path:
+        sha = hashlib.sha256(content).hexdigest()
+        path = self.blob_path(sha)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_bytes(content)
+            tmp.replace(path)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO docs (doc_number, sha256, size, content_type, last_access) VALUES (?, ?, ?, ?, ?)",
+            (str(doc), sha, len(content), content_type, time.time()),
+        )
+        self.conn.commit()
+        return path
+
+    def total_bytes(self) -> int:
+        # cada blob conta uma vez, mesmo que vários DocNumbers apontem para ele
+        row = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT sha256, MAX(size) AS size FROM docs GROUP BY sha256)"
+        ).fetchone()
+        return int(row[0])
+
+    def evict(self, keep: Iterable[str] = ()) -> int:
+        """
+        Remove os blobs acessados há mais tempo até caber em max_bytes (exceto os de `keep`).
+        Devolve quantos removeu.
+        """
+        keep = set(keep)
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return 0
+        rows = self.conn.execute(
+            "SELECT sha256, MAX(size), MAX(last_access) AS acc FROM docs GROUP BY sha256 ORDER BY acc"
+        ).fetchall()
+        removed = 0
+        for sha, size, _ in rows:
+            if total <= self.max_bytes:
+                break
+            if sha in keep:
+                continue
+            self.blob_path(sha).unlink(missing_ok=True)
+            self.conn.execute("DELETE FROM docs WHERE sha256 = ?", (sha,))
+            total -= size
+            removed += 1
+        self.conn.commit()
+        return removed
+
+
+@dataclass
+class DownloadResult:
+    doc: str
+    path: Path | None
+    status: str  # "cache", "ok" ou "erro: ..."
+    content_type: str | None = None
+
+
+def decode_body(body: bytes) -> bytes:
+    # o FNET às vezes devolve o PDF em base64
+    if body.startswith(b"JVBERi0"):
+        try:
+            return base64.b64decode(body, validate=False)
+        except ValueError:
+            return body
+    return body
+
+
+async def _fetch_one(
+    session: aiohttp.ClientSession,
+    sem: asyncio.Semaphore,
+    url: str,
+    retries: int,
+) -> tuple[bytes, str | None]:
+    for tentativa in range(retries + 1):
+        try:
+            async with sem:
+                async with session.get(url) as resp:
+                    if resp.status in _RETRY_STATUS:
+                        raise aiohttp.ClientResponseError(
+                            resp.request_info, resp.history, status=resp.status, message=resp.reason or ""
+                        )
+                    resp.raise_for_status()
+                    return await resp.read(), resp.headers.get("Content-Type")
+        except aiohttp.ClientResponseError as e:
+            if e.status not in _RETRY_STATUS or tentativa == retries:
+                raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if tentativa == retries:
+                raise
+        # backoff exponencial com jitter, fora do semáforo
+        await asyncio.sleep(min(30.0, 0.5 * 2 ** tentativa) * (0.5 + random.random()))
+    raise RuntimeError("inalcançável")
+
+
+async def download_documents(
+    docs: Iterable,
+    cache: DocumentCache | None = None,
+    base_url: str = BASE_URL,
+    concurrency: int = CONCURRENCY,
+    retries: int = RETRIES,
+    timeout: float = 60,
+) -> list[DownloadResult]:
+    """
+    Baixa os documentos (downloadDocumento?id=...) com concorrência limitada,
+    conexões keep-alive e retry com backoff. O que já está no cache não é baixado de novo.
+    """
+    if cache is None:
+        with DocumentCache() as cache:
+            return await download_documents(docs, cache, base_url, concurrency, retries, timeout)
+    base_url = base_url.rstrip("/")
+    docs = list(dict.fromkeys(str(d) for d in docs if d is not None and str(d).strip()))
+
+    results: list[DownloadResult] = []
+    pendentes = []
+    for doc in docs:
+        path = cache.get(doc)
+        if path is not None:
+            results.append(DownloadResult(doc, path, "cache"))
+        else:
+            pendentes.append(doc)
+
+    if pendentes:
+        sem = asyncio.Semaphore(concurrency)
+        connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=30)
+        async with aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+            headers={"User-Agent": "Mozilla/5.0"},
+        ) as session:
+
+            async def run(doc: str) -> DownloadResult:
+                try:
+                    body, ctype = await _fetch_one(session, sem, f"{base_url}/downloadDocumento?id={doc}", retries)
+                except Exception as e:
+                    return DownloadResult(doc, None, f"erro: {e}")
+                return DownloadResult(doc, cache.put(doc, decode_body(body), ctype), "ok", ctype)
+
+            results.extend(await asyncio.gather(*(run(d) for d in pendentes)))
+
+    cache.evict(keep={r.path.name for r in results if r.path is not None})
+    return results
+
+
+def extract_text(path: Path) -> str:
+    """Texto do documento: PDF via pypdf (se instalado), HTML via bs4."""
+    data = path.read_bytes()
+    if data[:4] == b"%PDF":
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            return ""
+        try:
+            reader = PdfReader(io.BytesIO(data))
+            return "\n".join(page.extract_text() or "" for page in reader.pages)
+        except Exception:
+            return ""
+
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(data, "html.parser").get_text(" ", strip=True)
+
+
+def texts_frame(results: list[DownloadResult]) -> pd.DataFrame:
+    rows = []
+    for r in results:
+        if r.path is None:
+            continue
+        rows.append({"DocNumber": r.doc, "sha256": r.path.name, "Texto": extract_text(r.path)})
+    return pd.DataFrame(rows, columns=["DocNumber", "sha256", "Texto"])
+
+
+def summarize(results: list[DownloadResult]) -> str:
+    ok = sum(r.status == "ok" for r in results)
+    hit = sum(r.status == "cache" for r in results)
+    erro = len(results) - ok - hit
+    return f"{ok} baixado(s), {hit} do cache, {erro} com erro"
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Baixa documentos do FNET para o cache local.")
+    parser.add_argument("docs", nargs="+", help="DocNumbers")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--texto", action="store_true", help="extrai o texto para o arquivo Parquet")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(download_documents(args.docs, base_url=args.base_url, concurrency=args.concurrency))
+    for r in results:
+        print(f"{r.doc}: {r.status} {r.path or ''}")
+    print(summarize(results))
+    if args.texto:
+        from arquivo import Archive
+        archive = Archive()
+        com_texto = set(archive.texts([r.doc for r in results], columns=["DocNumber"])["DocNumber"])
+        archive.append_texts(texts_frame([r for r in results if r.doc not in com_texto]))
+
+
+if __name__ == "__main__":
+    main()
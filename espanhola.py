@@ -1,94 +1,384 @@
+"""
+Relatório dos fundos imobiliários espanhóis (cotações convertidas para BRL).
+
+Pipeline: fetch -> convert -> export -> notify
+- fetch_quotes: atualiza o histórico local (precos.PriceStore) ticker a ticker, num pool
+  de threads limitado, com tentativas e prazo por ticker; devolve o que conseguiu e o
+  status de cada ticker (um símbolo ruim não derruba o lote)
+- convert_brl / melt: preços em BRL (largo, via cambio.converter_largo) e formato longo
+- analisar: retornos, volatilidade, drawdown e correlação (analise.Analisador, incremental)
+- exportar: XLSX (streaming) com as abas de resumo; o formato longo vai para Parquet/csv.gz
+- notify: email com o Excel e os tickers que falharam
+
+Uso:
+  python espanhola.py                      # tickers padrão, gera o Excel e envia
+  python espanhola.py --tickers AMS.MC ELE.MC --no-email
+"""
+from __future__ import annotations
+
+import argparse
 import os
-import yfinance as yf
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
 import pandas as pd
-from datetime import datetime
-import yagmail
+
+from analise import Analisador, Analise
+from cambio import MAX_DEFASAGEM, converter_largo, pares
+from metricas import METRICS
+from notificacao import compartilhado
+from precos import INICIO, Cancelado, PriceProvider, PriceStore, provider_from_env
+from relatorio import FORMATOS, LIMITE_EXCEL, Relatorio
 
 # === CONFIG DO EMAIL ===
 EMAIL_TO = ["diego@seikopartners.com.br", "fabio@seikopartners.com.br"]
 EMAIL_SUBJECT = "Relatório dos Fundo Imobiliários Espanhola"
 
 # 1) Tickers
-tickers = ['AMS.MC', 'APAM.MC', 'CLNX.MC', 'ELE.MC', 'IUSC.DE', "SAJA.F"]
-fx_ticker = 'EURBRL=X'
-
-# 2) Baixar dados desde 30/09/2025
-data = yf.download(
-    tickers + [fx_ticker],
-    start="2025-09-30"
-)
-
-# 3) Pegar apenas o Close
-close = data["Close"]
-
-# separar ações e câmbio
-close_ativos = close[tickers]           # colunas das ações
-eurbrl = close[fx_ticker]               # série do câmbio
-
-# 4) Converter para BRL (preço em EUR * EURBRL)
-close_brl = close_ativos.mul(eurbrl, axis=0)
-
-# 5) Ajustar índice para coluna e renomear
-close_brl = close_brl.reset_index()     # índice Date vira coluna
-close_brl.rename(columns={"Date": "Data"}, inplace=True)
-
-# >>> Remover a hora da data <<<
-close_brl["Data"] = close_brl["Data"].dt.date
-
-# 6) Usar melt para formato longo
-df_melt = close_brl.melt(
-    id_vars="Data",
-    var_name="Série",
-    value_name="Valor"
-)
-
-def exportar_excel(close_brl: pd.DataFrame, df_melt: pd.DataFrame, out_path: str) -> str:
-    """Exporta um XLSX com duas abas e retorna o caminho."""
-    with pd.ExcelWriter(out_path, engine="openpyxl") as writer:
-        close_brl.to_excel(writer, index=False, sheet_name="precos_brl")
-        df_melt.to_excel(writer, index=False, sheet_name="melt")
-    return out_path
+TICKERS = ['AMS.MC', 'APAM.MC', 'CLNX.MC', 'ELE.MC', 'IUSC.DE', "SAJA.F"]
+# moeda de cada ticker quando o sufixo da bolsa não basta (ver cambio.SUFIXOS)
+MOEDAS: dict[str, str] = {}
+
+MAX_WORKERS = 8
+TENTATIVAS = 3
+TIMEOUT_S = 30.0  # por requisição ao provedor
+PRAZO_TICKER_S = 120.0  # por ticker, somando as tentativas
+BACKOFF_S = 2.0
+JOIN_S = 5.0  # depois do prazo: espera as gravações em andamento terminarem
+
+# outbox + conexão SMTP reaproveitada (credenciais em SMTP_USER/SMTP_PASS)
+NOTIFIER = compartilhado()
+
+
+@dataclass
+class StatusTicker:
+    ticker: str
+    status: str = "pendente"  # ok | sem_dados | erro | timeout
+    linhas: int = 0  # linhas baixadas nesta execução
+    tentativas: int = 0
+    erro: str = ""
+    segundos: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+
+@dataclass
+class Cotacoes:
+    close: pd.DataFrame  # Data x ticker, só os tickers com status ok
+    status: dict[str, StatusTicker] = field(default_factory=dict)
+
+    @property
+    def falhas(self) -> list[StatusTicker]:
+        return [s for s in self.status.values() if not s.ok]
+
+
+def _fetch_one(
+    store: PriceStore,
+    provider: PriceProvider,
+    ticker: str,
+    start: date,
+    tentativas: int,
+    prazo_s: float,
+    cancelado: threading.Event,
+) -> StatusTicker:
+    st = StatusTicker(ticker)
+    t0 = time.monotonic()
+    while not cancelado.is_set():
+        st.tentativas += 1
+        try:
+            st.linhas = store.update([ticker], provider, start=start, cancelado=cancelado)[ticker]
+            st.status, st.erro = "ok", ""
+            if not st.linhas:
+                # provedor sem linhas: o histórico local (se houver) não é desta execução
+                ultima = store.last_date(ticker)
+                st.status = "sem_dados"
+                st.erro = f"histórico local até {ultima:%d/%m/%Y}" if ultima else ""
+            break
+        except Cancelado:
+            break
+        except Exception as e:  # provedor externo: qualquer falha conta como tentativa
+            st.status, st.erro = "erro", f"{type(e).__name__}: {e}"
+            METRICS.inc("precos_retries")
+        if st.tentativas >= tentativas or time.monotonic() - t0 + BACKOFF_S * st.tentativas > prazo_s:
+            break
+        cancelado.wait(BACKOFF_S * st.tentativas)
+    st.segundos = time.monotonic() - t0
+    return st
+
+
+def fetch_quotes(
+    tickers: list[str],
+    store: PriceStore | None = None,
+    provider: PriceProvider | None = None,
+    start: date = INICIO,
+    max_workers: int = MAX_WORKERS,
+    tentativas: int = TENTATIVAS,
+    timeout_s: float = TIMEOUT_S,
+    prazo_ticker_s: float = PRAZO_TICKER_S,
+) -> Cotacoes:
+    """
+    Atualiza e lê o Close de cada ticker em paralelo (até max_workers por vez).
+    Cada ticker tem até `tentativas` e prazo_ticker_s no total; o lote inteiro espera no
+    máximo prazo_ticker_s por "onda" do pool e o que não terminou vira "timeout": a thread
+    dele é avisada (não grava mais no PriceStore) e esperada por até JOIN_S.
+    Ticker com falha fica fora do resultado (o relatório lista quais), em vez de entrar
+    com o histórico local desatualizado.
+    """
+    store = store or PriceStore()
+    provider = provider or provider_from_env(timeout=timeout_s)
+    tickers = list(dict.fromkeys(tickers))
+    status = {t: StatusTicker(t) for t in tickers}
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tickers))), thread_name_prefix="cotacoes")
+    ondas = max(1, -(-len(tickers) // max(1, max_workers)))
+    prazo = time.monotonic() + prazo_ticker_s * ondas
+    cancelado = threading.Event()
+    futures = {
+        pool.submit(_fetch_one, store, provider, t, start, tentativas, prazo_ticker_s, cancelado): t for t in tickers
+    }
+    pendentes = set(futures)
+    with METRICS.span("cotacoes_fetch", tickers=len(tickers)):
+        while pendentes:
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                break
+            feitos, pendentes = wait(pendentes, timeout=restante, return_when=FIRST_COMPLETED)
+            for f in feitos:
+                status[futures[f]] = f.result()
+    # quem ainda está rodando não grava mais: uma gravação já em andamento termina (atômica)
+    # dentro do JOIN_S; uma thread presa no provedor sai sozinha, sem tocar no PriceStore
+    cancelado.set()
+    pool.shutdown(wait=False, cancel_futures=True)
+    if pendentes:
+        wait(pendentes, timeout=JOIN_S)
+    for f in pendentes:
+        # terminou durante o JOIN_S: vale o resultado (inclusive o "ok" de uma gravação que acabou)
+        if f.done() and not f.cancelled():
+            status[futures[f]] = f.result()
+        st = status[futures[f]]
+        if st.status not in ("ok", "sem_dados"):
+            anterior = f" (última falha: {st.erro})" if st.erro else ""
+            st.status, st.erro = "timeout", f"sem resposta em {prazo_ticker_s:g}s{anterior}"
+
+    for st in status.values():
+        METRICS.inc("cotacoes_tickers", status=st.status)
+        if not st.ok:
+            print(f"[AVISO] {st.ticker}: {st.status} após {st.tentativas} tentativa(s) {st.erro}".rstrip())
+
+    ok = [t for t in tickers if status[t].ok]
+    close = store.load(ok, "Close", start=start) if ok else pd.DataFrame(index=pd.DatetimeIndex([], name="Data"))
+    return Cotacoes(close, status)
+
+
+def convert_brl(
+    close: pd.DataFrame,
+    tickers: list[str],
+    moedas: dict[str, str] | None = None,
+    max_defasagem: timedelta = MAX_DEFASAGEM,
+) -> pd.DataFrame:
+    """Preço na moeda do ticker * câmbio para BRL (as-of), com a Data como coluna (sem hora)."""
+    # 4) Converter para BRL
+    close_brl = converter_largo(close, tickers, moedas or MOEDAS, max_defasagem=max_defasagem)
+
+    # 5) Ajustar índice para coluna e renomear
+    close_brl = close_brl.rename_axis("Data").reset_index()
+
+    # >>> Remover a hora da data <<<
+    close_brl["Data"] = close_brl["Data"].dt.date
+    return close_brl
+
+
+def pregoes(close_brl: pd.DataFrame, close: pd.DataFrame) -> pd.DataFrame:
+    """
+    close_brl só nas datas em que cada ticker negociou (Data_Preco == Data): os preços que
+    o as-of repetiu em feriados da bolsa viram NaN, para não contarem como retorno zero.
+    """
+    cols = [c for c in close_brl.columns if c != "Data"]
+    negociou = close.reindex(index=pd.DatetimeIndex(pd.to_datetime(close_brl["Data"])), columns=cols).notna()
+    out = close_brl.copy()
+    out[cols] = close_brl[cols].where(negociou.to_numpy())
+    return out
+
+
+def melt(close_brl: pd.DataFrame) -> pd.DataFrame:
+    # 6) Usar melt para formato longo
+    return close_brl.melt(
+        id_vars="Data",
+        var_name="Série",
+        value_name="Valor"
+    )
+
+
+def resumo(close_brl: pd.DataFrame, so_pregoes: pd.DataFrame | None = None) -> pd.DataFrame:
+    """
+    Uma linha por ticker: período coberto e pregões (das datas com negócio, se so_pregoes),
+    último valor e variação no período.
+    """
+    precos = close_brl.set_index("Data")
+    negocios = so_pregoes.set_index("Data") if so_pregoes is not None else precos
+    primeira = negocios.apply(lambda s: s.first_valid_index())
+    ultima = negocios.apply(lambda s: s.last_valid_index())
+    inicial = precos.bfill().iloc[0] if len(precos) else pd.Series(dtype=float)
+    final = precos.ffill().iloc[-1] if len(precos) else pd.Series(dtype=float)
+    return pd.DataFrame({
+        "Ticker": precos.columns,
+        "Primeira_Data": primeira.reindex(precos.columns).values,
+        "Ultima_Data": ultima.reindex(precos.columns).values,
+        "Pregoes": negocios.notna().sum().reindex(precos.columns).values,
+        "Ultimo_BRL": final.reindex(precos.columns).values,
+        "Variacao_Periodo": (final / inicial - 1).reindex(precos.columns).values,
+    })
+
+
+def analisar(
+    so_pregoes: pd.DataFrame,
+    tickers: list[str] | None = None,
+    analisador: Analisador | None = None,
+) -> Analise:
+    """so_pregoes: close_brl sem os preços repetidos (ver pregoes); tickers: o universo pedido."""
+    with METRICS.span("analise"):
+        return (analisador or Analisador()).atualizar(so_pregoes, tickers)
+
+
+def exportar(
+    close_brl: pd.DataFrame,
+    df_melt: pd.DataFrame,
+    out_dir: str | Path = ".",
+    nome: str | None = None,
+    formatos: tuple[str, ...] = FORMATOS,
+    analise: Analise | None = None,
+    so_pregoes: pd.DataFrame | None = None,
+    limite_excel: int = LIMITE_EXCEL,
+) -> dict[str, Path]:
+    """
+    XLSX com precos_brl (largo), resumo e, se houver, a análise (resumo por ticker e
+    correlação); o melt e as séries diárias da análise (crescem com o histórico) vão para
+    Parquet/csv.gz e só entram no Excel até limite_excel linhas (padrão: nunca). Devolve os caminhos.
+    """
+    nome = nome or f"cotacoes_brl_{datetime.now():%Y%m%d_%H%M%S}"
+    rel = Relatorio(out_dir, nome, formatos, limite_excel)
+    rel.resumo("precos_brl", close_brl).resumo("resumo", resumo(close_brl, so_pregoes))
+    if analise is not None:
+        rel.resumo("analise", analise.resumo)
+        rel.resumo("correlacao", analise.correlacao.rename_axis("Ticker").reset_index())
+    rel.dados("melt", df_melt)
+    if analise is not None:
+        rel.dados("analise_diaria", analise.diaria)
+    with METRICS.span("relatorio_write", linhas=len(df_melt)):
+        return rel.write()
+
 
 def send_email(lines: list[str], attachments: list[str] | None = None):
-    user = "viniciuskaolo@gmail.com"           # seu gmail
-    app_pass = "hjlvknog yxjtmuku"   # app password (16 chars)
-
-    if not user or not app_pass:
-        print("\n[AVISO] Variáveis de ambiente não configuradas. Não vou enviar email.")
-        print("Configure assim (exemplo):")
-        print("  export GMAIL_USER='seuemail@gmail.com'")
-        print("  export GMAIL_APP_PASS='sua_app_password_de_16_chars'")
-        print("\nConteúdo que iria no email:\n")
-        print("\n".join(lines))
-        if attachments:
-            print("\nAnexos que eu mandaria:")
-            for a in attachments:
-                print(" -", a)
-        return
-
-    text_body = "Olá,\n\nSeguem os documentos:\n\n" + "\n".join(lines)
-
-    yag = yagmail.SMTP(user, app_pass)
-    yag.send(
-        to=EMAIL_TO,
-        subject=EMAIL_SUBJECT,
-        contents=[text_body],
-        attachments=attachments or []
+    NOTIFIER.send(EMAIL_TO, EMAIL_SUBJECT, lines, attachments or [])
+
+
+def email_lines(arquivos: dict[str, Path], cotacoes: Cotacoes, fx: list[str]) -> list[str]:
+    ok = [t for t, s in cotacoes.status.items() if s.ok and t not in fx]
+    dados = [os.path.abspath(p) for k, p in arquivos.items() if k != "xlsx"]
+    lines = [
+        f"Arquivo Excel: {os.path.abspath(arquivos['xlsx'])}",
+        f"Tickers: {', '.join(ok)}",
+        f"Câmbio: {', '.join(fx) or '-'}",
+        "Abas: precos_brl (largo), resumo, analise, correlacao",
+    ]
+    if dados:
+        lines.append(f"Formato longo (melt, analise_diaria): {', '.join(dados)}")
+    for st in cotacoes.falhas:
+        lines.append(f"Sem cotação: {st.ticker} ({st.status}{f': {st.erro}' if st.erro else ''})")
+    return lines
+
+
+def notify(arquivos: dict[str, Path], cotacoes: Cotacoes, fx: list[str]):
+    send_email(email_lines(arquivos, cotacoes, fx), attachments=[str(arquivos["xlsx"])])
+
+
+@dataclass
+class Resultado:
+    cotacoes: Cotacoes
+    close_brl: pd.DataFrame
+    analise: Analise
+    arquivos: dict[str, Path]
+
+    @property
+    def xlsx_path(self) -> Path:
+        return self.arquivos["xlsx"]
+
+
+def run(
+    tickers: list[str] = TICKERS,
+    moedas: dict[str, str] | None = None,
+    out_dir: str = ".",
+    email: bool = True,
+    max_defasagem: timedelta = MAX_DEFASAGEM,
+    formatos: tuple[str, ...] = FORMATOS,
+    limite_excel: int = LIMITE_EXCEL,
+    **fetch_kwargs,
+) -> Resultado:
+    """fetch -> convert -> export -> notify; os kwargs vão para fetch_quotes."""
+    moedas = moedas or MOEDAS
+    # cada par de câmbio é baixado uma vez, junto com os ativos
+    fx = pares(list(tickers), moedas)
+    cotacoes = fetch_quotes(list(tickers) + fx, **fetch_kwargs)
+    close_brl = convert_brl(cotacoes.close, tickers, moedas, max_defasagem)
+    so_pregoes = pregoes(close_brl, cotacoes.close)
+
+    # === GERA O EXCEL E ENVIA ===
+    analise = analisar(so_pregoes, list(tickers))
+    arquivos = exportar(
+        close_brl, melt(close_brl), out_dir, formatos=formatos, analise=analise, so_pregoes=so_pregoes,
+        limite_excel=limite_excel,
     )
-    yag.close()
-    print(f"Email enviado com {len(lines)} linhas e {len(attachments or [])} anexo(s).")
+    for path in arquivos.values():
+        print(f"Salvo: {path}")
+
+    if email:
+        notify(arquivos, cotacoes, fx)
+    return Resultado(cotacoes, close_brl, analise, arquivos)
+
 
-# === GERA O EXCEL E ENVIA ===
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-xlsx_path = f"cotacoes_brl_{timestamp}.xlsx"
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Cotações dos fundos espanhóis em BRL (Excel + email).")
+    parser.add_argument("--tickers", nargs="+", default=TICKERS)
+    parser.add_argument("--moeda", action="append", default=[], metavar="TICKER=MOEDA",
+                        help="moeda de um ticker (padrão: pelo sufixo da bolsa)")
+    parser.add_argument("--max-defasagem", type=int, default=MAX_DEFASAGEM.days,
+                        help="dias máximos de preço/câmbio repetido quando a bolsa não abriu")
+    parser.add_argument("--start", type=date.fromisoformat, default=INICIO)
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--out-dir", default=".")
+    parser.add_argument("--formato", action="append", choices=["parquet", "csv.gz"],
+                        help=f"arquivos do formato longo (padrão: {', '.join(FORMATOS)})")
+    parser.add_argument("--excel-dados", type=int, default=LIMITE_EXCEL, metavar="N",
+                        help="inclui melt/analise_diaria no XLSX se tiverem até N linhas (padrão: não inclui)")
+    parser.add_argument("--no-email", action="store_true")
+    args = parser.parse_args(argv)
+    moedas = dict(MOEDAS)
+    for item in args.moeda:
+        ticker, sep, moeda = item.partition("=")
+        if not sep:
+            parser.error(f"--moeda espera TICKER=MOEDA, recebeu {item!r}")
+        moedas[ticker] = moeda
 
-exportar_excel(close_brl, df_melt, xlsx_path)
+    try:
+        res = run(
+            args.tickers, moedas, out_dir=args.out_dir, email=not args.no_email,
+            max_defasagem=timedelta(days=args.max_defasagem), formatos=tuple(args.formato or FORMATOS),
+            limite_excel=args.excel_dados, start=args.start, max_workers=args.workers,
+        )
+    finally:
+        METRICS.flush()
+    falhas = res.cotacoes.falhas
+    print(f"{len(res.cotacoes.status) - len(falhas)} ticker(s) ok, {len(falhas)} com falha.")
 
-linhas_email = [
-    f"Arquivo Excel: {os.path.abspath(xlsx_path)}",
-    f"Tickers: {', '.join(tickers)}",
-    f"Câmbio: {fx_ticker}",
-    "Abas: precos_brl (largo) e melt (longo)"
-]
 
-send_email(linhas_email, attachments=[xlsx_path])
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        NOTIFIER.close()  # NOTIFIER é compartilhado: no seiko.py quem fecha é o orquestrador
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import pandas as pd
+
+from config import state_path
+
+
+_CHUNK = 500
+
+
+class DocStore:
+    """
+    Marca d'água persistente dos documentos já vistos, indexada por DocNumber.
+    Permite coletar só o que é novo e parar a paginação quando uma página
+    inteira já é conhecida.
+    Documentos marcados durante uma coleta em andamento ficam "pendentes" (committed=0):
+    contam como vistos, mas só param a paginação depois de commit_run(). Assim uma
+    coleta interrompida no meio não esconde as páginas mais antigas na próxima.
+    Pode ser usada por várias threads (consultas concorrentes do Planejador).
+    """
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = Path(path) if path else state_path("fnet.sqlite3")
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " doc_number TEXT PRIMARY KEY,"
+            " first_seen TEXT NOT NULL,"
+            " committed INTEGER NOT NULL DEFAULT 1)"
+        )
+        cols = {r[1] for r in self.conn.execute("PRAGMA table_info(docs)")}
+        if "committed" not in cols:
+            self.conn.execute("ALTER TABLE docs ADD COLUMN committed INTEGER NOT NULL DEFAULT 1")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self) -> DocStore:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def known(self, docs: Iterable, committed_only: bool = False) -> set[str]:
+        docs = [str(d) for d in docs if d is not None and str(d).strip()]
+        found: set[str] = set()
+        extra = " AND committed = 1" if committed_only else ""
+        with self._lock:
+            for i in range(0, len(docs), _CHUNK):
+                chunk = docs[i:i + _CHUNK]
+                marks = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT doc_number FROM docs WHERE doc_number IN ({marks}){extra}", chunk
+                )
+                found.update(r[0] for r in rows)
+        return found
+
+    def is_page_known(self, page: pd.DataFrame) -> bool:
+        if page.empty or "DocNumber" not in page.columns:
+            return False
+        docs = set(page["DocNumber"].astype(str))
+        return docs <= self.known(docs, committed_only=True)
+
+    def unseen(self, df: pd.DataFrame) -> pd.DataFrame:
+        if df.empty or "DocNumber" not in df.columns:
+            return df
+        docs = df["DocNumber"].astype(str)
+        return df[~docs.isin(self.known(docs.unique()))].reset_index(drop=True)
+
+    def mark_seen(self, docs: Iterable, committed: bool = True):
+        now = datetime.now().isoformat(timespec="seconds")
+        rows = [(str(d), now, int(committed)) for d in docs if d is not None and str(d).strip()]
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO docs (doc_number, first_seen, committed) VALUES (?, ?, ?)", rows
+            )
+            self.conn.commit()
+
+    def commit_run(self):
+        """Fim de uma coleta completa: os pendentes passam a parar a paginação."""
+        with self._lock:
+            self.conn.execute("UPDATE docs SET committed = 1 WHERE committed = 0")
+            self.conn.commit()
+
+
+def until_known(pages: Iterable[pd.DataFrame], store: DocStore | None) -> Iterator[pd.DataFrame]:
+    """Repassa as páginas até encontrar uma inteiramente conhecida (ordem: mais novo primeiro)."""
+    for page in pages:
+        if store is not None and store.is_page_known(page):
+            break
+        yield page
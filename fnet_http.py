@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+from datetime import date
+from typing import Iterator
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from estado import DocStore, until_known
+from metricas import METRICS
+
+
+BASE_URL = "https://fnet.bmfbovespa.com.br/fnet/publico"
+
+# endpoint DataTables chamado via XHR pela página abrirGerenciadorDocumentosCVM
+ENDPOINT_DADOS = "pesquisarGerenciadorDocumentosDados"
+ENDPOINT_PAGINA = "abrirGerenciadorDocumentosCVM"
+
+TIPO_FUNDO_FII = 1
+PAGE_SIZE = 200
+
+# (campo do JSON, coluna da tabela) — mesma ordem/nomes que read_table devolve
+CAMPOS: list[tuple[str, str]] = [
+    ("descricaoFundo", "Nome do Fundo"),
+    ("categoriaDocumento", "Categoria"),
+    ("tipoDocumento", "Tipo"),
+    ("especieDocumento", "Espécie"),
+    ("dataReferencia", "Data de Referência"),
+    ("dataEntrega", "Data de Entrega"),
+    ("descricaoStatus", "Status"),
+    ("versao", "Versão"),
+    ("descricaoModalidade", "Modalidade de Envio"),
+]
+COLUNAS = [col for _, col in CAMPOS] + ["DocNumber"]
+
+
+def format_data(d: date) -> str:
+    return f"{d.day:02d}/{d.month:02d}/{d.year}"
+
+
+def _texto(v) -> str:
+    if v is None:
+        return ""
+    return str(v).strip()
+
+
+def records_to_df(records: list[dict]) -> pd.DataFrame:
+    """Converte os registros do JSON no mesmo schema de collect_pages (tudo texto)."""
+    if not records:
+        return pd.DataFrame(columns=COLUNAS)
+    rows = [
+        [_texto(r.get(campo)) for campo, _ in CAMPOS] + [_texto(r.get("id"))]
+        for r in records
+    ]
+    return pd.DataFrame(rows, columns=COLUNAS)
+
+
+class _CountingRetry(Retry):
+    def increment(self, *args, **kwargs):
+        METRICS.inc("http_retries")
+        return super().increment(*args, **kwargs)
+
+
+class FnetClient:
+    """
+    Cliente HTTP do FNET (sem navegador).
+    - sessão keep-alive com pool de conexões e retry nos 429/5xx
+    - páginas grandes (PAGE_SIZE) para reduzir o número de requisições
+    - base_url configurável (permite apontar para um servidor local de replay)
+    """
+
+    def __init__(
+        self,
+        base_url: str = BASE_URL,
+        page_size: int = PAGE_SIZE,
+        timeout: float = 30,
+        pool_size: int = 4,
+        session: requests.Session | None = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.page_size = page_size
+        self.timeout = timeout
+        self.session = session or self._make_session(pool_size)
+        self._draw = 0
+        self._warm = False
+
+    @staticmethod
+    def _make_session(pool_size: int) -> requests.Session:
+        session = requests.Session()
+        retry = _CountingRetry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update({
+            "User-Agent": "Mozilla/5.0",
+            "Accept": "application/json, text/javascript, */*; q=0.01",
+            "X-Requested-With": "XMLHttpRequest",
+        })
+        return session
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self) -> FnetClient:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _warmup(self):
+        # a página principal seta os cookies de sessão; o endpoint JSON costuma exigi-los
+        if self._warm:
+            return
+        self._warm = True
+        try:
+            self.session.get(f"{self.base_url}/{ENDPOINT_PAGINA}", timeout=self.timeout)
+        except requests.RequestException:
+            pass
+
+    def build_params(
+        self,
+        data_inicial: date,
+        data_final: date | None = None,
+        start: int = 0,
+        length: int | None = None,
+        **filtros,
+    ) -> dict:
+        params = {
+            "s": start,
+            "l": length or self.page_size,
+            "o[0][dataEntrega]": "desc",
+            "tipoFundo": TIPO_FUNDO_FII,
+            "idCategoriaDocumento": 0,
+            "idTipoDocumento": 0,
+            "idEspecieDocumento": 0,
+            "dataInicial": format_data(data_inicial),
+            "dataFinal": format_data(data_final) if data_final else "",
+        }
+        params.update(filtros)
+        return params
+
+    def fetch_page(self, params: dict) -> dict:
+        self._warmup()
+        self._draw += 1
+        with METRICS.span("page_fetch", backend="http"):
+            resp = self.session.get(
+                f"{self.base_url}/{ENDPOINT_DADOS}",
+                params={"d": self._draw, **params},
+                timeout=self.timeout,
+            )
+            resp.raise_for_status()
+            payload = resp.json()
+        METRICS.inc("pages", backend="http")
+        if not isinstance(payload, dict) or "data" not in payload:
+            raise ValueError(f"Resposta inesperada do FNET: {str(payload)[:200]}")
+        return payload
+
+    def iter_pages(
+        self,
+        data_inicial: date,
+        data_final: date | None = None,
+        primeira: dict | None = None,
+        **filtros,
+    ) -> Iterator[pd.DataFrame]:
+        """primeira: payload da primeira página, se já foi buscado (não repete a requisição)."""
+        start = 0
+        payload = primeira
+        while True:
+            if payload is None:
+                payload = self.fetch_page(self.build_params(data_inicial, data_final, start=start, **filtros))
+            records = payload.get("data") or []
+            if not records:
+                break
+            with METRICS.span("page_parse", backend="http"):
+                page = records_to_df(records)
+            yield page
+            start += len(records)
+            total = int(payload.get("recordsFiltered") or payload.get("recordsTotal") or 0)
+            if start >= total:
+                break
+            payload = None
+
+    def collect(
+        self,
+        data_inicial: date,
+        data_final: date | None = None,
+        store: DocStore | None = None,
+        **filtros,
+    ) -> pd.DataFrame:
+        pages = list(until_known(self.iter_pages(data_inicial, data_final, **filtros), store))
+        if not pages:
+            return pd.DataFrame()
+        return pd.concat(pages, ignore_index=True)
@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import pickle
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from config import state_path
+from metricas import METRICS
+from texto import normalize
+
+
+INDEX_VERSION = 2
+FUZZY_MIN_SCORE = 0.85
+MEMO_MAX = 50_000  # nomes distintos lembrados (LRU); o FNET tem milhares de fundos fora da lista
+
+# sufixos que variam entre cadastros do mesmo fundo ("RESP LIMITADA", "FII", ...)
+_SUFIXOS = re.compile(
+    r"\b(?:de )?(?:responsabilidade|resp) (?:limitada|ltda)\b"
+    r"|\bfundo de investimentos? imobiliarios?\b"
+    r"|\bfdo inv imobiliario\b"
+    r"|\bfi imobiliario\b"
+    r"|\bfii\b"
+)
+_PONTUACAO = re.compile(r"[^\w\s]")
+
+# tokens sem poder de discriminação para o fuzzy
+_STOPWORDS = {
+    "fii", "fundo", "fundos", "fdo", "inv", "fi", "de", "do", "da", "dos", "das", "e",
+    "investimento", "investimentos", "imobiliario", "imobiliarios",
+    "resp", "responsabilidade", "limitada", "ltda",
+}
+
+
+def name_key(nome) -> str:
+    """Chave canônica: normalize + sem pontuação/travessões + sem sufixos jurídicos."""
+    s = _PONTUACAO.sub(" ", normalize(nome))
+    s = _SUFIXOS.sub(" ", s)
+    return " ".join(s.split())
+
+
+def name_tokens(nome) -> frozenset[str]:
+    return frozenset(t for t in _PONTUACAO.sub(" ", normalize(nome)).split() if t not in _STOPWORDS)
+
+
+def cnpj_digits(cnpj) -> str:
+    return re.sub(r"\D", "", str(cnpj or ""))
+
+
+@dataclass
+class Fundo:
+    ticker: str
+    nome: str
+    aliases: list[str] = field(default_factory=list)
+    cnpjs: list[str] = field(default_factory=list)
+    fuzzy: bool = False  # aceita casamento aproximado (só com opt-in no fundos.json)
+
+
+def fundos_from_pairs(pairs: Iterable[tuple[str, str]], extras: list[dict] | None = None) -> list[Fundo]:
+    """
+    Agrupa (nome, ticker) por ticker: o primeiro nome vira o canônico, os demais aliases.
+    extras: [{"ticker": ..., "nome": ..., "aliases": [...], "cnpjs": [...], "fuzzy": true}]
+    (ex.: fundos.json); "fuzzy" põe o fundo na lista dos que aceitam casamento aproximado.
+    """
+    por_ticker: dict[str, Fundo] = {}
+    for nome, ticker in pairs:
+        fundo = por_ticker.get(ticker)
+        if fundo is None:
+            por_ticker[ticker] = Fundo(ticker=ticker, nome=nome)
+        elif nome not in fundo.aliases and nome != fundo.nome:
+            fundo.aliases.append(nome)
+
+    for extra in extras or []:
+        ticker = extra["ticker"]
+        fundo = por_ticker.setdefault(ticker, Fundo(ticker=ticker, nome=extra.get("nome") or ticker))
+        fundo.aliases.extend(a for a in extra.get("aliases", []) if a not in fundo.aliases)
+        fundo.cnpjs.extend(c for c in extra.get("cnpjs", []) if c not in fundo.cnpjs)
+        fundo.fuzzy = fundo.fuzzy or bool(extra.get("fuzzy"))
+
+    return list(por_ticker.values())
+
+
+def load_extras(path: str | Path = "fundos.json") -> list[dict]:
+    path = Path(path)
+    if not path.exists():
+        return []
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+class FundIndex:
+    """
+    Índice de identidade dos fundos monitorados.
+    - lookup exato O(1): nome normalizado, chave canônica, ticker e CNPJ
+    - fallback fuzzy por tokens (índice invertido + peso IDF) com score de confiança; só
+      vale para fundos com fuzzy=True (lista explícita) e cada casamento é logado
+    - match() resolve cada valor distinto da coluna uma vez só (memo LRU de MEMO_MAX nomes)
+    Pode ser usado por várias threads (o memo tem lock; o resto é só leitura).
+    """
+
+    def __init__(self, fundos: list[Fundo]):
+        self.fundos = fundos
+        self.tickers = [f.ticker for f in fundos]
+
+        self.exact: dict[str, int] = {}
+        self.keys: dict[str, int] = {}
+        self.conflicts: dict[str, set[str]] = defaultdict(set)
+        key_owners: dict[str, set[int]] = defaultdict(set)
+
+        token_sets: list[set[str]] = [set() for _ in fundos]
+        for i, fundo in enumerate(fundos):
+            self.exact[normalize(fundo.ticker)] = i
+            for cnpj in fundo.cnpjs:
+                self.exact[cnpj_digits(cnpj)] = i
+            for nome in [fundo.nome, *fundo.aliases]:
+                norm = normalize(nome)
+                if norm in self.exact and self.exact[norm] != i:
+                    self.conflicts[norm].update({fundos[self.exact[norm]].ticker, fundo.ticker})
+                self.exact.setdefault(norm, i)
+                key_owners[name_key(nome)].add(i)
+                token_sets[i] |= name_tokens(nome)
+
+        # chave canônica só vale se for de um único fundo (ex.: "PATRIA LOG" é de dois)
+        for key, owners in key_owners.items():
+            if len(owners) == 1:
+                self.keys[key] = next(iter(owners))
+            else:
+                self.conflicts[key].update(fundos[i].ticker for i in owners)
+        self.conflicts = dict(self.conflicts)
+
+        self.token_sets = [frozenset(t) for t in token_sets]
+        df_count: dict[str, int] = defaultdict(int)
+        self.postings: dict[str, list[int]] = defaultdict(list)
+        for i, tokens in enumerate(self.token_sets):
+            for t in tokens:
+                df_count[t] += 1
+                self.postings[t].append(i)
+        self.postings = dict(self.postings)
+        n = max(len(fundos), 1)
+        self.idf = {t: math.log(1 + n / c) for t, c in df_count.items()}
+        self._default_idf = math.log(1 + n)
+        self._memo: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # vai para o pickle do load_index; o lock não é serializável
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def duplicate_tickers(self) -> dict[str, list[str]]:
+        """Tickers com mais de um nome cadastrado (ex.: BCIA11)."""
+        return {f.ticker: [f.nome, *f.aliases] for f in self.fundos if f.aliases}
+
+    def _weight(self, tokens: Iterable[str]) -> float:
+        return sum(self.idf.get(t, self._default_idf) for t in tokens)
+
+    def _fuzzy(self, nome: str, min_score: float) -> tuple[str, float]:
+        query = name_tokens(nome)
+        if not query:
+            return "", 0.0
+        candidatos: set[int] = set()
+        for t in query:
+            candidatos.update(self.postings.get(t, ()))
+
+        best, best_score, empate = -1, 0.0, False
+        for i in candidatos:
+            tokens = self.token_sets[i]
+            score = self._weight(query & tokens) / self._weight(query | tokens)
+            if score > best_score:
+                best, best_score, empate = i, score, False
+            elif score == best_score:
+                empate = True
+        if best < 0 or empate or best_score < min_score:
+            return "", 0.0
+        # o melhor candidato tem de estar na lista explícita: um fundo fora dela (ex.: nome
+        # parecido de outro gestor) não pode ser roteado por aproximação
+        if not self.fundos[best].fuzzy:
+            METRICS.inc("fundo_fuzzy", resultado="fora_da_lista")
+            return "", 0.0
+        METRICS.inc("fundo_fuzzy", resultado="aceito")
+        print(f"[AVISO] {nome!r} casado por aproximação com {self.tickers[best]} (score {best_score:.2f}).")
+        return self.tickers[best], best_score
+
+    def lookup(self, nome, min_score: float = FUZZY_MIN_SCORE) -> tuple[str, float]:
+        """Devolve (ticker, confiança); ticker "" se não casar."""
+        norm = normalize(nome)
+        if not norm:
+            return "", 0.0
+        memo_key = f"{min_score}|{norm}"
+        with self._lock:
+            if memo_key in self._memo:
+                self._memo.move_to_end(memo_key)
+                return self._memo[memo_key]
+
+        if norm in self.exact:
+            result = (self.tickers[self.exact[norm]], 1.0)
+        elif cnpj_digits(norm) in self.exact and len(cnpj_digits(norm)) == 14:
+            result = (self.tickers[self.exact[cnpj_digits(norm)]], 1.0)
+        elif name_key(nome) in self.keys:
+            result = (self.tickers[self.keys[name_key(nome)]], 0.95)
+        else:
+            result = self._fuzzy(nome, min_score)
+
+        # calculado fora do lock: duas threads com o mesmo nome no máximo repetem o lookup
+        with self._lock:
+            self._memo[memo_key] = result
+            if len(self._memo) > MEMO_MAX:
+                self._memo.popitem(last=False)
+        return result
+
+    def match(self, s: pd.Series, min_score: float = FUZZY_MIN_SCORE) -> tuple[np.ndarray, np.ndarray]:
+        """Resolve a coluna inteira: (tickers, scores), um lookup por valor distinto."""
+        codes, uniques = pd.factorize(s)
+        resolved = [self.lookup(u, min_score) for u in uniques] + [("", 0.0)]
+        tickers = np.array([t for t, _ in resolved], dtype=object)
+        scores = np.array([sc for _, sc in resolved], dtype=float)
+        return tickers[codes], scores[codes]
+
+
+def _signature(fundos: list[Fundo]) -> str:
+    raw = json.dumps([INDEX_VERSION, [vars(f) for f in fundos]], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+_CACHE: dict[str, FundIndex] = {}
+
+
+def load_index(fundos: list[Fundo], path: str | Path | None = None) -> FundIndex:
+    """Índice em memória/disco; só reconstrói quando a lista de fundos muda."""
+    sig = _signature(fundos)
+    if sig in _CACHE:
+        return _CACHE[sig]
+
+    path = Path(path) if path else state_path("fundos_index.pkl")
+    index = None
+    if path.exists():
+        try:
+            with path.open("rb") as fh:
+                saved_sig, saved = pickle.load(fh)
+            if saved_sig == sig:
+                index = saved
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, AttributeError):
+            index = None
+
+    if index is None:
+        index = FundIndex(fundos)
+        for ticker, nomes in index.duplicate_tickers().items():
+            print(f"[AVISO] {ticker} tem {len(nomes)} nomes cadastrados: {nomes}")
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("wb") as fh:
+            pickle.dump((sig, index), fh)
+        tmp.replace(path)
+
+    _CACHE[sig] = index
+    return index
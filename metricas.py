@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Iterator
+
+from config import STATE_DIR
+
+
+PREFIX = "fnet"
+
+_NULL = nullcontext()
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(key: tuple) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in key) + "}"
+
+
+class Metrics:
+    """
+    Instrumentação leve do pipeline coleta -> filtro -> email.
+    - span(): duração de cada etapa (log JSON por evento + soma/contagem por nome)
+    - inc(): contadores (retries, fallbacks, stale...)
+    - gauge(): valores pontuais (linhas antes/depois de cada filtro)
+    - flush(): grava o textfile do Prometheus (node_exporter textfile collector)
+    Desligado (padrão), todas as chamadas retornam de imediato.
+    """
+
+    def __init__(self, enabled: bool = False, log_path: str | Path | None = None, prom_path: str | Path | None = None):
+        self.enabled = enabled
+        self.log_path = Path(log_path) if log_path else None
+        self.prom_path = Path(prom_path) if prom_path else STATE_DIR / "metrics.prom"
+        self._lock = threading.Lock()
+        self.counters: dict[tuple[str, tuple], float] = defaultdict(float)
+        self.gauges: dict[tuple[str, tuple], float] = {}
+        self.span_sum: dict[tuple[str, tuple], float] = defaultdict(float)
+        self.span_count: dict[tuple[str, tuple], int] = defaultdict(int)
+        self.span_last: dict[tuple[str, tuple], float] = {}
+
+    @classmethod
+    def from_env(cls) -> Metrics:
+        return cls(
+            enabled=os.environ.get("FNET_METRICS", "") == "1",
+            log_path=os.environ.get("FNET_METRICS_LOG") or None,
+            prom_path=os.environ.get("FNET_METRICS_PROM") or None,
+        )
+
+    def _emit(self, event: dict):
+        line = json.dumps({"ts": round(time.time(), 3), **event}, ensure_ascii=False, default=str)
+        if self.log_path:
+            with self._lock, self.log_path.open("a", encoding="utf-8") as fh:
+                fh.write(line + "\n")
+        else:
+            print(line, file=sys.stderr)
+
+    def span(self, name: str, **labels):
+        if not self.enabled:
+            return _NULL
+        return self._span(name, labels)
+
+    @contextmanager
+    def _span(self, name: str, labels: dict) -> Iterator[None]:
+        t0 = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "erro"
+            raise
+        finally:
+            elapsed = time.perf_counter() - t0
+            self.observe(name, elapsed, **labels)
+            self._emit({"event": "span", "name": name, "duration_s": round(elapsed, 6), "status": status, **labels})
+
+    def observe(self, name: str, seconds: float, **labels):
+        """Registra uma duração já medida (ex.: esperas do WebDriverWait)."""
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.span_sum[key] += seconds
+            self.span_count[key] += 1
+            self.span_last[key] = seconds
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[(name, _label_key(labels))] += value
+
+    def gauge(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.gauges[(name, _label_key(labels))] = value
+        self._emit({"event": "gauge", "name": name, "value": value, **labels})
+
+    def prometheus_text(self) -> str:
+        lines: list[str] = []
+        with self._lock:
+            if self.span_sum:
+                lines.append(f"# TYPE {PREFIX}_span_seconds summary")
+                for (name, key), total in sorted(self.span_sum.items()):
+                    lbl = _fmt_labels((("span", name),) + key)
+                    lines.append(f"{PREFIX}_span_seconds_sum{lbl} {total:.6f}")
+                    lines.append(f"{PREFIX}_span_seconds_count{lbl} {self.span_count[(name, key)]}")
+                lines.append(f"# TYPE {PREFIX}_span_last_seconds gauge")
+                for (name, key), last in sorted(self.span_last.items()):
+                    lines.append(f"{PREFIX}_span_last_seconds{_fmt_labels((('span', name),) + key)} {last:.6f}")
+            for suffix, kind, values in (("_total", "counter", self.counters), ("", "gauge", self.gauges)):
+                seen = set()
+                for (name, key), value in sorted(values.items()):
+                    metric = f"{PREFIX}_{name}{suffix}"
+                    if metric not in seen:
+                        lines.append(f"# TYPE {metric} {kind}")
+                        seen.add(metric)
+                    lines.append(f"{metric}{_fmt_labels(key)} {value:g}")
+        lines.append(f"# TYPE {PREFIX}_last_run_timestamp_seconds gauge")
+        lines.append(f"{PREFIX}_last_run_timestamp_seconds {time.time():.0f}")
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        if not self.enabled:
+            return
+        self.prom_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.prom_path.with_suffix(".tmp")
+        tmp.write_text(self.prometheus_text(), encoding="utf-8")
+        tmp.replace(self.prom_path)
+
+
+METRICS = Metrics.from_env()
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import signal
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import requests
+
+from estado import DocStore
+from fnet_http import FnetClient
+from metricas import METRICS
+from notificacao import compartilhado
+
+
+INTERVAL_S = 120.0
+JITTER = 0.2
+MAX_BACKOFF_S = 1800.0
+
+
+def probe(client: FnetClient, data_inicial: date) -> tuple[int, str]:
+    """Consulta de 1 linha: (total de registros desde data_inicial, DocNumber mais recente)."""
+    payload = client.fetch_page(client.build_params(data_inicial, start=0, length=1))
+    records = payload.get("data") or []
+    total = int(payload.get("recordsFiltered") or payload.get("recordsTotal") or 0)
+    return total, str(records[0].get("id", "")) if records else ""
+
+
+def jittered(seconds: float, jitter: float = JITTER) -> float:
+    return seconds * (1 + random.uniform(-jitter, jitter))
+
+
+class Monitor:
+    """
+    Polling contínuo do FNET:
+    - a cada ciclo, uma consulta de 1 linha (probe); se total e primeiro DocNumber não
+      mudaram (ou o mais recente já está no DocStore), não faz mais nada
+    - se mudou, roda a coleta incremental -> filtro -> email (run_once)
+    - intervalo com jitter; erros aumentam o intervalo exponencialmente até max_backoff_s
+    - probe falhando (ex.: HTTP bloqueado) ainda coleta, mas também com o intervalo em backoff
+    """
+
+    def __init__(
+        self,
+        interval_s: float = INTERVAL_S,
+        max_backoff_s: float = MAX_BACKOFF_S,
+        backend: str = "http",
+        pushdown: bool = False,
+        download: bool = False,
+        extrair_texto: bool = False,
+        client: FnetClient | None = None,
+    ):
+        self.interval_s = interval_s
+        self.max_backoff_s = max_backoff_s
+        self.backend = backend
+        self.pushdown = pushdown
+        self.download = download
+        self.extrair_texto = extrair_texto
+        self.client = client or FnetClient()
+        self.stop_event = threading.Event()
+        self.marker: tuple[int, str] | None = None
+        self.failures = 0
+        self.probe_failures = 0
+        # chaves do outbox deste pipeline (retrive_fii.email_chaves), conhecidas depois do primeiro run
+        self.chaves: list[tuple[str, str]] | None = None
+
+    @classmethod
+    def from_env(cls) -> Monitor:
+        return cls(
+            interval_s=float(os.environ.get("FNET_POLL_INTERVAL", INTERVAL_S)),
+            backend=os.environ.get("FNET_BACKEND", "http"),
+            pushdown=os.environ.get("FNET_PUSHDOWN", "") == "1",
+            download=os.environ.get("FNET_DOWNLOAD", "") == "1",
+            extrair_texto=os.environ.get("FNET_TEXTO", "") == "1",
+        )
+
+    def changed(self, store: DocStore, data_inicial: date) -> bool:
+        try:
+            with METRICS.span("poll_probe"):
+                marker = probe(self.client, data_inicial)
+        except (requests.RequestException, ValueError) as e:
+            # sem a consulta barata (ex.: HTTP bloqueado), faz o ciclo completo -- mas conta a
+            # falha: o próximo ciclo espera mais (next_delay), em vez de coletar tudo a cada poll
+            self.probe_failures += 1
+            METRICS.inc("poll_probe_errors")
+            print(f"[AVISO] Probe falhou ({e}); coletando mesmo assim (falha {self.probe_failures}).")
+            return True
+        self.probe_failures = 0
+        if marker == self.marker:
+            return False
+        first_run = self.marker is None
+        self.marker = marker
+        if first_run and marker[1] and store.known([marker[1]]):
+            return False
+        return True
+
+    def cycle(self, store: DocStore) -> int:
+        """Um ciclo; devolve quantos documentos novos foram processados."""
+        # emails que falharam em ciclos anteriores saem assim que o backoff vence. Direto no
+        # outbox compartilhado: um ciclo sem novidade não importa o retrive_fii
+        if self.chaves is not None:
+            compartilhado().flush(self.chaves)
+
+        data_inicial = date.today() - timedelta(days=1)
+        METRICS.inc("polls")
+        if not self.changed(store, data_inicial):
+            return 0
+        METRICS.inc("poll_changes")
+        # importado aqui: retrive_fii puxa selenium/pyarrow, que o probe não precisa
+        from retrive_fii import email_chaves, run_once
+
+        primeiro = self.chaves is None
+        self.chaves = email_chaves()  # recalculadas a cada run: os assinantes têm hot reload
+        if primeiro:
+            # o que ficou no outbox de execuções anteriores
+            compartilhado().flush(self.chaves)
+        with METRICS.span("run", backend=self.backend):
+            novos = run_once(
+                data_inicial, store, backend=self.backend, download=self.download, pushdown=self.pushdown,
+                extrair_texto=self.extrair_texto,
+            )
+        if novos:
+            print(f"[{datetime.now():%H:%M:%S}] {novos} documento(s) novo(s) processado(s).")
+        return novos
+
+    def next_delay(self) -> float:
+        falhas = max(self.failures, self.probe_failures)
+        if falhas:
+            return min(self.max_backoff_s, jittered(self.interval_s * 2 ** falhas))
+        return jittered(self.interval_s)
+
+    def run(self, max_cycles: int | None = None):
+        cycles = 0
+        try:
+            with DocStore() as store:
+                while not self.stop_event.is_set():
+                    try:
+                        self.cycle(store)
+                        self.failures = 0
+                    except Exception as e:
+                        self.failures += 1
+                        self.marker = None  # reprocessa no próximo ciclo
+                        METRICS.inc("poll_errors")
+                        print(f"[ERRO] Ciclo falhou ({e}); tentativa {self.failures}.")
+                    finally:
+                        METRICS.gauge("poll_last_timestamp_seconds", time.time())
+                        METRICS.flush()
+                    cycles += 1
+                    if max_cycles is not None and cycles >= max_cycles:
+                        break
+                    self.stop_event.wait(self.next_delay())
+        finally:
+            self.client.close()
+
+    def stop(self, *_):
+        self.stop_event.set()
+
+
+# monitores rodando neste processo (o seiko.py run para todos no SIGTERM/SIGINT)
+ATIVOS: list[Monitor] = []
+
+
+def stop_all(*_):
+    for monitor in list(ATIVOS):
+        monitor.stop()
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Monitora o FNET continuamente e notifica documentos novos.")
+    parser.add_argument("--interval", type=float, help=f"segundos entre consultas (padrão {INTERVAL_S:g})")
+    parser.add_argument("--max-backoff", type=float, default=MAX_BACKOFF_S)
+    parser.add_argument("--cycles", type=int, help="para depois de N ciclos")
+    args = parser.parse_args(argv)
+
+    monitor = Monitor.from_env()
+    if args.interval:
+        monitor.interval_s = args.interval
+    monitor.max_backoff_s = args.max_backoff
+    if threading.current_thread() is threading.main_thread():
+        # rodando como job do seiko.py (outra thread), quem trata os sinais é o orquestrador
+        signal.signal(signal.SIGTERM, monitor.stop)
+        signal.signal(signal.SIGINT, monitor.stop)
+    print(f"Monitorando o FNET a cada ~{monitor.interval_s:g}s (backend {monitor.backend}).")
+    ATIVOS.append(monitor)
+    try:
+        monitor.run(max_cycles=args.cycles)
+    finally:
+        ATIVOS.remove(monitor)
+
+
+if __name__ == "__main__":
+    main()
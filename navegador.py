@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from selenium import webdriver
+
+from config import STATE_DIR
+
+
+# recursos que o scraper nunca usa (padrões do Network.setBlockedURLs)
+BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.ico", "*.webp", "*.bmp",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.mp3",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+]
+# CSS fica liberado por padrão: select2/DataTables escondem elementos via CSS e as
+# esperas por visibilidade (select2_by_text_click) dependem disso
+BLOCKED_CSS = ["*.css"]
+
+CHROME_BINARIES = ["google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome"]
+ULTIMOS = 50  # startups/carregamentos guardados um a um; o resto só entra nos agregados
+
+
+@dataclass
+class DriverTimings:
+    """
+    Startup de cada driver (por session_id) e carregamentos de página: só os ULTIMOS
+    ficam guardados, o total vai em contagem/soma/máximo (o monitor roda indefinidamente
+    com o mesmo manager, um driver por ciclo).
+    """
+
+    startups: deque[tuple[str, float]] = field(default_factory=lambda: deque(maxlen=ULTIMOS))
+    page_loads: deque[tuple[str, float]] = field(default_factory=lambda: deque(maxlen=ULTIMOS))
+    n_page_loads: int = 0
+    page_load_total_s: float = 0.0
+    page_load_max_s: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def startup(self, session_id: str, seconds: float):
+        with self._lock:
+            self.startups.append((session_id, seconds))
+
+    def page_load(self, url: str, seconds: float):
+        with self._lock:
+            self.page_loads.append((url, seconds))
+            self.n_page_loads += 1
+            self.page_load_total_s += seconds
+            self.page_load_max_s = max(self.page_load_max_s, seconds)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "startup_s": {s: round(t, 3) for s, t in self.startups},
+                "page_loads": self.n_page_loads,
+                "page_load_mean_s": round(self.page_load_total_s / self.n_page_loads, 3) if self.n_page_loads else 0.0,
+                "page_load_max_s": round(self.page_load_max_s, 3),
+                "ultimas": [(u, round(t, 3)) for u, t in self.page_loads],
+            }
+
+
+class DriverManager:
+    """
+    Sessões de Chrome mais leves e quentes.
+    - bloqueia imagens/fontes/mídia (e CSS, se block_css) via CDP; page_load_strategy "eager"
+    - daemon: mantém um Chrome headless vivo entre execuções (perfil persistente em
+      STATE_DIR/chrome-profile) e só conecta nele via remote debugging
+    - timings: tempo de startup e de cada carregamento de página
+    - capture_network: liga o log de performance (eventos CDP Network.*) para o XhrCapture
+    Um perfil só pode ser usado por um Chrome por vez; para vários drivers em paralelo
+    (backfill) use o manager sem daemon.
+    """
+
+    def __init__(
+        self,
+        headless: bool = True,
+        block_css: bool = False,
+        eager: bool = True,
+        daemon: bool = False,
+        profile_dir: str | Path | None = None,
+        debug_port: int = 9222,
+        capture_network: bool = False,
+    ):
+        self.headless = headless
+        self.block_css = block_css
+        self.eager = eager
+        self.daemon = daemon
+        self.profile_dir = Path(profile_dir) if profile_dir else (STATE_DIR / "chrome-profile" if daemon else None)
+        self.debug_port = debug_port
+        self.capture_network = capture_network
+        self.timings = DriverTimings()
+
+    @classmethod
+    def from_env(cls) -> DriverManager:
+        return cls(
+            block_css=os.environ.get("FNET_BLOCK_CSS", "") == "1",
+            daemon=os.environ.get("FNET_CHROME_DAEMON", "") == "1",
+            capture_network=os.environ.get("FNET_PAGING", "") == "cdp",
+        )
+
+    def chrome_args(self) -> list[str]:
+        args = [
+            "--no-sandbox",
+            "--disable-dev-shm-usage",
+            "--window-size=1920,1080",
+            "--blink-settings=imagesEnabled=false",
+            "--disable-extensions",
+            "--disable-background-networking",
+            "--disable-component-update",
+            "--disable-sync",
+            "--no-first-run",
+            "--mute-audio",
+        ]
+        if self.headless:
+            args.insert(0, "--headless=new")
+        if self.profile_dir:
+            args.append(f"--user-data-dir={Path(self.profile_dir).resolve()}")
+        return args
+
+    def options(self) -> webdriver.ChromeOptions:
+        opts = webdriver.ChromeOptions()
+        if self.eager:
+            opts.page_load_strategy = "eager"
+        if self.capture_network:
+            # eventos Network.* no log "performance" (lidos pelo XhrCapture)
+            opts.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+        if self.daemon:
+            opts.debugger_address = f"127.0.0.1:{self.ensure_daemon()}"
+            return opts
+        for arg in self.chrome_args():
+            opts.add_argument(arg)
+        opts.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.fonts": 2,
+        })
+        return opts
+
+    def block_resources(self, driver):
+        patterns = BLOCKED_URLS + (BLOCKED_CSS if self.block_css else [])
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+
+    def start(self) -> webdriver.Chrome:
+        t0 = time.perf_counter()
+        driver = webdriver.Chrome(options=self.options())
+        self.block_resources(driver)
+        self.timings.startup(driver.session_id, time.perf_counter() - t0)
+        return driver
+
+    def get(self, driver, url: str) -> float:
+        t0 = time.perf_counter()
+        driver.get(url)
+        elapsed = time.perf_counter() - t0
+        self.timings.page_load(url, elapsed)
+        return elapsed
+
+    def quit(self, driver):
+        try:
+            if self.daemon:
+                # só derruba o chromedriver; o Chrome do daemon continua quente
+                driver.service.stop()
+            else:
+                driver.quit()
+        except Exception:
+            pass
+
+    # --- daemon ---------------------------------------------------------------
+
+    def _daemon_file(self) -> Path:
+        return STATE_DIR / "chrome-daemon.json"
+
+    @staticmethod
+    def _port_open(port: int) -> bool:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.settimeout(0.5)
+            return s.connect_ex(("127.0.0.1", port)) == 0
+
+    @staticmethod
+    def _is_devtools(port: int) -> bool:
+        """A porta responde como um Chrome DevTools (GET /json/version), e não outro processo qualquer."""
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/json/version", timeout=1) as resp:
+                info = json.loads(resp.read())
+        except (urllib.error.URLError, OSError, ValueError):
+            return False
+        return isinstance(info, dict) and "Browser" in info and "webSocketDebuggerUrl" in info
+
+    @staticmethod
+    def chrome_binary() -> str:
+        env = os.environ.get("CHROME_BIN")
+        if env:
+            return env
+        for name in CHROME_BINARIES:
+            path = shutil.which(name)
+            if path:
+                return path
+        raise RuntimeError("Chrome não encontrado (defina CHROME_BIN).")
+
+    def ensure_daemon(self, timeout: float = 15) -> int:
+        """Sobe (se preciso) o Chrome persistente e devolve a porta de debugging."""
+        info_path = self._daemon_file()
+        if info_path.exists():
+            info = json.loads(info_path.read_text())
+            if self._is_devtools(info["port"]):
+                return info["port"]
+
+        port = self.debug_port
+        if self._port_open(port):
+            if self._is_devtools(port):
+                # Chrome com debugging já aberto nessa porta (ex.: subido à mão): reaproveita
+                return port
+            raise RuntimeError(f"Porta {port} ocupada por algo que não é o Chrome DevTools.")
+        cmd = [self.chrome_binary(), *self.chrome_args(), f"--remote-debugging-port={port}", "about:blank"]
+        proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        deadline = time.monotonic() + timeout
+        while not self._is_devtools(port):
+            if proc.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("Não consegui subir o Chrome em modo daemon.")
+            time.sleep(0.1)
+
+        info_path.parent.mkdir(parents=True, exist_ok=True)
+        info_path.write_text(json.dumps({"pid": proc.pid, "port": port}))
+        return port
+
+    def stop_daemon(self):
+        info_path = self._daemon_file()
+        if not info_path.exists():
+            return
+        info = json.loads(info_path.read_text())
+        try:
+            os.kill(info["pid"], 15)
+        except OSError:
+            pass
+        info_path.unlink(missing_ok=True)
+
+
+class XhrCapture:
+    """
+    Acompanha as requisições XHR cujo URL contém `url_part` pelos eventos CDP
+    Network.* do log de performance e lê o corpo da resposta via Network.getResponseBody.
+    Requer um driver criado com capture_network=True.
+    """
+
+    def __init__(self, driver, url_part: str):
+        self.driver = driver
+        self.url_part = url_part
+        self.pending: dict[str, str] = {}
+        self.finished: list[str] = []
+        self.failed: list[str] = []
+
+    def poll(self):
+        for entry in self.driver.get_log("performance"):
+            msg = json.loads(entry["message"]).get("message", {})
+            method = msg.get("method")
+            params = msg.get("params", {})
+            request_id = params.get("requestId")
+            if method == "Network.requestWillBeSent":
+                if self.url_part in params.get("request", {}).get("url", ""):
+                    self.pending[request_id] = params["request"]["url"]
+            elif method == "Network.loadingFinished" and request_id in self.pending:
+                self.pending.pop(request_id)
+                self.finished.append(request_id)
+            elif method == "Network.loadingFailed" and request_id in self.pending:
+                self.pending.pop(request_id)
+                self.failed.append(request_id)
+
+    def wait(self, after: int, timeout: float, poll_s: float = 0.05) -> str | None:
+        """
+        Espera existir mais de `after` respostas concluídas e nenhuma pendente;
+        devolve o requestId da mais recente (ou None no timeout).
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            self.poll()
+            if len(self.finished) > after and not self.pending:
+                return self.finished[-1]
+            if time.monotonic() > deadline:
+                return None
+            time.sleep(poll_s)
+
+    def json_body(self, request_id: str):
+        res = self.driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+        body = res.get("body", "")
+        if res.get("base64Encoded"):
+            body = base64.b64decode(body).decode("utf-8")
+        return json.loads(body)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Controla o Chrome persistente (modo daemon).")
+    parser.add_argument("acao", choices=["start", "stop", "status"])
+    args = parser.parse_args(argv)
+
+    manager = DriverManager(daemon=True)
+    if args.acao == "start":
+        print(f"Chrome daemon na porta {manager.ensure_daemon()}.")
+    elif args.acao == "stop":
+        manager.stop_daemon()
+        print("Chrome daemon parado.")
+    else:
+        info = manager._daemon_file()
+        vivo = info.exists() and manager._is_devtools(json.loads(info.read_text())["port"])
+        print("rodando" if vivo else "parado")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+from __future__ import annotations
+
+import argparse
+import json
+import mimetypes
+import os
+import random
+import smtplib
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from email.message import EmailMessage
+from pathlib import Path
+from typing import Iterable
+
+from config import state_path
+from metricas import METRICS
+
+
+SMTP_HOST = "smtp.gmail.com"
+SMTP_PORT = 587
+MAX_TENTATIVAS = 8
+BACKOFF_S = 60.0
+MAX_BACKOFF_S = 3600.0
+IDLE_S = 120.0  # conexão parada há mais que isso é testada (NOOP) antes de reusar
+
+INTRO = "Olá,\n\nSeguem os documentos:\n\n"
+
+
+def _grupo(to: Iterable[str]) -> str:
+    return ",".join(sorted({t.strip().lower() for t in to if t and t.strip()}))
+
+
+def chave(to: Iterable[str], subject: str) -> tuple[str, str]:
+    """(grupo, assunto): unidade de agrupamento do flush e o que cada pipeline drena."""
+    return _grupo(to), subject
+
+
+class Mailer:
+    """
+    Conexão SMTP reaproveitada entre envios (e entre ciclos do monitor).
+    security: "starttls" (padrão, Gmail 587), "ssl" (465) ou "none" (relay local / teste).
+    """
+
+    def __init__(
+        self,
+        host: str = SMTP_HOST,
+        port: int = SMTP_PORT,
+        user: str = "",
+        password: str = "",
+        security: str = "starttls",
+        sender: str | None = None,
+        timeout: float = 30,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.security = security
+        self.sender = sender or user or "fnet@localhost"
+        self.timeout = timeout
+        self._conn: smtplib.SMTP | None = None
+        self._last_use = 0.0
+        self.connects = 0
+
+    @classmethod
+    def from_env(cls) -> Mailer:
+        """
+        SMTP_HOST/SMTP_PORT/SMTP_SECURITY/SMTP_USER/SMTP_PASS.
+        Credencial só vem do ambiente; sem ela o Notifier só imprime.
+        """
+        return cls(
+            host=os.environ.get("SMTP_HOST", SMTP_HOST),
+            port=int(os.environ.get("SMTP_PORT", SMTP_PORT)),
+            user=os.environ.get("SMTP_USER", ""),
+            password=os.environ.get("SMTP_PASS", ""),
+            security=os.environ.get("SMTP_SECURITY", "starttls"),
+        )
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.user and self.password) or self.security == "none"
+
+    def _connect(self) -> smtplib.SMTP:
+        if self.security == "ssl":
+            conn = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.security == "starttls":
+                conn.starttls()
+        if self.user and self.password:
+            conn.login(self.user, self.password)
+        self.connects += 1
+        return conn
+
+    def connection(self) -> smtplib.SMTP:
+        if self._conn is not None and time.monotonic() - self._last_use > IDLE_S:
+            try:
+                if self._conn.noop()[0] != 250:
+                    raise smtplib.SMTPServerDisconnected("noop")
+            except (smtplib.SMTPException, OSError):
+                self.close()
+        if self._conn is None:
+            self._conn = self._connect()
+        return self._conn
+
+    def send(self, msg: EmailMessage):
+        if msg["From"] is None:
+            msg["From"] = self.sender
+        try:
+            self.connection().send_message(msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # servidor derrubou a conexão ociosa: reconecta uma vez
+            self.close()
+            self.connection().send_message(msg)
+        self._last_use = time.monotonic()
+
+    def close(self):
+        if self._conn is None:
+            return
+        try:
+            self._conn.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._conn = None
+
+
+@dataclass
+class Mensagem:
+    id: int
+    grupo: str
+    destinatarios: list[str]
+    assunto: str
+    linhas: list[str]
+    anexos: list[str]
+    tentativas: int
+
+
+class Outbox:
+    """
+    Fila de emails em SQLite: nada se perde se o envio falhar ou o processo cair.
+    status: pendente -> enviado | falhou (depois de max_tentativas)
+            pendente -> impresso (sem credenciais: só mostrado) -> enviado quando houver SMTP
+    """
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = Path(path) if path else state_path("outbox.sqlite3")
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS mensagens ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " grupo TEXT NOT NULL,"
+            " destinatarios TEXT NOT NULL,"
+            " assunto TEXT NOT NULL,"
+            " linhas TEXT NOT NULL,"
+            " anexos TEXT NOT NULL,"
+            " criado_em REAL NOT NULL,"
+            " tentativas INTEGER NOT NULL DEFAULT 0,"
+            " proximo_envio REAL NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'pendente',"
+            " erro TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS mensagens_fila ON mensagens (status, proximo_envio)")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def enqueue(self, to: Iterable[str], subject: str, lines: list[str], attachments: Iterable[str] = ()) -> int:
+        to = list(to)
+        now = time.time()
+        with self._lock:
+            cur = self.conn.execute(
+                "INSERT INTO mensagens (grupo, destinatarios, assunto, linhas, anexos, criado_em, proximo_envio)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (_grupo(to), json.dumps(to), subject, json.dumps(lines, ensure_ascii=False),
+                 json.dumps([str(a) for a in attachments]), now, now),
+            )
+            self.conn.commit()
+        return cur.lastrowid
+
+    def due(self, now: float | None = None, impressos: bool = False) -> list[Mensagem]:
+        """Vencidas; impressos=True inclui as que só foram mostradas (sem SMTP) e nunca saíram."""
+        status = "('pendente', 'impresso')" if impressos else "('pendente')"
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, grupo, destinatarios, assunto, linhas, anexos, tentativas FROM mensagens"
+                f" WHERE status IN {status} AND proximo_envio <= ? ORDER BY id",
+                (now if now is not None else time.time(),),
+            ).fetchall()
+        return [
+            Mensagem(r[0], r[1], json.loads(r[2]), r[3], json.loads(r[4]), json.loads(r[5]), r[6])
+            for r in rows
+        ]
+
+    def mark_sent(self, ids: list[int]):
+        with self._lock:
+            self.conn.executemany("UPDATE mensagens SET status = 'enviado', erro = NULL WHERE id = ?", [(i,) for i in ids])
+            self.conn.commit()
+
+    def mark_printed(self, ids: list[int]):
+        with self._lock:
+            self.conn.executemany("UPDATE mensagens SET status = 'impresso' WHERE id = ?", [(i,) for i in ids])
+            self.conn.commit()
+
+    def mark_retry(self, ids: list[int], erro: str, max_tentativas: int = MAX_TENTATIVAS):
+        """Reagenda com backoff exponencial (com jitter); depois de max_tentativas desiste."""
+        now = time.time()
+        with self._lock:
+            for i in ids:
+                (tentativas,) = self.conn.execute("SELECT tentativas FROM mensagens WHERE id = ?", (i,)).fetchone()
+                tentativas += 1
+                espera = min(MAX_BACKOFF_S, BACKOFF_S * 2 ** (tentativas - 1)) * (0.5 + random.random())
+                status = "falhou" if tentativas >= max_tentativas else "pendente"
+                self.conn.execute(
+                    "UPDATE mensagens SET tentativas = ?, proximo_envio = ?, status = ?, erro = ? WHERE id = ?",
+                    (tentativas, now + espera, status, erro[:500], i),
+                )
+            self.conn.commit()
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM mensagens GROUP BY status").fetchall())
+
+
+def build_message(to: list[str], subject: str, lines: list[str], attachments: list[str]) -> EmailMessage:
+    msg = EmailMessage()
+    msg["To"] = ", ".join(to)
+    msg["Subject"] = subject
+    msg.set_content(INTRO + "\n".join(lines))
+    for path in attachments:
+        path = Path(path)
+        if not path.exists():
+            print(f"[AVISO] Anexo não encontrado, enviando sem ele: {path}")
+            continue
+        ctype, _ = mimetypes.guess_type(path.name)
+        maintype, subtype = (ctype or "application/octet-stream").split("/", 1)
+        msg.add_attachment(path.read_bytes(), maintype=maintype, subtype=subtype, filename=path.name)
+    return msg
+
+
+class Notifier:
+    """
+    Envio de notificações: enfileira no Outbox e drena agrupando por (destinatários, assunto),
+    numa conexão SMTP reaproveitada. Falhas ficam na fila e são retentadas com backoff.
+    Sem credenciais, só imprime o conteúdo e marca como "impresso": não sai da fila, e o
+    primeiro flush com SMTP configurado envia.
+    """
+
+    def __init__(self, mailer: Mailer | None = None, outbox: Outbox | None = None, max_tentativas: int = MAX_TENTATIVAS):
+        self.mailer = mailer or Mailer.from_env()
+        self._outbox = outbox
+        self.max_tentativas = max_tentativas
+        self._lock = threading.Lock()
+
+    @property
+    def outbox(self) -> Outbox:
+        # aberto só no primeiro uso (importar o módulo não cria arquivos)
+        if self._outbox is None:
+            self._outbox = Outbox()
+        return self._outbox
+
+    def send(self, to: Iterable[str], subject: str, lines: list[str], attachments: Iterable[str] = ()) -> int:
+        to = list(to)
+        self.outbox.enqueue(to, subject, lines, attachments)
+        return self.flush([chave(to, subject)])
+
+    def flush(self, chaves: Iterable[tuple[str, str]] | None = None) -> int:
+        """
+        Envia o que está vencido na fila; devolve quantos emails saíram.
+        chaves: só esses (grupo, assunto) -- o outbox é dividido entre pipelines, e cada um
+        drena só o que é dele; a fila inteira fica com o orquestrador (flush_all).
+        """
+        filtro = set(chaves) if chaves is not None else None
+        with self._lock:
+            grupos: dict[tuple[str, str], list[Mensagem]] = {}
+            for m in self.outbox.due(impressos=self.mailer.configured):
+                if filtro is None or (m.grupo, m.assunto) in filtro:
+                    grupos.setdefault((m.grupo, m.assunto), []).append(m)
+
+            enviados = 0
+            for (_, assunto), msgs in grupos.items():
+                ids = [m.id for m in msgs]
+                linhas = list(dict.fromkeys(line for m in msgs for line in m.linhas))
+                anexos = list(dict.fromkeys(a for m in msgs for a in m.anexos))
+                if not self.mailer.configured:
+                    print("\n[AVISO] SMTP sem credenciais (SMTP_USER/SMTP_PASS). Não vou enviar email.")
+                    print("\nConteúdo que iria no email:\n")
+                    print("\n".join(linhas))
+                    for a in anexos:
+                        print(" - anexo:", a)
+                    self.outbox.mark_printed(ids)
+                    continue
+                try:
+                    with METRICS.span("smtp"):
+                        self.mailer.send(build_message(msgs[0].destinatarios, assunto, linhas, anexos))
+                except (smtplib.SMTPException, OSError) as e:
+                    METRICS.inc("email_retries")
+                    self.mailer.close()
+                    self.outbox.mark_retry(ids, str(e), self.max_tentativas)
+                    print(f"[AVISO] Envio para {msgs[0].grupo} falhou ({e}); fica na fila para nova tentativa.")
+                    continue
+                self.outbox.mark_sent(ids)
+                enviados += 1
+                METRICS.inc("emails_sent")
+                print(f"Email enviado para {msgs[0].grupo} com {len(linhas)} linhas"
+                      f"{f' e {len(anexos)} anexo(s)' if anexos else ''} ({len(msgs)} mensagem(ns) agrupada(s)).")
+            return enviados
+
+    def close(self):
+        with self._lock:
+            self.mailer.close()
+
+
+_COMPARTILHADOS: dict[tuple[str, int, str], Notifier] = {}
+_COMPARTILHADOS_LOCK = threading.Lock()
+
+
+def compartilhado() -> Notifier:
+    """
+    Um Notifier por servidor/usuário SMTP no processo: pipelines que rodam juntos
+    (seiko.py run) dividem a conexão SMTP e o outbox (configuração do Mailer.from_env).
+    Quem fecha é o dono do processo (seiko.py ou o __main__ do módulo), via close_all;
+    um job não fecha o que os outros ainda usam.
+    """
+    mailer = Mailer.from_env()
+    with _COMPARTILHADOS_LOCK:
+        return _COMPARTILHADOS.setdefault((mailer.host, mailer.port, mailer.user), Notifier(mailer))
+
+
+def flush_all() -> int:
+    with _COMPARTILHADOS_LOCK:
+        notifiers = list(_COMPARTILHADOS.values())
+    return sum(notifier.flush() for notifier in notifiers)
+
+
+def close_all():
+    with _COMPARTILHADOS_LOCK:
+        notifiers = list(_COMPARTILHADOS.values())
+    for notifier in notifiers:
+        notifier.close()
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Fila de emails (outbox).")
+    parser.add_argument("acao", choices=["flush", "status"])
+    args = parser.parse_args(argv)
+
+    notifier = Notifier()
+    if args.acao == "flush":
+        if not notifier.mailer.configured:
+            # sem credenciais o flush só imprimiria e descartaria a fila
+            parser.error("defina SMTP_USER/SMTP_PASS (ou SMTP_SECURITY=none) para drenar a fila")
+        print(f"{notifier.flush()} email(s) enviado(s).")
+        notifier.close()
+    print(notifier.outbox.counts())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+from __future__ import annotations
+
+import argparse
+import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from itertools import product
+from pathlib import Path
+from typing import Iterator
+
+import pandas as pd
+import requests
+from bs4 import BeautifulSoup
+
+from config import STATE_DIR
+from estado import DocStore, until_known
+from fnet_http import BASE_URL, ENDPOINT_PAGINA, TIPO_FUNDO_FII, FnetClient
+from fundos import Fundo, cnpj_digits
+from metricas import METRICS
+from texto import normalize
+
+
+# tipos de uma categoria (a página carrega via XHR ao escolher a categoria)
+ENDPOINT_TIPOS = "listarTodosTiposPorCategoriaETipoFundo"
+CATALOGO_MAX_AGE_S = 7 * 24 * 3600
+# acima disso, uma consulta por fundo custa mais do que baixar a categoria inteira
+MAX_FUND_QUERIES = 10
+CONCURRENCY = 4
+
+
+@dataclass
+class Catalogo:
+    """
+    IDs de categoria/tipo do FNET.
+    tipos[id_categoria] ausente ou vazio = tipos desconhecidos (a consulta não filtra por tipo).
+    """
+
+    categorias: dict[int, str] = field(default_factory=dict)
+    tipos: dict[int, dict[int, str]] = field(default_factory=dict)
+
+    def to_json(self) -> dict:
+        return {
+            "categorias": {str(k): v for k, v in self.categorias.items()},
+            "tipos": {str(c): {str(k): v for k, v in t.items()} for c, t in self.tipos.items()},
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> Catalogo:
+        return cls(
+            categorias={int(k): v for k, v in data.get("categorias", {}).items()},
+            tipos={int(c): {int(k): v for k, v in t.items()} for c, t in data.get("tipos", {}).items()},
+        )
+
+
+def parse_categorias(html: str | bytes) -> dict[int, str]:
+    """Opções do <select id="categoriaDocumento"> da página (id 0 = "Todos")."""
+    soup = BeautifulSoup(html, "html.parser")
+    select = soup.find("select", id="categoriaDocumento")
+    if select is None:
+        return {}
+    out = {}
+    for opt in select.find_all("option"):
+        value = (opt.get("value") or "").strip()
+        if value.isdigit() and int(value) != 0:
+            out[int(value)] = opt.get_text(" ", strip=True)
+    return out
+
+
+def parse_tipos(payload) -> dict[int, str]:
+    """Lista [{"id": ..., "descricao": ...}] devolvida pelo endpoint de tipos."""
+    if isinstance(payload, dict):
+        payload = payload.get("data") or payload.get("tipos") or []
+    out = {}
+    for item in payload or []:
+        if not isinstance(item, dict) or item.get("id") is None:
+            continue
+        nome = item.get("descricao") or item.get("nome") or ""
+        if int(item["id"]) != 0 and nome:
+            out[int(item["id"])] = str(nome).strip()
+    return out
+
+
+def fetch_catalogo(client: FnetClient, categorias_alvo: list[str] | None = None) -> Catalogo:
+    """
+    Lê as categorias da página e os tipos das categorias que casam com `categorias_alvo`
+    (todas, se None). Falhas nos tipos (ou lista vazia) deixam a categoria sem tipos conhecidos.
+    """
+    resp = client.session.get(f"{client.base_url}/{ENDPOINT_PAGINA}", timeout=client.timeout)
+    resp.raise_for_status()
+    client._warm = True
+    catalogo = Catalogo(categorias=parse_categorias(resp.content))
+
+    ids = list(catalogo.categorias)
+    if categorias_alvo:
+        ids = match_ids(catalogo.categorias, categorias_alvo)
+    for id_cat in ids:
+        try:
+            r = client.session.get(
+                f"{client.base_url}/{ENDPOINT_TIPOS}",
+                params={"idCategoria": id_cat, "tipoFundo": TIPO_FUNDO_FII},
+                timeout=client.timeout,
+            )
+            r.raise_for_status()
+            tipos = parse_tipos(r.json())
+        except (requests.RequestException, ValueError):
+            continue
+        if tipos:
+            catalogo.tipos[id_cat] = tipos
+    return catalogo
+
+
+def load_catalogo(
+    client: FnetClient,
+    path: str | Path | None = None,
+    max_age_s: float = CATALOGO_MAX_AGE_S,
+) -> Catalogo:
+    """Catálogo em cache no STATE_DIR (por base_url); renovado quando passa de max_age_s."""
+    path = Path(path) if path else STATE_DIR / "fnet_catalogo.json"
+    if path.exists() and time.time() - path.stat().st_mtime < max_age_s:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if data.get("base_url") == client.base_url:
+            return Catalogo.from_json(data)
+    catalogo = fetch_catalogo(client)
+    if catalogo.categorias:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        data = {"base_url": client.base_url, **catalogo.to_json()}
+        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=1), encoding="utf-8")
+        tmp.replace(path)
+    return catalogo
+
+
+def match_ids(opcoes: dict[int, str], termos: list[str]) -> list[int]:
+    """IDs cujo nome contém algum dos termos (mesma regra de filter_df: normalizado, 'contains')."""
+    termos = [normalize(t) for t in termos if normalize(t)]
+    return [i for i, nome in opcoes.items() if any(t in normalize(nome) for t in termos)]
+
+
+@dataclass(frozen=True)
+class Consulta:
+    """Uma consulta ao endpoint; 0 = sem filtro naquele campo (como na página)."""
+
+    id_categoria: int = 0
+    id_tipo: int = 0
+    cnpj: str = ""
+
+    def filtros(self) -> dict:
+        out = {"idCategoriaDocumento": self.id_categoria, "idTipoDocumento": self.id_tipo}
+        if self.cnpj:
+            out["cnpjFundo"] = self.cnpj
+        return out
+
+
+def plan(
+    catalogo: Catalogo,
+    categorias: list[str],
+    tipos: list[str],
+    fundos: list[Fundo] | None = None,
+    max_fund_queries: int = MAX_FUND_QUERIES,
+) -> list[Consulta]:
+    """
+    Traduz as regras de filter_df (fundo E categoria E tipo, por 'contains') em consultas
+    do FNET. O resultado é sempre um superconjunto do que filter_df aceitaria:
+    - categoria sem ID resolvido -> consulta sem filtro de categoria
+    - categoria com tipos conhecidos e nenhum casando -> descartada (filter_df nunca aceitaria)
+    - categoria com tipos desconhecidos (sem entrada ou {}) -> consulta só pela categoria
+    - fundo só vira filtro se todos os monitorados tiverem CNPJ e couberem em max_fund_queries
+    Lista vazia = nenhuma linha pode passar no filtro.
+    """
+    termos_cat = [t for t in categorias if normalize(t)]
+    termos_tipo = [t for t in tipos if normalize(t)]
+
+    pares: list[tuple[int, int]] = []
+    if not termos_cat:
+        ids_cat = [0]
+    else:
+        ids_cat = match_ids(catalogo.categorias, termos_cat)
+        if not ids_cat:
+            # nomes do catálogo não batem com as regras (catálogo vazio ou mudou): sem pushdown
+            ids_cat = [0]
+    for id_cat in ids_cat:
+        conhecidos = catalogo.tipos.get(id_cat) if id_cat else None
+        if not termos_tipo or not conhecidos:
+            pares.append((id_cat, 0))
+            continue
+        pares.extend((id_cat, id_tipo) for id_tipo in match_ids(conhecidos, termos_tipo))
+
+    cnpjs = [""]
+    if fundos:
+        if all(f.cnpjs for f in fundos) and sum(len(f.cnpjs) for f in fundos) <= max_fund_queries:
+            cnpjs = sorted({cnpj_digits(c) for f in fundos for c in f.cnpjs})
+    return [Consulta(c, t, cnpj) for (c, t), cnpj in product(pares, cnpjs)]
+
+
+def _cobre(a: Consulta, b: Consulta) -> bool:
+    """a devolve tudo o que b devolve."""
+    return (
+        a.id_categoria in (0, b.id_categoria)
+        and a.id_tipo in (0, b.id_tipo)
+        and a.cnpj in ("", b.cnpj)
+    )
+
+
+def plan_all(catalogo: Catalogo, regras: list[tuple[list[str], list[str], list[Fundo] | None]]) -> list[Consulta]:
+    """União dos planos de vários conjuntos de regras (categorias, tipos, fundos), sem consultas redundantes."""
+    consultas = list(dict.fromkeys(c for cats, tipos, fundos in regras for c in plan(catalogo, cats, tipos, fundos)))
+    return [b for b in consultas if not any(a != b and _cobre(a, b) for a in consultas)]
+
+
+def merge(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """Une os resultados das consultas, sem duplicatas, mais recente primeiro."""
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame()
+    data = pd.concat(frames, ignore_index=True).drop_duplicates(subset="DocNumber", keep="first")
+    entrega = pd.to_datetime(data["Data de Entrega"], format="%d/%m/%Y %H:%M", errors="coerce")
+    order = entrega.sort_values(ascending=False, kind="stable").index
+    return data.loc[order].reset_index(drop=True)
+
+
+class Planejador:
+    """
+    Coleta só o que as regras podem aceitar: resolve os IDs de categoria/tipo do FNET,
+    monta as consultas com plan() e roda cada uma (concorrentes, numa sessão só, aquecida
+    uma vez). Se o plano custar pelo menos tantas requisições quanto a coleta completa
+    (uma por consulta, no mínimo), faz a coleta completa.
+    """
+
+    def __init__(
+        self,
+        base_url: str = BASE_URL,
+        concurrency: int = CONCURRENCY,
+        catalogo: Catalogo | None = None,
+        catalogo_path: str | Path | None = None,
+    ):
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.catalogo = catalogo
+        self.catalogo_path = catalogo_path
+
+    def consultas(self, categorias: list[str], tipos: list[str], fundos: list[Fundo] | None = None) -> list[Consulta]:
+        return self.plano([(categorias, tipos, fundos)])
+
+    def plano(
+        self,
+        regras: list[tuple[list[str], list[str], list[Fundo] | None]],
+        client: FnetClient | None = None,
+    ) -> list[Consulta]:
+        if self.catalogo is None:
+            try:
+                if client is not None:
+                    self.catalogo = load_catalogo(client, self.catalogo_path)
+                else:
+                    with FnetClient(base_url=self.base_url) as client:
+                        self.catalogo = load_catalogo(client, self.catalogo_path)
+            except requests.RequestException as e:
+                print(f"[AVISO] Catálogo do FNET indisponível ({e}); consultando sem filtros.")
+                self.catalogo = Catalogo()
+        return plan_all(self.catalogo, regras)
+
+    def collect(
+        self,
+        data_inicial: date,
+        data_final: date | None = None,
+        categorias: list[str] = (),
+        tipos: list[str] = (),
+        fundos: list[Fundo] | None = None,
+        store: DocStore | None = None,
+        regras: list[tuple[list[str], list[str], list[Fundo] | None]] | None = None,
+    ) -> pd.DataFrame:
+        """regras: vários conjuntos (categorias, tipos, fundos), um por assinante; substitui os três primeiros."""
+        return merge(list(self.iter_collect(data_inicial, data_final, categorias, tipos, fundos, store, regras)))
+
+    def iter_collect(
+        self,
+        data_inicial: date,
+        data_final: date | None = None,
+        categorias: list[str] = (),
+        tipos: list[str] = (),
+        fundos: list[Fundo] | None = None,
+        store: DocStore | None = None,
+        regras: list[tuple[list[str], list[str], list[Fundo] | None]] | None = None,
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Páginas das consultas conforme chegam (sem duplicatas entre consultas). As threads
+        escrevem numa fila limitada, então a memória não cresce com o número de páginas.
+        """
+        # um cliente para tudo (catálogo, sondagem e consultas): a sessão é aquecida uma vez
+        # e o pool de conexões comporta as threads
+        with FnetClient(base_url=self.base_url, pool_size=self.concurrency) as client:
+            consultas = self.plano(regras or [(list(categorias), list(tipos), fundos)], client)
+            METRICS.gauge("pushdown_queries", len(consultas))
+            if not consultas:
+                return
+
+            # a primeira página da coleta completa diz quantas páginas ela teria; se o plano
+            # custar pelo menos isso, continua a coleta completa a partir dela (sem requisição extra)
+            primeira = client.fetch_page(client.build_params(data_inicial, data_final))
+            total = int(primeira.get("recordsFiltered") or primeira.get("recordsTotal") or 0)
+            paginas = -(-total // client.page_size)
+            if len(consultas) >= paginas:
+                METRICS.inc("pushdown_fallback")
+                yield from until_known(client.iter_pages(data_inicial, data_final, primeira=primeira), store)
+                return
+
+            yield from self._iter_consultas(client, consultas, data_inicial, data_final, store)
+
+    def _iter_consultas(
+        self,
+        client: FnetClient,
+        consultas: list[Consulta],
+        data_inicial: date,
+        data_final: date | None,
+        store: DocStore | None,
+    ) -> Iterator[pd.DataFrame]:
+        # None = fim de uma consulta
+        fila: queue.Queue[pd.DataFrame | None] = queue.Queue(maxsize=2 * self.concurrency)
+        parar = threading.Event()
+
+        def put(item: pd.DataFrame | None) -> bool:
+            while not parar.is_set():
+                try:
+                    fila.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def run(consulta: Consulta):
+            try:
+                with METRICS.span("pushdown_query", categoria=consulta.id_categoria, tipo=consulta.id_tipo):
+                    pages = client.iter_pages(data_inicial, data_final, **consulta.filtros())
+                    for page in until_known(pages, store):
+                        if not put(page):
+                            return
+            finally:
+                put(None)
+
+        vistos: set[str] = set()
+        executor = ThreadPoolExecutor(max_workers=min(self.concurrency, len(consultas)))
+        try:
+            futures = [executor.submit(run, c) for c in consultas]
+            restantes = len(futures)
+            while restantes:
+                page = fila.get()
+                if page is None:
+                    restantes -= 1
+                    continue
+                # pertinência no set, linha a linha: isin(set) custaria O(vistos) por página
+                if "DocNumber" in page.columns:
+                    page = page.loc[[d not in vistos for d in page["DocNumber"]]]
+                    vistos.update(page["DocNumber"])
+                if not page.empty:
+                    yield page
+            for f in futures:
+                f.result()  # propaga o erro de qualquer consulta
+        finally:
+            parar.set()
+            executor.shutdown(wait=True)
+
+
+def main(argv: list[str] | None = None):
+    from retrive_fii import CHAVES_TIPO, FRASES_CATEGORIA
+
+    parser = argparse.ArgumentParser(description="Mostra as consultas que o pushdown faria ao FNET.")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--refresh", action="store_true", help="ignora o catálogo em cache")
+    parser.add_argument("--collect", action="store_true", help="roda as consultas (desde ontem)")
+    args = parser.parse_args(argv)
+
+    planner = Planejador(base_url=args.base_url)
+    if args.refresh:
+        with FnetClient(base_url=args.base_url) as client:
+            planner.catalogo = load_catalogo(client, max_age_s=0)
+    consultas = planner.consultas(FRASES_CATEGORIA, CHAVES_TIPO)
+    cat = planner.catalogo
+    for c in consultas:
+        nome_cat = cat.categorias.get(c.id_categoria, "(todas)")
+        nome_tipo = cat.tipos.get(c.id_categoria, {}).get(c.id_tipo, "(todos)")
+        print(f"{nome_cat} / {nome_tipo}{' / ' + c.cnpj if c.cnpj else ''}")
+    print(f"{len(consultas)} consulta(s).")
+
+    if args.collect:
+        df = planner.collect(date.today() - timedelta(days=1), categorias=FRASES_CATEGORIA, tipos=CHAVES_TIPO)
+        print(f"{len(df)} documento(s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import bisect
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Iterator, TypeVar
+
+from config import STATE_DIR
+from metricas import METRICS
+
+
+T = TypeVar("T")
+
+# limites dos buckets (s), espaçados em log: 10 ms .. ~160 s
+BUCKETS = [0.01 * 1.25 ** i for i in range(44)]
+JANELA = 200  # amostras por operação
+MIN_AMOSTRAS = 10  # antes disso usa o timeout máximo (comportamento antigo)
+QUANTIL = 0.99
+FOLGA = 3.0  # timeout = quantil x folga
+MIN_TIMEOUT_S = 1.0
+MAX_TIMEOUT_S = 30.0
+MIN_POLL_S = 0.05
+MAX_POLL_S = 0.5
+TENTATIVAS = 3
+BACKOFF_S = 0.2
+MAX_BACKOFF_S = 5.0
+FALHAS_CIRCUITO = 5
+REABRE_S = 60.0
+
+
+class CircuitoAberto(RuntimeError):
+    pass
+
+
+class Histograma:
+    """Histograma das últimas `janela` latências (buckets em log, quantil em O(buckets))."""
+
+    def __init__(self, janela: int = JANELA):
+        self.amostras: deque[float] = deque(maxlen=janela)
+        self.contagem = [0] * (len(BUCKETS) + 1)
+
+    def add(self, segundos: float):
+        if len(self.amostras) == self.amostras.maxlen:
+            self.contagem[bisect.bisect_left(BUCKETS, self.amostras[0])] -= 1
+        self.amostras.append(segundos)
+        self.contagem[bisect.bisect_left(BUCKETS, segundos)] += 1
+
+    def __len__(self) -> int:
+        return len(self.amostras)
+
+    def quantil(self, q: float) -> float:
+        """Limite superior do bucket que contém o quantil q."""
+        alvo = q * len(self.amostras)
+        acc = 0
+        for i, c in enumerate(self.contagem):
+            acc += c
+            if acc >= alvo and c:
+                return BUCKETS[i] if i < len(BUCKETS) else max(self.amostras)
+        return 0.0
+
+
+class Circuito:
+    """
+    Disjuntor: `falhas` seguidas abrem o circuito por reabre_s; depois deixa passar uma tentativa.
+    Um por operação; pode ser usado por várias threads (backfill).
+    """
+
+    def __init__(self, falhas: int = FALHAS_CIRCUITO, reabre_s: float = REABRE_S, op: str = ""):
+        self.limite = falhas
+        self.reabre_s = reabre_s
+        self.op = op
+        self.falhas = 0
+        self.aberto_em: float | None = None
+        self._lock = threading.Lock()
+
+    def permite(self) -> bool:
+        with self._lock:
+            if self.aberto_em is None:
+                return True
+            return time.monotonic() - self.aberto_em >= self.reabre_s  # meio-aberto
+
+    def sucesso(self):
+        with self._lock:
+            self.falhas = 0
+            self.aberto_em = None
+
+    def falha(self):
+        with self._lock:
+            self.falhas += 1
+            if self.falhas >= self.limite:
+                if self.aberto_em is None:
+                    METRICS.inc("circuito_aberto", op=self.op)
+                self.aberto_em = time.monotonic()
+
+
+class PoliticaEspera:
+    """
+    Esperas e retries do navegador derivados das latências observadas, por operação:
+    - timeout = quantil 99 x folga, entre min/max (sem histórico: o máximo, como antes)
+    - intervalo de polling = mediana / 10, entre 50 e 500 ms
+    - estourou o timeout aprendido: a mesma espera continua, com o prazo dobrando, até somar
+      max_timeout_s (o limite antigo); só então falha. Uma página lenta custa tempo, não um erro,
+      e a latência real (total) vira amostra: dias lentos empurram o próximo timeout para cima
+    - retry(): backoff exponencial com jitter, limitado
+    - falhas seguidas de uma operação abrem o circuito dela (um por operação) e as chamadas
+      seguintes falham de imediato (CircuitoAberto) até reabre_s passar; esperas cujo
+      timeout é inofensivo (ex.: troca de página) passam circuito=False
+    - max_s: teto do orçamento de uma espera, abaixo de max_timeout_s
+    - report(): quanto cada espera realmente levou (também vai para o METRICS)
+    O histórico sobrevive entre execuções em STATE_DIR/latencias.json (save()).
+    """
+
+    def __init__(
+        self,
+        nome: str = "fnet",
+        min_timeout_s: float = MIN_TIMEOUT_S,
+        max_timeout_s: float = MAX_TIMEOUT_S,
+        quantil: float = QUANTIL,
+        folga: float = FOLGA,
+        tentativas: int = TENTATIVAS,
+        falhas_circuito: int = FALHAS_CIRCUITO,
+        reabre_s: float = REABRE_S,
+        path: str | Path | None = None,
+    ):
+        self.nome = nome
+        self.min_timeout_s = min_timeout_s
+        self.max_timeout_s = max_timeout_s
+        self.quantil = quantil
+        self.folga = folga
+        self.tentativas = tentativas
+        self.falhas_circuito = falhas_circuito
+        self.reabre_s = reabre_s
+        self._circuitos: dict[str, Circuito] = {}
+        self.path = Path(path) if path else STATE_DIR / "latencias.json"
+        self._hist: dict[str, Histograma] = {}
+        self._esperado: dict[str, float] = {}
+        self._timeouts: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    @classmethod
+    def from_env(cls, nome: str = "fnet") -> PoliticaEspera:
+        return cls(
+            nome,
+            min_timeout_s=float(os.environ.get("FNET_ESPERA_MIN", MIN_TIMEOUT_S)),
+            max_timeout_s=float(os.environ.get("FNET_ESPERA_MAX", MAX_TIMEOUT_S)),
+        )
+
+    def _load(self):
+        # lido no primeiro uso: importar o módulo não toca o disco
+        self._loaded = True
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8")).get(self.nome, {})
+        except (OSError, ValueError):
+            return
+        for op, amostras in data.items():
+            h = self._hist.setdefault(op, Histograma())
+            for s in amostras[-JANELA:]:
+                h.add(float(s))
+
+    def save(self):
+        with self._lock:
+            ops = {op: [round(s, 4) for s in h.amostras] for op, h in self._hist.items()}
+        if not ops:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            data = {}
+        data[self.nome] = ops
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        tmp.replace(self.path)
+
+    def _h(self, op: str) -> Histograma:
+        if not self._loaded:
+            self._load()
+        return self._hist.setdefault(op, Histograma())
+
+    def timeout(self, op: str) -> float:
+        with self._lock:
+            h = self._h(op)
+            if len(h) < MIN_AMOSTRAS:
+                return self.max_timeout_s
+            t = h.quantil(self.quantil) * self.folga
+        return min(self.max_timeout_s, max(self.min_timeout_s, t))
+
+    def poll(self, op: str) -> float:
+        with self._lock:
+            h = self._h(op)
+            if len(h) < MIN_AMOSTRAS:
+                return MAX_POLL_S  # o padrão do WebDriverWait
+            p50 = h.quantil(0.5)
+        return min(MAX_POLL_S, max(MIN_POLL_S, p50 / 10))
+
+    def circuito(self, op: str) -> Circuito:
+        with self._lock:
+            c = self._circuitos.get(op)
+            if c is None:
+                c = self._circuitos[op] = Circuito(self.falhas_circuito, self.reabre_s, op)
+            return c
+
+    def observe(self, op: str, segundos: float, ok: bool = True, circuito: bool = True):
+        with self._lock:
+            self._h(op).add(segundos)
+            self._esperado[op] = self._esperado.get(op, 0.0) + segundos
+            if not ok:
+                self._timeouts[op] = self._timeouts.get(op, 0) + 1
+        METRICS.observe("espera", segundos, op=op, resultado="ok" if ok else "timeout")
+        if not circuito:
+            return
+        if ok:
+            self.circuito(op).sucesso()
+        else:
+            self.circuito(op).falha()
+
+    def _checa_circuito(self, op: str):
+        c = self.circuito(op)
+        if not c.permite():
+            raise CircuitoAberto(f"{self.nome}: circuito aberto após {c.falhas} falhas seguidas ({op})")
+
+    def _prazos(self, op: str, max_s: float | None = None) -> Iterator[float]:
+        """Prazos de cada tentativa da mesma espera: o aprendido, dobrando, até somar max_timeout_s (ou max_s)."""
+        restante = self.max_timeout_s if max_s is None else min(max_s, self.max_timeout_s)
+        prazo = self.timeout(op)
+        while restante > 1e-9:
+            prazo = min(prazo, restante)
+            yield prazo
+            restante -= prazo
+            prazo *= 2
+
+    def wait_for(
+        self, op: str, fn: Callable[[float, float], T | None], max_s: float | None = None, circuito: bool = True,
+    ) -> T | None:
+        """Chama fn(timeout, poll_s) — que devolve None no timeout — e registra quanto levou."""
+        if circuito:
+            self._checa_circuito(op)
+        poll = self.poll(op)
+        t0 = time.monotonic()
+        for i, prazo in enumerate(self._prazos(op, max_s)):
+            if i:
+                METRICS.inc("espera_estendida", op=op)
+            result = fn(prazo, poll)
+            if result is not None:
+                self.observe(op, time.monotonic() - t0, circuito=circuito)
+                return result
+        self.observe(op, time.monotonic() - t0, ok=False, circuito=circuito)
+        return None
+
+    def until(self, driver, condition, op: str, max_s: float | None = None, circuito: bool = True):
+        """WebDriverWait(...).until(condition) com timeout/polling adaptativos."""
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        if circuito:
+            self._checa_circuito(op)
+        poll = self.poll(op)
+        t0 = time.monotonic()
+        prazos = list(self._prazos(op, max_s))
+        for i, prazo in enumerate(prazos):
+            if i:
+                METRICS.inc("espera_estendida", op=op)
+            try:
+                result = WebDriverWait(driver, prazo, poll_frequency=poll).until(condition)
+            except TimeoutException:
+                if i == len(prazos) - 1:
+                    self.observe(op, time.monotonic() - t0, ok=False, circuito=circuito)
+                    raise
+                continue
+            self.observe(op, time.monotonic() - t0, circuito=circuito)
+            return result
+
+    def retry(self, fn: Callable[[], T], op: str, retry_on: tuple[type[BaseException], ...] = (Exception,)) -> T:
+        """Até `tentativas` chamadas, com backoff exponencial (jitter) entre elas; relança a última falha."""
+        for tentativa in range(1, self.tentativas + 1):
+            self._checa_circuito(op)
+            try:
+                result = fn()
+            except retry_on:
+                METRICS.inc("retries", op=op)
+                if tentativa == self.tentativas:
+                    self.circuito(op).falha()
+                    raise
+                time.sleep(min(MAX_BACKOFF_S, BACKOFF_S * 2 ** (tentativa - 1)) * random.uniform(0.5, 1.5))
+                continue
+            self.circuito(op).sucesso()
+            return result
+        raise AssertionError("inalcançável")
+
+    def report(self) -> dict[str, dict[str, float]]:
+        """Por operação: amostras, p50/p90/p99 observados, timeout atual, tempo total esperado, timeouts."""
+        out = {}
+        for op in sorted(self._hist):
+            h = self._hist[op]
+            if not len(h):
+                continue
+            out[op] = {
+                "n": len(h),
+                "p50": round(h.quantil(0.5), 3),
+                "p90": round(h.quantil(0.9), 3),
+                "p99": round(h.quantil(0.99), 3),
+                "timeout": round(self.timeout(op), 3),
+                "esperado_s": round(self._esperado.get(op, 0.0), 3),
+                "timeouts": self._timeouts.get(op, 0),
+            }
+            METRICS.gauge("espera_timeout_segundos", out[op]["timeout"], op=op)
+        return out
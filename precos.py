@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import argparse
+import os
+import threading
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Protocol
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import STATE_DIR
+from metricas import METRICS
+
+
+CAMPOS = ["Open", "High", "Low", "Close", "Volume"]
+COLUNAS = ["Ticker", "Data", *CAMPOS]
+INICIO = date(2025, 9, 30)
+OVERLAP_DIAS = 7  # rebaixa a última semana: pega fechamento parcial do dia e ajustes
+
+class Cancelado(RuntimeError):
+    """update() interrompido antes de gravar (quem chamou desistiu de esperar)."""
+
+
+_SCHEMA = pa.schema(
+    [("Data", pa.timestamp("us"))] + [(c, pa.float64()) for c in CAMPOS]
+)
+
+
+def _to_date(value) -> date:
+    return pd.Timestamp(value).date()
+
+
+def normalize_prices(df: pd.DataFrame) -> pd.DataFrame:
+    """Formato longo padrão: Ticker, Data (meia-noite, sem fuso), Open..Volume (float)."""
+    if df.empty:
+        return pd.DataFrame({c: pd.Series(dtype="float64") for c in COLUNAS}).astype(
+            {"Ticker": "string", "Data": "datetime64[us]"}
+        )
+    out = df.reindex(columns=COLUNAS).copy()
+    data = pd.to_datetime(out["Data"])
+    if data.dt.tz is not None:
+        data = data.dt.tz_localize(None)
+    out["Data"] = data.dt.normalize().astype("datetime64[us]")
+    out["Ticker"] = out["Ticker"].astype("string")
+    out[CAMPOS] = out[CAMPOS].astype("float64")
+    out = out.dropna(subset=["Close"])
+    return out.drop_duplicates(["Ticker", "Data"], keep="last").sort_values(["Ticker", "Data"], ignore_index=True)
+
+
+class PriceProvider(Protocol):
+    """Fonte de cotações. fetch devolve o formato longo de normalize_prices; end é inclusivo."""
+
+    def fetch(self, tickers: list[str], start: date, end: date | None = None) -> pd.DataFrame: ...
+
+
+class YahooProvider:
+    """
+    yfinance; tickers com o mesmo início vão numa chamada só (yf.download).
+    Um ticker sozinho usa Ticker.history, que pode rodar em várias threads ao mesmo tempo
+    (o yf.download guarda o resultado em estado global do módulo).
+    """
+
+    def __init__(self, auto_adjust: bool = True, timeout: float = 30):
+        self.auto_adjust = auto_adjust
+        self.timeout = timeout
+
+    def fetch(self, tickers: list[str], start: date, end: date | None = None) -> pd.DataFrame:
+        # importado aqui: o resto do módulo (store, fixture) funciona sem yfinance
+        import yfinance as yf
+
+        if len(tickers) == 1:
+            hist = yf.Ticker(tickers[0]).history(
+                start=start.isoformat(),
+                end=(end + timedelta(days=1)).isoformat() if end else None,
+                auto_adjust=self.auto_adjust,
+                timeout=self.timeout,
+                raise_errors=True,
+            )
+            if hist is None or hist.empty:
+                return normalize_prices(pd.DataFrame())
+            hist = hist.rename_axis("Data").reset_index()
+            hist.insert(0, "Ticker", tickers[0])
+            return normalize_prices(hist)
+
+        data = yf.download(
+            list(tickers),
+            start=start.isoformat(),
+            end=(end + timedelta(days=1)).isoformat() if end else None,  # end do yfinance é exclusivo
+            group_by="ticker",
+            auto_adjust=self.auto_adjust,
+            progress=False,
+            timeout=self.timeout,
+        )
+        if data is None or data.empty:
+            return normalize_prices(pd.DataFrame())
+        if not isinstance(data.columns, pd.MultiIndex):
+            data.columns = pd.MultiIndex.from_product([[tickers[0]], data.columns])
+        long = data.stack(level=0, future_stack=True)
+        long.index.names = ["Data", "Ticker"]
+        return normalize_prices(long.reset_index())
+
+
+class FixtureProvider:
+    """
+    Cotações de um DataFrame/arquivo local (testes, benchmark, uso offline).
+    Conta chamadas e linhas servidas para medir o que a atualização incremental baixa.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = normalize_prices(df)
+        self.calls = 0
+        self.rows_served = 0
+
+    @classmethod
+    def from_file(cls, path: str | Path) -> FixtureProvider:
+        path = Path(path)
+        df = pd.read_parquet(path) if path.suffix == ".parquet" else pd.read_csv(path)
+        return cls(df)
+
+    def fetch(self, tickers: list[str], start: date, end: date | None = None) -> pd.DataFrame:
+        self.calls += 1
+        mask = self.df["Ticker"].isin(tickers) & (self.df["Data"] >= pd.Timestamp(start))
+        if end is not None:
+            mask &= self.df["Data"] <= pd.Timestamp(end)
+        out = self.df.loc[mask].reset_index(drop=True)
+        self.rows_served += len(out)
+        return out
+
+
+def provider_from_env(timeout: float = 30) -> PriceProvider:
+    """PRECOS_FIXTURE=<csv|parquet> usa o arquivo local em vez do Yahoo."""
+    fixture = os.environ.get("PRECOS_FIXTURE")
+    return FixtureProvider.from_file(fixture) if fixture else YahooProvider(timeout=timeout)
+
+
+class PriceStore:
+    """
+    Histórico local de cotações em Parquet, um arquivo por ticker (precos/<ticker>.parquet),
+    ordenado por Data.
+    - update() baixa só o rabo que falta de cada ticker (desde a última data - overlap) e
+      sobrepõe ao que já existe: o download não cresce com o histórico
+    - a última data de cada ticker vem das estatísticas do Parquet (sem ler os dados)
+    - load() devolve a tabela larga (Data x ticker) de um campo, como o data["Close"] do yfinance
+    Custo da gravação: merge() reescreve o arquivo inteiro do ticker, O(histórico) por
+    atualização. Com cotação diária isso é pequeno (25 anos = ~6.500 linhas, ~60 KB, ~20 ms
+    por ticker contra ~10 ms de um arquivo de um ano) e fica bem abaixo do download; se um
+    dia guardar intradiário, vale trocar por partes de rabo + compactação periódica.
+    """
+
+    def __init__(self, root: str | Path | None = None):
+        self.root = Path(root) if root else STATE_DIR / "precos"
+
+    def path(self, ticker: str) -> Path:
+        return self.root / f"{ticker.replace('/', '_')}.parquet"
+
+    def tickers(self) -> list[str]:
+        return sorted(p.stem for p in self.root.glob("*.parquet"))
+
+    def coverage(self, ticker: str) -> tuple[date, date] | None:
+        """
+        (início pedido, última data) do ticker no histórico. O início fica nos metadados do
+        arquivo (o primeiro pregão pode ser depois dele); a última data vem das estatísticas.
+        """
+        path = self.path(ticker)
+        if not path.exists():
+            return None
+        pf = pq.ParquetFile(path)
+        meta = pf.metadata
+        if meta.num_rows == 0:
+            return None
+        col = meta.schema.names.index("Data")
+        stats = [meta.row_group(i).column(col).statistics for i in range(meta.num_row_groups)]
+        if all(s is not None and s.has_min_max for s in stats):
+            first, last = min(s.min for s in stats), max(s.max for s in stats)
+        else:
+            datas = pq.read_table(path, columns=["Data"]).column("Data").to_pandas()
+            first, last = datas.min(), datas.max()
+        inicio = (pf.schema_arrow.metadata or {}).get(b"inicio")
+        return date.fromisoformat(inicio.decode()) if inicio else _to_date(first), _to_date(last)
+
+    def last_date(self, ticker: str) -> date | None:
+        cov = self.coverage(ticker)
+        return cov[1] if cov else None
+
+    def read(self, ticker: str) -> pd.DataFrame:
+        path = self.path(ticker)
+        if not path.exists():
+            return normalize_prices(pd.DataFrame())
+        df = pq.read_table(path).to_pandas()
+        df.insert(0, "Ticker", ticker)
+        return normalize_prices(df)
+
+    def write(self, ticker: str, df: pd.DataFrame, inicio: date):
+        self.root.mkdir(parents=True, exist_ok=True)
+        schema = _SCHEMA.with_metadata({"inicio": inicio.isoformat()})
+        table = pa.Table.from_pandas(df[["Data", *CAMPOS]], schema=schema, preserve_index=False)
+        path = self.path(ticker)
+        tmp = path.with_suffix(".tmp")
+        pq.write_table(table, tmp)
+        tmp.replace(path)
+
+    def merge(self, ticker: str, novo: pd.DataFrame, desde: date) -> int:
+        """
+        Junta as linhas baixadas desde `desde` ao histórico (as novas prevalecem na mesma data).
+        Lê e regrava o histórico todo do ticker (ver o custo na docstring da classe).
+        """
+        if novo.empty:
+            return 0
+        cov = self.coverage(ticker)
+        inicio = min(desde, cov[0]) if cov else desde
+        merged = normalize_prices(pd.concat([self.read(ticker), novo], ignore_index=True))
+        self.write(ticker, merged, inicio)
+        return len(novo)
+
+    def plan(
+        self, tickers: list[str], start: date = INICIO, overlap_dias: int = OVERLAP_DIAS,
+    ) -> dict[date, list[str]]:
+        """Início do download de cada ticker, agrupado (mesmo início = uma chamada ao provedor)."""
+        grupos: dict[date, list[str]] = {}
+        for t in dict.fromkeys(tickers):
+            cov = self.coverage(t)
+            if cov is None or cov[0] > start:
+                desde = start  # ticker novo (ou start anterior ao histórico): baixa tudo
+            else:
+                desde = max(start, cov[1] - timedelta(days=overlap_dias))
+            grupos.setdefault(desde, []).append(t)
+        return grupos
+
+    def update(
+        self,
+        tickers: list[str],
+        provider: PriceProvider,
+        start: date = INICIO,
+        end: date | None = None,
+        overlap_dias: int = OVERLAP_DIAS,
+        cancelado: threading.Event | None = None,
+    ) -> dict[str, int]:
+        """
+        Atualiza o histórico dos tickers; devolve linhas baixadas por ticker.
+        cancelado: checado antes de cada gravação; se setado, levanta Cancelado sem gravar.
+        """
+        baixadas: dict[str, int] = {}
+        for desde, grupo in sorted(self.plan(tickers, start, overlap_dias).items()):
+            with METRICS.span("precos_fetch"):
+                novo = normalize_prices(provider.fetch(grupo, desde, end))
+            METRICS.inc("precos_linhas_baixadas", len(novo))
+            por_ticker = dict(tuple(novo.groupby("Ticker", sort=False)))
+            for t in grupo:
+                linhas = por_ticker.get(t)
+                if linhas is None:
+                    print(f"[AVISO] Sem cotações para {t} desde {desde:%d/%m/%Y}; mantendo o histórico local.")
+                    baixadas[t] = 0
+                    continue
+                if cancelado is not None and cancelado.is_set():
+                    raise Cancelado(t)
+                baixadas[t] = self.merge(t, linhas, desde)
+        return baixadas
+
+    def load_long(self, tickers: list[str], start: date | None = None, end: date | None = None) -> pd.DataFrame:
+        df = pd.concat([self.read(t) for t in dict.fromkeys(tickers)], ignore_index=True)
+        if start is not None:
+            df = df[df["Data"] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df["Data"] <= pd.Timestamp(end)]
+        return df.reset_index(drop=True)
+
+    def load(
+        self, tickers: list[str], campo: str = "Close", start: date | None = None, end: date | None = None,
+    ) -> pd.DataFrame:
+        long = self.load_long(tickers, start, end)
+        wide = long.pivot(index="Data", columns="Ticker", values=campo)
+        wide = wide.reindex(columns=list(dict.fromkeys(tickers)))
+        wide.columns.name = None
+        return wide
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Histórico local de cotações (atualização incremental).")
+    parser.add_argument("tickers", nargs="*", help="padrão: os tickers já no histórico")
+    parser.add_argument("--start", type=date.fromisoformat, default=INICIO)
+    parser.add_argument("--overlap", type=int, default=OVERLAP_DIAS, help="dias rebaixados no fim do histórico")
+    parser.add_argument("--fixture", help="csv/parquet local no lugar do Yahoo")
+    args = parser.parse_args(argv)
+
+    store = PriceStore()
+    tickers = args.tickers or store.tickers()
+    if not tickers:
+        parser.error("informe os tickers (o histórico local está vazio)")
+    provider = FixtureProvider.from_file(args.fixture) if args.fixture else provider_from_env()
+    baixadas = store.update(tickers, provider, start=args.start, overlap_dias=args.overlap)
+    for t in tickers:
+        print(f"{t}: {baixadas.get(t, 0)} linha(s) baixada(s), histórico até {store.last_date(t) or '-'}")
+    METRICS.flush()
+
+
+if __name__ == "__main__":
+    main()
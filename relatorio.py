@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import gzip
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+EXCEL_MAX_LINHAS = 1_048_576
+LIMITE_EXCEL = 0  # tabelas de dados só entram no XLSX até esse tamanho (0: nunca)
+CHUNK = 50_000
+FORMATOS = ("parquet", "csv.gz")
+
+_EPOCH_EXCEL = np.datetime64("1899-12-30", "us")
+_DIA_US = 86_400_000_000
+
+
+def _primeiro(s: pd.Series):
+    nn = s.dropna()
+    return nn.iloc[0] if len(nn) else None
+
+
+def _colunas(df: pd.DataFrame) -> list[tuple[str, np.ndarray]]:
+    """Cada coluna vira (tipo, valores) prontos para o xlsxwriter: número, data (serial) ou texto."""
+    out = []
+    for col in df.columns:
+        s = df[col]
+        if s.dtype == object and isinstance(_primeiro(s), date):
+            s = pd.to_datetime(s)  # datetime.date (ex.: Data sem hora)
+        if pd.api.types.is_datetime64_any_dtype(s):
+            if s.dt.tz is not None:
+                s = s.dt.tz_localize(None)
+            us = s.to_numpy("datetime64[us]")
+            serial = (us - _EPOCH_EXCEL).astype("int64") / _DIA_US
+            out.append(("data", np.where(np.isnat(us), np.nan, serial)))
+        elif pd.api.types.is_bool_dtype(s):
+            out.append(("bool", s.to_numpy(dtype=object)))
+        elif pd.api.types.is_numeric_dtype(s):
+            out.append(("num", s.to_numpy(dtype="float64", na_value=np.nan)))
+        else:
+            out.append(("texto", s.astype("string").to_numpy(dtype=object, na_value=None)))
+    return out
+
+
+def write_xlsx(path: str | Path, abas: dict[str, pd.DataFrame], formato_data: str = "dd/mm/yyyy") -> Path:
+    """
+    XLSX em streaming (xlsxwriter constant_memory): cada linha vai para o disco ao ser
+    escrita, então a memória não cresce com o tamanho da planilha. NaN vira célula vazia.
+    """
+    import xlsxwriter
+
+    path = Path(path)
+    for nome, df in abas.items():
+        if len(df) + 1 > EXCEL_MAX_LINHAS:
+            raise ValueError(f"aba {nome!r} tem {len(df):,} linhas; o Excel aceita {EXCEL_MAX_LINHAS - 1:,}")
+    wb = xlsxwriter.Workbook(str(path), {"constant_memory": True})
+    try:
+        fmt_data = wb.add_format({"num_format": formato_data})
+        fmt_head = wb.add_format({"bold": True})
+        for nome, df in abas.items():
+            ws = wb.add_worksheet(nome[:31])
+            ws.write_row(0, 0, [str(c) for c in df.columns], fmt_head)
+            for c, (tipo, _) in enumerate(_colunas(df.head(0))):
+                ws.set_column(c, c, 12 if tipo == "data" else 14)
+            for ini in range(0, len(df), CHUNK):
+                _write_rows(ws, _colunas(df.iloc[ini:ini + CHUNK]), ini + 1, fmt_data)
+    finally:
+        wb.close()
+    return path
+
+
+def _write_rows(ws, colunas: list[tuple[str, np.ndarray]], primeira: int, fmt_data):
+    n = len(colunas[0][1]) if colunas else 0
+    # listas Python: indexar numpy célula a célula é bem mais lento
+    cols = [(c, tipo, vals.tolist()) for c, (tipo, vals) in enumerate(colunas)]
+    write_number, write_string, write_boolean = ws.write_number, ws.write_string, ws.write_boolean
+    for i in range(n):
+        row = primeira + i
+        for c, tipo, vals in cols:
+            v = vals[i]
+            if v is None or v != v:  # None ou NaN
+                continue
+            if tipo == "num":
+                write_number(row, c, v)
+            elif tipo == "data":
+                write_number(row, c, v, fmt_data)
+            elif tipo == "bool":
+                write_boolean(row, c, v)
+            else:
+                write_string(row, c, v)
+
+
+def write_parquet(df: pd.DataFrame, path: str | Path) -> Path:
+    path = Path(path)
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path, compression="zstd")
+    return path
+
+
+def write_csv_gz(df: pd.DataFrame, path: str | Path, compresslevel: int = 5) -> Path:
+    """CSV gzip em blocos (nível 5: quase o tamanho do 9, bem mais rápido)."""
+    path = Path(path)
+    with gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=compresslevel) as fh:
+        for ini in range(0, max(len(df), 1), CHUNK):
+            df.iloc[ini:ini + CHUNK].to_csv(fh, index=False, header=ini == 0)
+    return path
+
+
+class Relatorio:
+    """
+    Relatório em partes:
+    - resumo(): abas pequenas, vão para o XLSX (escrito em streaming)
+    - dados(): tabelas grandes (formato longo), vão para Parquet/csv.gz; por padrão ficam
+      fora do XLSX (crescem com o histórico e dominam o tempo de escrita) -- limite_excel > 0
+      as inclui enquanto couberem; sem formato colunar elas vão para o XLSX
+    write() grava tudo e devolve os caminhos ({"xlsx": ..., "<nome>.parquet": ...}).
+    """
+
+    def __init__(
+        self,
+        out_dir: str | Path,
+        nome: str,
+        formatos: tuple[str, ...] = FORMATOS,
+        limite_excel: int = LIMITE_EXCEL,
+    ):
+        self.out_dir = Path(out_dir)
+        self.nome = nome
+        self.formatos = formatos
+        self.limite_excel = limite_excel
+        self.abas: dict[str, pd.DataFrame] = {}
+        self.tabelas: dict[str, pd.DataFrame] = {}
+
+    def resumo(self, aba: str, df: pd.DataFrame) -> Relatorio:
+        self.abas[aba] = df
+        return self
+
+    def dados(self, nome: str, df: pd.DataFrame) -> Relatorio:
+        self.tabelas[nome] = df
+        return self
+
+    def write(self) -> dict[str, Path]:
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        paths: dict[str, Path] = {}
+        abas = dict(self.abas)
+        for nome, df in self.tabelas.items():
+            if len(df) <= self.limite_excel or not self.formatos:
+                abas[nome] = df
+            base = self.out_dir / f"{self.nome}_{nome}"
+            if "parquet" in self.formatos:
+                paths[f"{nome}.parquet"] = write_parquet(df, base.with_name(base.name + ".parquet"))
+            if "csv.gz" in self.formatos:
+                paths[f"{nome}.csv.gz"] = write_csv_gz(df, base.with_name(base.name + ".csv.gz"))
+        if abas:
+            paths["xlsx"] = write_xlsx(self.out_dir / f"{self.nome}.xlsx", abas)
+        return paths
@@ -1,18 +1,41 @@
 from __future__ import annotations
 
+import asyncio
 import os
-import re
-import unicodedata
+import time
 from datetime import date, timedelta
+from typing import Iterable, Iterator
 
+import numpy as np
 import pandas as pd
-import yagmail
+import requests
 from bs4 import BeautifulSoup
+from pandas.api.types import is_object_dtype, is_string_dtype
 from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import Select, WebDriverWait
+from selenium.webdriver.support.ui import Select
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import StaleElementReferenceException, TimeoutException, ElementClickInterceptedException
+from selenium.common.exceptions import (
+    StaleElementReferenceException, TimeoutException, ElementClickInterceptedException, WebDriverException,
+)
+
+try:
+    import lxml.html
+except ImportError:  # fallback para o parser do bs4
+    lxml = None
+
+from arquivo import Archive
+from assinantes import Assinante, Roteamento, RuleBook, route
+from downloads import download_documents, summarize, texts_frame
+from estado import DocStore, until_known
+from fnet_http import BASE_URL, ENDPOINT_DADOS, FnetClient, format_data, records_to_df
+from fundos import Fundo, FundIndex, fundos_from_pairs, load_extras, load_index
+from metricas import METRICS
+from navegador import DriverManager, XhrCapture
+from notificacao import chave, compartilhado
+from planejador import Planejador
+from politica import PoliticaEspera
+from texto import build_contains_pattern, compile_contains, contains_mask, factorize_normalized, normalize
 
 
 URL = "https://fnet.bmfbovespa.com.br/fnet/publico/abrirGerenciadorDocumentosCVM"
@@ -141,22 +164,8 @@ EMAIL_TO = ["diego@seikopartners.com.br", "fabio@seikopartners.com.br"]
 EMAIL_SUBJECT = "Relatório dos Fundo Imobiliários"
 
 
-def normalize(s) -> str:
-    if s is None or (isinstance(s, float) and pd.isna(s)):
-        return ""
-    s = str(s).strip().casefold()
-    s = unicodedata.normalize("NFD", s)
-    s = re.sub(r"[\u0300-\u036f]", "", s)
-    s = re.sub(r"\s+", " ", s)
-    return s
-
-
-def build_contains_pattern(terms: list[str]) -> str:
-    terms_norm = [normalize(t) for t in terms if t and str(t).strip()]
-    terms_norm = [t for t in terms_norm if t]
-    if not terms_norm:
-        return ""
-    return "|".join(re.escape(t) for t in terms_norm)
+def fund_index() -> FundIndex:
+    return load_index(fundos_from_pairs(NOMES_RAW, load_extras()))
 
 
 def guess_column(df: pd.DataFrame, keywords: list[str]) -> str | None:
@@ -167,92 +176,165 @@ def guess_column(df: pd.DataFrame, keywords: list[str]) -> str | None:
     return None
 
 
-def select2_by_text_click(driver, container_id: str, option_text: str, timeout: int = 15) -> bool:
-    container = WebDriverWait(driver, timeout).until(
-        EC.element_to_be_clickable((By.ID, container_id))
-    )
+def select2_by_text_click(driver, container_id: str, option_text: str) -> bool:
+    container = ESPERAS.until(driver, EC.element_to_be_clickable((By.ID, container_id)), "select2_abrir")
     container.click()
 
-    # select2 v3
+    # select2 v3 ou v4: uma espera só pelo que aparecer primeiro
+    # (esperar a v3 até o timeout para só então tentar a v4 custava um timeout inteiro)
     try:
-        results_label = WebDriverWait(driver, timeout).until(
+        option = ESPERAS.until(driver, EC.any_of(
             EC.visibility_of_element_located(
                 (By.XPATH,
                  f"//div[contains(@class,'select2-result-label') and normalize-space(.)='{option_text}']")
-            )
-        )
-        results_label.click()
-        return True
-    except Exception:
-        pass
-
-    # select2 v4
-    try:
-        option = WebDriverWait(driver, timeout).until(
+            ),
             EC.visibility_of_element_located(
                 (By.XPATH,
                  f"//li[contains(@class,'select2-results__option') and normalize-space(.)='{option_text}']")
-            )
-        )
+            ),
+        ), "select2_opcao")
         option.click()
         return True
-    except Exception:
+    except (TimeoutException, WebDriverException):
         return False
 
 
-def make_driver() -> webdriver.Chrome:
-    opts = webdriver.ChromeOptions()
-    opts.add_argument("--headless=new")
-    opts.add_argument("--no-sandbox")
-    opts.add_argument("--disable-dev-shm-usage")
-    opts.add_argument("--window-size=1920,1080")
-    return webdriver.Chrome(options=opts)
+DRIVERS = DriverManager.from_env()
+# timeouts/polling do navegador aprendidos das latências observadas (ver politica.py)
+ESPERAS = PoliticaEspera.from_env()
+TROCA_PAGINA_S = 15.0  # teto da espera pela troca da tabela (o timeout dela não é erro)
 
 
-def wait_table_ready(driver, timeout: int = 30):
-    WebDriverWait(driver, timeout).until(
-        EC.presence_of_element_located((By.ID, "tblDocumentosEnviados"))
-    )
-    WebDriverWait(driver, timeout).until(
-        EC.presence_of_element_located((By.CSS_SELECTOR, "#tblDocumentosEnviados tbody tr"))
+def make_driver(manager: DriverManager | None = None) -> webdriver.Chrome:
+    with METRICS.span("driver_startup"):
+        return (manager or DRIVERS).start()
+
+
+def wait_table_ready(driver):
+    with METRICS.span("wait_table_ready"):
+        _wait_table_ready(driver)
+
+
+def _wait_table_ready(driver):
+    ESPERAS.until(driver, EC.presence_of_element_located((By.ID, "tblDocumentosEnviados")), "tabela")
+    ESPERAS.until(
+        driver, EC.presence_of_element_located((By.CSS_SELECTOR, "#tblDocumentosEnviados tbody tr")), "tabela_linhas",
     )
 
 
-def read_table(driver) -> pd.DataFrame:
-    table_element = driver.find_element(By.ID, "tblDocumentosEnviados")
-    table_html = table_element.get_attribute("outerHTML")
+DOC_PREFIX = "visualizarDocumento?id="
+DOC_SUFFIX = "&cvm=true"
+
+# extrai a tabela no próprio navegador, numa única chamada, com a mesma regra do parser:
+# célula com <a> -> href; senão -> texto (cada nó de texto com strip, concatenados).
+# a coluna "Ações" já volta só com o DocNumber.
+READ_TABLE_JS = """
+const table = document.getElementById('tblDocumentosEnviados');
+if (!table) { return []; }
+const cellText = (el) => {
+    const walker = document.createTreeWalker(el, NodeFilter.SHOW_TEXT);
+    let out = '';
+    let node;
+    while ((node = walker.nextNode())) { out += node.nodeValue.trim(); }
+    return out;
+};
+const rows = [];
+for (const tr of table.querySelectorAll('tr')) {
+    const row = [];
+    for (const cell of tr.querySelectorAll('th, td')) {
+        const link = cell.querySelector('a');
+        row.push(link ? (link.getAttribute('href') || '').trim() : cellText(cell));
+    }
+    rows.push(row);
+}
+if (rows.length > 1) {
+    const docCol = rows[0].indexOf('Ações');
+    if (docCol >= 0) {
+        for (const row of rows.slice(1)) {
+            if (docCol < row.length) {
+                row[docCol] = row[docCol].split(arguments[0]).join('').split(arguments[1]).join('');
+            }
+        }
+    }
+}
+return rows;
+"""
 
+
+def parse_table_html(table_html: str) -> list[list[str]]:
     soup = BeautifulSoup(table_html, "html.parser")
 
     table_data = []
     for row in soup.find_all("tr"):
         row_data = []
         for cell in row.find_all(["th", "td"]):
-            if cell.find("a"):
-                link = cell.find("a")
+            link = cell.find("a")
+            if link:
                 cell_data = link.get("href", "").strip()
             else:
                 cell_data = cell.get_text(strip=True)
             row_data.append(cell_data)
         table_data.append(row_data)
+    return table_data
+
 
+def parse_table_html_lxml(table_html: str) -> list[list[str]]:
+    # mesma regra do parse_table_html, mas com o parser em C do lxml
+    root = lxml.html.fromstring(table_html)
+
+    table_data = []
+    for row in root.iter("tr"):
+        row_data = []
+        for cell in row.iter("th", "td"):
+            link = next(cell.iter("a"), None)
+            if link is not None:
+                cell_data = (link.get("href") or "").strip()
+            else:
+                cell_data = "".join(t.strip() for t in cell.itertext())
+            row_data.append(cell_data)
+        table_data.append(row_data)
+    return table_data
+
+
+def table_data_to_df(table_data: list[list[str]], doc_split: bool = False) -> pd.DataFrame:
     if not table_data or len(table_data) < 2:
         return pd.DataFrame()
 
     df = pd.DataFrame(table_data[1:], columns=table_data[0])
 
     if "Ações" in df.columns:
-        df["DocNumber"] = (
-            df["Ações"]
-            .astype(str)
-            .str.replace("visualizarDocumento?id=", "", regex=False)
-            .str.replace("&cvm=true", "", regex=False)
-        )
+        docs = df["Ações"].astype(str)
+        if not doc_split:
+            docs = docs.str.replace(DOC_PREFIX, "", regex=False).str.replace(DOC_SUFFIX, "", regex=False)
+        df["DocNumber"] = docs
         df = df.drop(columns=["Ações"])
 
     return df
 
 
+def read_table(driver, mode: str = "js") -> pd.DataFrame:
+    """
+    Lê a tabela da página atual.
+    - "js": linhas extraídas direto do DOM num único execute_script (sem re-parse de HTML)
+    - "lxml": outerHTML + parser lxml
+    - "bs4": outerHTML + BeautifulSoup/html.parser (modo original)
+    Se o modo escolhido falhar, cai para o próximo da lista.
+    """
+    if mode == "js":
+        try:
+            table_data = driver.execute_script(READ_TABLE_JS, DOC_PREFIX, DOC_SUFFIX)
+            return table_data_to_df(table_data or [], doc_split=True)
+        except WebDriverException:
+            mode = "lxml"
+
+    table_element = driver.find_element(By.ID, "tblDocumentosEnviados")
+    table_html = table_element.get_attribute("outerHTML")
+
+    if mode == "lxml" and lxml is not None:
+        return table_data_to_df(parse_table_html_lxml(table_html))
+    return table_data_to_df(parse_table_html(table_html))
+
+
 def _safe_click(driver, element):
     try:
         element.click()
@@ -260,14 +342,27 @@ def _safe_click(driver, element):
     except (ElementClickInterceptedException, StaleElementReferenceException):
         pass
     # fallback: scroll + JS click
+    METRICS.inc("click_js_fallback")
     driver.execute_script("arguments[0].scrollIntoView({block:'center'});", element)
     driver.execute_script("arguments[0].click();", element)
 
 
-def collect_pages(driver) -> pd.DataFrame:
+def concat_pages(pages: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    pages = list(pages)
+    if not pages:
+        return pd.DataFrame()
+    return pd.concat(pages, ignore_index=True)
+
+
+def collect_pages(driver, store: DocStore | None = None) -> pd.DataFrame:
+    return concat_pages(iter_table_pages(driver, store=store))
+
+
+def iter_table_pages(driver, store: DocStore | None = None) -> Iterator[pd.DataFrame]:
     """
-    Paginação robusta (evita stale):
+    Paginação robusta (evita stale), uma página por vez:
     - lê a página atual
+    - se store for passado, para assim que uma página inteira já for conhecida
     - enquanto "next" não estiver disabled:
         - guarda o primeiro <tr> atual (para esperar staleness)
         - re-encontra o botão next a cada iteração
@@ -276,21 +371,36 @@ def collect_pages(driver) -> pd.DataFrame:
         - espera tabela pronta
         - lê
     """
-    pages: list[pd.DataFrame] = []
+    def read_page() -> pd.DataFrame | None:
+        with METRICS.span("page_parse", backend="selenium"):
+            page = read_table(driver)
+        METRICS.inc("pages", backend="selenium")
+        if store is not None and store.is_page_known(page):
+            return None
+        return page
 
     wait_table_ready(driver)
-    pages.append(read_table(driver))
+    page = read_page()
+    if page is None:
+        return
+    yield page
 
-    while True:
+    def next_disabled() -> bool:
         # re-encontra o botão next SEMPRE (evita stale)
+        next_btn = driver.find_element(By.ID, "tblDocumentosEnviados_next")
+        return "disabled" in (next_btn.get_attribute("class") or "")
+
+    def click_next():
+        _safe_click(driver, driver.find_element(By.ID, "tblDocumentosEnviados_next"))
+
+    while True:
+        # stale repetido no botão: retries limitados (com backoff) em vez de um continue sem fim
         try:
-            next_btn = driver.find_element(By.ID, "tblDocumentosEnviados_next")
-            classes = next_btn.get_attribute("class") or ""
-            if "disabled" in classes:
+            if ESPERAS.retry(next_disabled, "botao_proximo", retry_on=(StaleElementReferenceException,)):
                 break
         except StaleElementReferenceException:
-            # se deu stale aqui, tenta de novo
-            continue
+            print("[AVISO] Botão 'próxima' continua stale; parando a paginação.")
+            break
 
         # pega o primeiro row atual para esperar a troca da tabela
         try:
@@ -298,209 +408,633 @@ def collect_pages(driver) -> pd.DataFrame:
         except Exception:
             old_first_row = None
 
-        # tenta clicar (com retry leve)
-        clicked = False
-        for _ in range(3):
-            try:
-                next_btn = driver.find_element(By.ID, "tblDocumentosEnviados_next")
-                _safe_click(driver, next_btn)
-                clicked = True
-                break
-            except StaleElementReferenceException:
-                continue
-
-        if not clicked:
+        try:
+            ESPERAS.retry(click_next, "click_proximo", retry_on=(StaleElementReferenceException,))
+        except StaleElementReferenceException:
             # não conseguiu avançar, para evitar loop infinito
             break
 
         # espera a tabela realmente trocar
         if old_first_row is not None:
             try:
-                WebDriverWait(driver, 15).until(EC.staleness_of(old_first_row))
+                # timeout aqui é inofensivo (wait_table_ready cobre): fora do disjuntor e
+                # limitado ao prazo antigo, em vez do max_timeout_s das esperas estendidas
+                with METRICS.span("page_turn_wait"):
+                    ESPERAS.until(
+                        driver, EC.staleness_of(old_first_row), "troca_pagina",
+                        max_s=TROCA_PAGINA_S, circuito=False,
+                    )
             except TimeoutException:
                 # se não ficou stale, ainda assim tentamos esperar a tabela
-                pass
+                METRICS.inc("staleness_timeouts")
 
         wait_table_ready(driver)
-        pages.append(read_table(driver))
+        page = read_page()
+        if page is None:
+            break
+        yield page
 
-    if not pages:
-        return pd.DataFrame()
 
-    return pd.concat(pages, ignore_index=True)
+def collect_pages_cdp(driver, store: DocStore | None = None) -> pd.DataFrame:
+    return concat_pages(iter_pages_cdp(driver, store=store))
 
 
-def filter_df(df: pd.DataFrame) -> pd.DataFrame:
-    rename_map = {
-        "Nome do Fundo": "Nome_Fundo",
-        "Data de Referência": "Dt_Ref",
-        "Data de Entrega": "Dt_Entrega",
-        "Espécie": "Especie",
-    }
-    for old, new in rename_map.items():
-        if old in df.columns:
-            df = df.rename(columns={old: new})
+def iter_pages_cdp(driver, store: DocStore | None = None) -> Iterator[pd.DataFrame]:
+    """
+    Paginação lendo o JSON de cada XHR do DataTables (eventos CDP), sem raspar o DOM:
+    - a página está completa quando a resposta do XHR termina (sinal exato)
+    - acaba quando o total de registros (recordsFiltered) foi lido
+    Se o log de rede não estiver disponível, cai para iter_table_pages.
+    """
+    capture = XhrCapture(driver, ENDPOINT_DADOS)
+    try:
+        request_id = ESPERAS.wait_for("xhr_primeira", lambda t, poll: capture.wait(after=0, timeout=t, poll_s=poll))
+    except WebDriverException:
+        request_id = None
+    if request_id is None:
+        METRICS.inc("backend_fallback", origem="cdp", destino="dom")
+        yield from iter_table_pages(driver, store=store)
+        return
+
+    lidos = 0
+    while True:
+        with METRICS.span("page_parse", backend="cdp"):
+            payload = capture.json_body(request_id)
+            records = payload.get("data") or []
+            page = records_to_df(records)
+        METRICS.inc("pages", backend="cdp")
+        if not records or (store is not None and store.is_page_known(page)):
+            break
+        yield page
+        lidos += len(records)
+        total = int(payload.get("recordsFiltered") or payload.get("recordsTotal") or 0)
+        if lidos >= total:
+            break
+
+        vistos = len(capture.finished)
+        next_btn = driver.find_element(By.ID, "tblDocumentosEnviados_next")
+        if "disabled" in (next_btn.get_attribute("class") or ""):
+            break
+        _safe_click(driver, next_btn)
+        with METRICS.span("page_xhr_wait"):
+            request_id = ESPERAS.wait_for(
+                "xhr_pagina", lambda t, poll: capture.wait(after=vistos, timeout=t, poll_s=poll),
+            )
+        if request_id is None:
+            METRICS.inc("xhr_timeouts")
+            print(f"[AVISO] XHR da página seguinte não chegou em {ESPERAS.max_timeout_s:.1f}s;"
+                  f" parando em {lidos} registros.")
+            break
+
+
+RENAME_MAP = {
+    "Nome do Fundo": "Nome_Fundo",
+    "Data de Referência": "Dt_Ref",
+    "Data de Entrega": "Dt_Entrega",
+    "Espécie": "Especie",
+}
+DATE_COLS = ["Dt_Entrega", "Dt_Ref"]
+
+
+def all_text_normalized(df: pd.DataFrame) -> pd.Series:
+    # fallback quando não há coluna de Categoria/Tipo: junta todo o texto da linha
+    text_cols = [
+        c for c in df.columns
+        if c not in DATE_COLS and (is_object_dtype(df[c]) or is_string_dtype(df[c]))
+    ]
+    cols = []
+    for c in text_cols:
+        codes, norm = factorize_normalized(df[c])
+        cols.append(norm[codes])
+    joined = [" ".join(v for v in vals if v) for vals in zip(*cols)] if cols else [""] * len(df)
+    return pd.Series(joined, index=df.index, dtype=object)
+
+
+def archive_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Colunas padronizadas + Codigo_Fundo (vazio se o fundo não é monitorado), sem filtrar linhas."""
+    df = df.rename(columns={old: new for old, new in RENAME_MAP.items() if old in df.columns})
+    if "Nome_Fundo" in df.columns:
+        codigo, score = fund_index().match(df["Nome_Fundo"])
+        df["Codigo_Fundo"] = codigo
+        df["Score_Fundo"] = score
+    return df
+
 
-    if "Dt_Entrega" in df.columns:
-        df["Dt_Entrega"] = pd.to_datetime(df["Dt_Entrega"], dayfirst=True, errors="coerce")
-    if "Dt_Ref" in df.columns:
-        df["Dt_Ref"] = pd.to_datetime(df["Dt_Ref"], dayfirst=True, errors="coerce")
+def standardize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Renomeia para Nome_Fundo/Categoria/Tipo/Dt_* (adivinhando pelo cabeçalho quando preciso)."""
+    df = df.rename(columns={old: new for old, new in RENAME_MAP.items() if old in df.columns})
 
     if "Nome_Fundo" not in df.columns:
         col_guess = guess_column(df, ["nome do fundo", "fundo", "nome"])
         if col_guess:
             df = df.rename(columns={col_guess: "Nome_Fundo"})
 
-    nome_para_codigo = {normalize(nome): codigo for (nome, codigo) in NOMES_RAW}
-
-    df["nome_norm"] = df.get("Nome_Fundo", "").apply(normalize)
-    filtered = df[df["nome_norm"].isin(nome_para_codigo.keys())].copy()
-    filtered["Codigo_Fundo"] = filtered["nome_norm"].map(nome_para_codigo).fillna("")
-
     # tenta padronizar "Categoria" e "Tipo"
-    cat_guess = guess_column(filtered, ["categoria", "espécie", "especie", "assunto"])
+    cat_guess = guess_column(df, ["categoria", "espécie", "especie", "assunto"])
     if cat_guess and cat_guess != "Categoria":
-        filtered = filtered.rename(columns={cat_guess: "Categoria"})
-    tipo_guess = guess_column(filtered, ["tipo", "documento", "descricao", "descrição"])
+        df = df.rename(columns={cat_guess: "Categoria"})
+    tipo_guess = guess_column(df, ["tipo", "documento", "descricao", "descrição"])
     if tipo_guess and tipo_guess != "Tipo":
-        filtered = filtered.rename(columns={tipo_guess: "Tipo"})
-
-    # filtro por categoria
-    pattern_cat = build_contains_pattern(FRASES_CATEGORIA)
-    if pattern_cat:
-        if "Categoria" in filtered.columns:
-            filtered["cat_norm"] = filtered["Categoria"].apply(normalize)
-            filtered = filtered[filtered["cat_norm"].str.contains(pattern_cat, na=False)].copy()
-        else:
-            text_cols = [c for c in filtered.columns if filtered[c].dtype == "object"]
-            filtered["all_text_norm"] = filtered[text_cols].apply(
-                lambda r: " ".join(normalize(v) for v in r.values if normalize(v)),
-                axis=1
-            )
-            filtered = filtered[filtered["all_text_norm"].str.contains(pattern_cat, na=False)].copy()
-
-    # filtro por tipo
-    pattern_tipo = build_contains_pattern(CHAVES_TIPO)
-    if pattern_tipo:
-        if "Tipo" in filtered.columns:
-            filtered["tipo_norm"] = filtered["Tipo"].apply(normalize)
-            filtered = filtered[filtered["tipo_norm"].str.contains(pattern_tipo, na=False)].copy()
+        df = df.rename(columns={tipo_guess: "Tipo"})
+    return df
+
+
+def filter_df(df: pd.DataFrame) -> pd.DataFrame:
+    """Filtro do assinante padrão (NOMES_RAW x FRASES_CATEGORIA x CHAVES_TIPO)."""
+    df = standardize_columns(df)
+
+    METRICS.gauge("filter_rows", len(df), stage="entrada")
+
+    # filtro por fundo (índice pré-compilado, um lookup por valor distinto)
+    if "Nome_Fundo" in df.columns:
+        codigo, score = fund_index().match(df["Nome_Fundo"])
+        mask = codigo != ""
+    else:
+        codigo = np.full(len(df), "", dtype=object)
+        score = np.zeros(len(df))
+        mask = np.zeros(len(df), dtype=bool)
+    if METRICS.enabled:
+        METRICS.gauge("filter_rows", int(mask.sum()), stage="fundo")
+
+    # filtro por categoria e por tipo, combinados numa máscara só
+    all_text = None
+    for col, terms in (("Categoria", FRASES_CATEGORIA), ("Tipo", CHAVES_TIPO)):
+        pattern = compile_contains(tuple(terms))
+        if pattern is None or not mask.any():
+            continue
+        if col in df.columns:
+            mask &= contains_mask(df[col], pattern)
         else:
-            text_cols = [c for c in filtered.columns if filtered[c].dtype == "object"]
-            filtered["all_text_norm2"] = filtered[text_cols].apply(
-                lambda r: " ".join(normalize(v) for v in r.values if normalize(v)),
-                axis=1
-            )
-            filtered = filtered[filtered["all_text_norm2"].str.contains(pattern_tipo, na=False)].copy()
+            if all_text is None:
+                all_text = all_text_normalized(df)
+            mask &= all_text.str.contains(pattern, na=False).to_numpy(dtype=bool)
+        if METRICS.enabled:
+            METRICS.gauge("filter_rows", int(mask.sum()), stage=col.lower())
 
-    for tmp in ["nome_norm", "cat_norm", "tipo_norm", "all_text_norm", "all_text_norm2"]:
-        if tmp in filtered.columns:
-            filtered = filtered.drop(columns=[tmp])
+    filtered = df.loc[mask].copy()
+    filtered["Codigo_Fundo"] = codigo[mask]
+    filtered["Score_Fundo"] = score[mask]
+
+    # datas só nas linhas que sobraram
+    for col in DATE_COLS:
+        if col in filtered.columns:
+            filtered[col] = pd.to_datetime(filtered[col], dayfirst=True, errors="coerce")
 
     return filtered
 
 
-def send_email(lines: list[str]):
-    user = "viniciuskaolo@gmail.com"           # seu gmail
-    app_pass = "hjlv knog yxjt muku"   # app password (16 chars)
+def default_assinantes() -> list[Assinante]:
+    # sem assinantes.json: o assinante único com as listas do módulo (= filter_df)
+    return [Assinante("padrao", EMAIL_TO, [], FRASES_CATEGORIA, CHAVES_TIPO, EMAIL_SUBJECT)]
 
-    if not user or not app_pass:
-        print("\n[AVISO] Variáveis de ambiente não configuradas. Não vou enviar email.")
-        print("Configure assim (exemplo):")
-        print("  export GMAIL_USER='seuemail@gmail.com'")
-        print("  export GMAIL_APP_PASS='sua_app_password_de_16_chars'")
-        print("\nConteúdo que iria no email:\n")
-        print("\n".join(lines))
-        return
 
-    text_body = "Olá,\n\nSeguem os documentos:\n\n" + "\n".join(lines)
-    yag = yagmail.SMTP(user, app_pass)
-    yag.send(to=EMAIL_TO, subject=EMAIL_SUBJECT, contents=[text_body])
-    yag.close()
-    print(f"Email enviado com {len(lines)} linhas.")
+RULES = RuleBook.from_env(default_assinantes)
 
 
-def main():
-    driver = make_driver()
-    try:
-        driver.get(URL)
-        wait = WebDriverWait(driver, 20)
+def route_df(df: pd.DataFrame) -> Roteamento:
+    """Roteia cada documento para todos os assinantes cujas regras ele satisfaz, numa passada."""
+    df = standardize_columns(df)
+    index = fund_index()
+    regras = RULES.get(index.tickers)
+    METRICS.gauge("filter_rows", len(df), stage="entrada")
+
+    if "Nome_Fundo" in df.columns:
+        df["Codigo_Fundo"], df["Score_Fundo"] = index.match(df["Nome_Fundo"])
+    else:
+        df["Codigo_Fundo"] = ""
+        df["Score_Fundo"] = 0.0
+
+    all_text = None
+    textos = []
+    for col in ("Categoria", "Tipo"):
+        if col in df.columns:
+            textos.append(df[col])
+        else:
+            if all_text is None:
+                all_text = all_text_normalized(df)
+            textos.append(all_text)
+
+    roteamento = route(regras, df, df["Codigo_Fundo"].to_numpy(dtype=object), *textos)
+    METRICS.gauge("filter_rows", len(roteamento.df), stage="roteado")
+    for col in DATE_COLS:
+        if col in roteamento.df.columns:
+            roteamento.df[col] = pd.to_datetime(roteamento.df[col], dayfirst=True, errors="coerce")
+    return roteamento
+
+
+def pushdown_regras() -> list[tuple[list[str], list[str], list[Fundo]]]:
+    """(categorias, tipos, fundos) de cada assinante, para o Planejador."""
+    fundos = {f.ticker: f for f in fundos_from_pairs(NOMES_RAW, load_extras())}
+    regras = []
+    for a in RULES.assinantes():
+        lista = [fundos[t] for t in a.fundos if t in fundos] if a.fundos else list(fundos.values())
+        regras.append((a.categorias, a.tipos, lista))
+    return regras
 
-        # abrir filtros
-        wait.until(EC.element_to_be_clickable((By.ID, "showFiltros"))).click()
 
-        # dataInicial = ontem
-        hoje = date.today()
-        ontem = hoje - timedelta(days=1)
-        valor_data = f"{ontem.day:02d}/{ontem.month:02d}/{ontem.year}"
+# outbox + conexão SMTP reaproveitada (credenciais em SMTP_USER/SMTP_PASS)
+NOTIFIER = compartilhado()
 
-        el = wait.until(EC.element_to_be_clickable((By.ID, "dataInicial")))
+
+def send_email(lines: list[str], to: list[str] | None = None, subject: str | None = None):
+    NOTIFIER.send(to or EMAIL_TO, subject or EMAIL_SUBJECT, lines)
+
+
+def email_chaves() -> list[tuple[str, str]]:
+    """Chaves (grupo, assunto) do outbox que são deste pipeline."""
+    chaves = [chave(a.emails or EMAIL_TO, a.assunto or EMAIL_SUBJECT) for a in RULES.assinantes()]
+    return list(dict.fromkeys([chave(EMAIL_TO, EMAIL_SUBJECT), *chaves]))
+
+
+def flush_emails() -> int:
+    """Reenvia os emails vencidos deste pipeline (os de outros jobs no outbox ficam com eles)."""
+    return NOTIFIER.flush(email_chaves())
+
+
+def query_selenium(
+    driver,
+    data_inicial: date,
+    data_final: date | None = None,
+    store: DocStore | None = None,
+    paging: str | None = None,
+) -> pd.DataFrame:
+    """Aplica os filtros no driver (já aberto) e coleta todas as páginas."""
+    return concat_pages(iter_query_selenium(driver, data_inicial, data_final, store=store, paging=paging))
+
+
+def iter_query_selenium(
+    driver,
+    data_inicial: date,
+    data_final: date | None = None,
+    store: DocStore | None = None,
+    paging: str | None = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Aplica os filtros no driver (já aberto) e devolve as páginas conforme são lidas.
+    paging "cdp" lê o JSON dos XHRs (driver com capture_network); "dom" (padrão) lê a tabela.
+    """
+    paging = paging or os.environ.get("FNET_PAGING", "dom")
+    DRIVERS.get(driver, URL)
+
+    # abrir filtros
+    ESPERAS.until(driver, EC.element_to_be_clickable((By.ID, "showFiltros")), "filtros").click()
+
+    for field_id, valor in (("dataInicial", data_inicial), ("dataFinal", data_final)):
+        if valor is None:
+            continue
+        el = ESPERAS.until(driver, EC.element_to_be_clickable((By.ID, field_id)), "campo_data")
         el.clear()
-        el.send_keys(valor_data)
+        el.send_keys(format_data(valor))
 
-        ok = select2_by_text_click(driver, "s2id_tipoFundo", "Fundo Imobiliário")
-        if not ok:
-            raise RuntimeError("Não consegui selecionar 'Fundo Imobiliário'.")
+    ok = select2_by_text_click(driver, "s2id_tipoFundo", "Fundo Imobiliário")
+    if not ok:
+        raise RuntimeError("Não consegui selecionar 'Fundo Imobiliário'.")
 
-        # filtrar
-        wait.until(EC.element_to_be_clickable((By.ID, "filtrar"))).click()
+    # filtrar
+    ESPERAS.until(driver, EC.element_to_be_clickable((By.ID, "filtrar")), "filtrar").click()
 
-        # esperar tabela e setar 100 linhas
-        wait_table_ready(driver)
-        dropdown = wait.until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "div#tblDocumentosEnviados_length select"))
-        )
-        Select(dropdown).select_by_value("100")
-        wait_table_ready(driver)
+    # esperar tabela e setar 100 linhas
+    wait_table_ready(driver)
+    dropdown = ESPERAS.until(
+        driver, EC.presence_of_element_located((By.CSS_SELECTOR, "div#tblDocumentosEnviados_length select")),
+        "tamanho_pagina",
+    )
+    Select(dropdown).select_by_value("100")
+    wait_table_ready(driver)
 
-        data = collect_pages(driver)
-        if data.empty:
-            print("Tabela vazia / nada encontrado.")
-            return
+    if paging == "cdp":
+        yield from iter_pages_cdp(driver, store=store)
+    else:
+        yield from iter_table_pages(driver, store=store)
+
+
+def collect_selenium(data_inicial: date, store: DocStore | None = None) -> pd.DataFrame:
+    return concat_pages(iter_selenium(data_inicial, store=store))
 
+
+def iter_selenium(data_inicial: date, store: DocStore | None = None) -> Iterator[pd.DataFrame]:
+    driver = make_driver()
+    try:
+        yield from iter_query_selenium(driver, data_inicial, store=store)
     finally:
+        DRIVERS.quit(driver)
+        print(f"Chrome: {DRIVERS.timings.as_dict()}")
+        print(f"Esperas: {ESPERAS.report()}")
+        ESPERAS.save()
+
+
+def collect(
+    data_inicial: date,
+    backend: str = "http",
+    store: DocStore | None = None,
+    pushdown: bool = False,
+) -> pd.DataFrame:
+    """Tudo de iter_collect num DataFrame só."""
+    return concat_pages(iter_collect(data_inicial, backend=backend, store=store, pushdown=pushdown))
+
+
+def iter_collect(
+    data_inicial: date,
+    backend: str = "http",
+    store: DocStore | None = None,
+    pushdown: bool = False,
+) -> Iterator[pd.DataFrame]:
+    """
+    Coleta os documentos de FII a partir de data_inicial, página por página.
+    - com store, devolve só documentos ainda não vistos (e para de paginar cedo)
+    - backend "http": consulta direto o endpoint JSON (sem navegador)
+    - pushdown (só HTTP): consulta o FNET já filtrado pelas regras dos assinantes, em vez
+      de baixar tudo; o arquivo Parquet passa a receber só essas linhas (ou tudo, quando o
+      plano custaria mais requisições que a coleta completa)
+    - se o HTTP falhar (ou backend "selenium"), usa o Chrome headless
+    """
+    # DocNumbers já entregues nesta coleta: o fallback relê desde o início, e o que ainda
+    # está no buffer do StreamSink não foi marcado no store
+    entregues: set[str] = set()
+
+    def unseen(pages: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        for page in pages:
+            if store is not None:
+                page = store.unseen(page)
+            if entregues and not page.empty and "DocNumber" in page.columns:
+                # teste de pertinência no set (isin com um set grande custa O(set) por página)
+                novos = [d not in entregues for d in page["DocNumber"].astype(str)]
+                page = page[novos].reset_index(drop=True)
+            if not page.empty:
+                if "DocNumber" in page.columns:
+                    entregues.update(page["DocNumber"].astype(str))
+                yield page
+
+    parcial = False
+    if backend == "http":
         try:
-            driver.quit()
-        except Exception:
-            pass
+            if pushdown:
+                pages = Planejador().iter_collect(data_inicial, regras=pushdown_regras(), store=store)
+                for page in unseen(pages):
+                    parcial = True
+                    yield page
+            else:
+                with FnetClient() as client:
+                    for page in unseen(until_known(client.iter_pages(data_inicial), store)):
+                        parcial = True
+                        yield page
+            return
+        except (requests.RequestException, ValueError) as e:
+            print(f"[AVISO] Backend HTTP falhou ({e}). Usando Selenium.")
+            METRICS.inc("backend_fallback", origem="http", destino="selenium")
+
+    # depois de uma falha no meio, relê desde o início: sem parada antecipada, só dedupe
+    yield from unseen(iter_selenium(data_inicial, store=None if parcial else store))
+
+
+def run_once(
+    data_inicial: date,
+    store: DocStore,
+    backend: str = "http",
+    download: bool = False,
+    pushdown: bool = False,
+    extrair_texto: bool = False,
+) -> int:
+    """
+    Coleta incremental em streaming: cada página vai para o arquivo e para o roteamento/email
+    assim que é lida (StreamSink). Devolve quantos documentos novos.
+    """
+    sink = StreamSink(store, download=download, extrair_texto=extrair_texto)
+    with METRICS.span("collect", backend=backend), sink:
+        for page in iter_collect(data_inicial, backend=backend, store=store, pushdown=pushdown):
+            sink.add(page)
+
+    METRICS.gauge("collected_rows", sink.rows)
+    if not sink.rows:
+        print("Tabela vazia / nada novo encontrado.")
+    elif not sink.matched:
+        print("Nenhum registro após os filtros.")
+    return sink.rows
+
+
+def main(
+    backend: str | None = None,
+    download: bool | None = None,
+    pushdown: bool | None = None,
+    data_inicial: date | None = None,
+    extrair_texto: bool | None = None,
+):
+    backend = backend or os.environ.get("FNET_BACKEND", "http")
+    if pushdown is None:
+        pushdown = os.environ.get("FNET_PUSHDOWN", "") == "1"
+    if download is None:
+        download = os.environ.get("FNET_DOWNLOAD", "") == "1"
+    if extrair_texto is None:
+        extrair_texto = os.environ.get("FNET_TEXTO", "") == "1"
+
+    # dataInicial = ontem
+    hoje = date.today()
+    ontem = hoje - timedelta(days=1)
 
-    df_final = filter_df(data)
+    try:
+        with METRICS.span("run", backend=backend), DocStore() as store:
+            run_once(
+                data_inicial or ontem, store, backend=backend, download=download, pushdown=pushdown,
+                extrair_texto=extrair_texto,
+            )
+    finally:
+        METRICS.flush()
 
-    if df_final.empty:
-        print("Nenhum registro após os filtros.")
-        return
 
-    # linhas: CODIGO | CATEGORIA - TIPO: LINK
-    lines: list[str] = []
-    for row in df_final.itertuples(index=False):
-        doc = getattr(row, "DocNumber", None)
-        if doc is None or (isinstance(doc, float) and pd.isna(doc)) or str(doc).strip() == "":
-            continue
+def download_matches(df_final: pd.DataFrame, archive: Archive, extrair_texto: bool = False):
+    """
+    Baixa os documentos filtrados para o cache local; com extrair_texto, grava no arquivo o
+    texto dos que ainda não têm (os do cache já foram extraídos numa execução anterior).
+    """
+    results = asyncio.run(download_documents(df_final["DocNumber"]))
+    print(f"Downloads: {summarize(results)}")
+    if extrair_texto:
+        com_texto = set(archive.texts([r.doc for r in results], columns=["DocNumber"])["DocNumber"])
+        archive.append_texts(texts_frame([r for r in results if r.doc not in com_texto]))
+
+
+VIEW_URL = f"{BASE_URL}/{DOC_PREFIX}"
 
-        codigo = getattr(row, "Codigo_Fundo", "") or ""
-        if isinstance(codigo, float) and pd.isna(codigo):
-            codigo = ""
-        codigo = str(codigo).strip()
 
-        categoria = getattr(row, "Categoria", "") if "Categoria" in df_final.columns else ""
-        if isinstance(categoria, float) and pd.isna(categoria):
-            categoria = ""
-        categoria = str(categoria).strip()
+def _text_col(df: pd.DataFrame, col: str) -> pd.Series:
+    if col not in df.columns:
+        return pd.Series("", index=df.index, dtype="string")
+    return df[col].astype("string").fillna("").str.strip()
 
-        tipo = getattr(row, "Tipo", "") if "Tipo" in df_final.columns else ""
-        if isinstance(tipo, float) and pd.isna(tipo):
-            tipo = ""
-        tipo = str(tipo).strip()
 
-        prefix = " - ".join([p for p in [categoria, tipo] if p]) or "Sem categoria/tipo"
-        link = f"https://fnet.bmfbovespa.com.br/fnet/publico/visualizarDocumento?id={doc}&cvm=true"
+def format_lines(df: pd.DataFrame) -> list[str]:
+    """Linhas do email: CODIGO | CATEGORIA - TIPO: LINK (vetorizado, sem loop por linha)."""
+    if df.empty:
+        return []
+    doc = _text_col(df, "DocNumber")
+    categoria = _text_col(df, "Categoria")
+    tipo = _text_col(df, "Tipo")
 
-        lines.append(f"{codigo} | {prefix}: {link}")
+    prefix = categoria.where(tipo.eq(""), categoria + " - " + tipo).where(categoria.ne(""), tipo)
+    prefix = prefix.mask(prefix.eq(""), "Sem categoria/tipo")
+    lines = _text_col(df, "Codigo_Fundo") + " | " + prefix + ": " + VIEW_URL + doc + DOC_SUFFIX
+    return lines[doc.ne("")].tolist()
+
+
+ARCHIVE_BATCH_ROWS = 50_000
+NOTIFY_FLUSH_S = 30.0
+
+
+class StreamSink:
+    """
+    Destino incremental das páginas de iter_collect (memória constante, qualquer nº de páginas):
+    - arquivo Parquet em lotes de até archive_batch_rows
+    - cada página é roteada na hora; as linhas de cada assinante saem no primeiro resultado
+      e depois a cada flush_s
+    - resultado_filtrado.csv gravado por append
+    - DocNumbers marcados como vistos (pendentes) só depois de arquivados; os roteados só
+      entram no arquivo depois que o email deles está no outbox (persistente): um erro antes
+      disso deixa a página sem arquivar nem marcar, e a próxima coleta a relê sem duplicar
+      linhas no arquivo; close() confirma a coleta no DocStore
+    Use como context manager: com erro no meio, o que já foi lido ainda é arquivado e vai
+    para o outbox, mas a coleta não é confirmada (a próxima não para nas páginas pendentes).
+    O envio SMTP em si é do outbox (notificacao): send_email só enfileira, e um envio que
+    falha fica lá para nova tentativa com backoff -- a página não é reprocessada por isso.
+    Página sem DocNumber é arquivada e roteada, mas não tem o que marcar no DocStore.
+    """
+
+    def __init__(
+        self,
+        store: DocStore | None,
+        archive: Archive | None = None,
+        download: bool = False,
+        extrair_texto: bool = False,
+        archive_batch_rows: int = ARCHIVE_BATCH_ROWS,
+        flush_s: float = NOTIFY_FLUSH_S,
+        csv_path: str = "resultado_filtrado.csv",
+    ):
+        self.store = store
+        self.archive = archive or Archive()
+        self.download = download
+        self.extrair_texto = extrair_texto
+        self.archive_batch_rows = archive_batch_rows
+        self.flush_s = flush_s
+        self.csv_path = csv_path
+        self.rows = 0
+        self.matched = 0
+        self._archive_buf: list[pd.DataFrame] = []
+        self._archive_rows = 0
+        self._archive_roteados: list[pd.DataFrame] = []  # arquivados só depois de enfileirados
+        self._lines: dict[str, tuple[Assinante, list[str]]] = {}
+        self._matches: list[pd.DataFrame] = []
+        self._docs: list[pd.Series] = []  # sem roteamento: vistos assim que arquivados
+        self._docs_roteados: list[pd.Series] = []  # vistos só depois de enfileirados
+        self._last_flush: float | None = None
+        self._csv_started = False
+
+    def add(self, page: pd.DataFrame):
+        if page.empty:
+            return
+        self.rows += len(page)
+        arquivo = archive_frame(page)
+
+        with METRICS.span("filter"):
+            roteamento = route_df(page)
+        # sem DocNumber não há o que marcar nem como separar os roteados: tudo vai direto
+        docs = page["DocNumber"] if "DocNumber" in page.columns else None
+        if not roteamento.df.empty:
+            if docs is not None:
+                roteados = docs.astype(str).isin(roteamento.df["DocNumber"].astype(str))
+                self._docs_roteados.append(docs[roteados])
+                self._archive_roteados.append(arquivo[roteados.to_numpy()])
+                arquivo = arquivo[~roteados.to_numpy()]
+                docs = docs[~roteados]
+            self._matches.append(roteamento.df)
+            for assinante, rows in roteamento.por_assinante():
+                self._lines.setdefault(assinante.nome, (assinante, []))[1].extend(format_lines(rows))
+        if docs is not None:
+            self._docs.append(docs)
+        self._archive_buf.append(arquivo)
+        self._archive_rows += len(arquivo)
+
+        agora = time.monotonic()
+        if self._lines and (self._last_flush is None or agora - self._last_flush >= self.flush_s):
+            self.flush()
+        elif self._archive_rows >= self.archive_batch_rows:
+            self._flush_archive()
+
+    def _mark(self, docs: list[pd.Series]):
+        if self.store is not None and docs:
+            self.store.mark_seen(pd.concat(docs, ignore_index=True), committed=False)
+
+    def _flush_archive(self):
+        if self._archive_buf:
+            with METRICS.span("archive"):
+                self.archive.append(pd.concat(self._archive_buf, ignore_index=True))
+            self._archive_buf, self._archive_rows = [], 0
+        # os não roteados já estão no arquivo: marca aqui, para o buffer não crescer sem matches
+        self._mark(self._docs)
+        self._docs = []
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        self._flush_archive()
+
+        if self._matches:
+            # cada pendência só sai do buffer depois de feita: se algo falhar aqui (outbox,
+            # CSV, download), o flush do __exit__ tenta de novo em vez de arquivar/marcar o
+            # que não foi enfileirado
+            for nome, (assinante, lines) in list(self._lines.items()):
+                print(f"{assinante.nome}: {len(lines)} documento(s)")
+                send_email(lines, to=assinante.emails, subject=assinante.assunto or EMAIL_SUBJECT)
+                del self._lines[nome]
+            matches = pd.concat(self._matches, ignore_index=True)
+            self._matches = []
+            self.matched += len(matches)
+            matches.to_csv(self.csv_path, mode="a" if self._csv_started else "w",
+                           header=not self._csv_started, index=False)
+            self._csv_started = True
+            print(f"Salvo: {self.csv_path} (+{len(matches)} linhas)")
+            if self.download:
+                with METRICS.span("download"):
+                    download_matches(matches, self.archive, self.extrair_texto)
+
+        # roteados: arquivados e marcados como vistos só depois do email estar no outbox
+        # (a entrega SMTP e os retries são do outbox; aqui não se espera por ela)
+        if self._archive_roteados:
+            with METRICS.span("archive"):
+                self.archive.append(pd.concat(self._archive_roteados, ignore_index=True))
+            self._archive_roteados = []
+        self._mark(self._docs_roteados)
+        self._docs_roteados = []
+
+    def close(self):
+        self.flush()
+        if self.store is not None:
+            self.store.commit_run()
+
+    def __enter__(self) -> StreamSink:
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.flush()
+
+
+def notify(data: pd.DataFrame) -> pd.DataFrame:
+    """Roteia os documentos e manda um email por assinante; devolve as linhas roteadas."""
+    with METRICS.span("filter"):
+        roteamento = route_df(data)
+    df_final = roteamento.df
+
+    if df_final.empty:
+        print("Nenhum registro após os filtros.")
+        return df_final
 
     df_final.to_csv("resultado_filtrado.csv", index=False)
     print(f"Salvo: resultado_filtrado.csv ({len(df_final)} linhas)")
 
-    send_email(lines)
+    for assinante, rows in roteamento.por_assinante():
+        print(f"{assinante.nome}: {len(rows)} documento(s)")
+        send_email(format_lines(rows), to=assinante.emails, subject=assinante.assunto or EMAIL_SUBJECT)
+    return df_final
 
 
 if __name__ == "__main__":
@@ -0,0 +1,178 @@
+"""
+Ponto de entrada único dos pipelines (FNET e cotações).
+
+  python seiko.py fii collect [--backend http|selenium] [--pushdown] [--download [--texto]] [--desde AAAA-MM-DD]
+  python seiko.py fii backfill INICIO FIM [...]     # backfill.py
+  python seiko.py fii query [--ticker ...]          # consulta o arquivo Parquet (arquivo.py)
+  python seiko.py fii plan [...]                    # plano de consultas do pushdown (planejador.py)
+  python seiko.py fii poll [--interval ...]         # monitor contínuo (monitor.py)
+  python seiko.py quotes update [TICKERS ...]       # histórico local de cotações (precos.py)
+  python seiko.py quotes report [...]               # relatório em BRL + email (espanhola.py)
+  python seiko.py outbox flush|status               # fila de emails (notificacao.py)
+  python seiko.py run "fii collect" "quotes report" # vários jobs em paralelo, num processo só
+
+Cada subcomando importa só os módulos dele (selenium/bs4 só entram nos jobs do FNET).
+No `run`, os jobs rodam em threads do mesmo processo: dividem o STATE_DIR, o METRICS e a
+conexão SMTP/outbox (notificacao.compartilhado); o outbox é drenado e as métricas gravadas
+uma vez, no fim.
+"""
+from __future__ import annotations
+
+import argparse
+import importlib
+import shlex
+import signal
+import sys
+import threading
+import time
+from datetime import date
+from typing import Callable
+
+
+# (grupo, ação) -> (módulo, função main(argv)); módulo "seiko" = adaptador deste arquivo
+COMANDOS: dict[tuple[str, str], tuple[str, str]] = {
+    ("fii", "collect"): ("seiko", "fii_collect"),
+    ("fii", "backfill"): ("backfill", "main"),
+    ("fii", "query"): ("arquivo", "main"),
+    ("fii", "plan"): ("planejador", "main"),
+    ("fii", "poll"): ("monitor", "main"),
+    ("quotes", "update"): ("precos", "main"),
+    ("quotes", "report"): ("espanhola", "main"),
+    ("outbox", "flush"): ("seiko", "outbox"),
+    ("outbox", "status"): ("seiko", "outbox"),
+}
+
+
+def fii_collect(argv: list[str]):
+    parser = argparse.ArgumentParser(prog="seiko.py fii collect", description="Coleta, filtra e notifica os documentos novos.")
+    parser.add_argument("--backend", choices=["http", "selenium"], default=None)
+    parser.add_argument("--pushdown", action="store_true", default=None)
+    parser.add_argument("--download", action="store_true", default=None)
+    parser.add_argument("--texto", action="store_true", default=None, help="extrai o texto dos baixados para o arquivo")
+    parser.add_argument("--desde", type=date.fromisoformat, help="data inicial (padrão: ontem)")
+    args = parser.parse_args(argv)
+
+    import retrive_fii
+
+    retrive_fii.main(
+        backend=args.backend, download=args.download, pushdown=args.pushdown, data_inicial=args.desde,
+        extrair_texto=args.texto,
+    )
+
+
+def outbox(argv: list[str]):
+    import notificacao
+
+    notificacao.main(argv)
+
+
+def resolve(tokens: list[str]) -> tuple[Callable[[list[str]], None], list[str]]:
+    """["fii", "collect", "--pushdown"] -> (função, ["--pushdown"]); importa o módulo aqui."""
+    if len(tokens) < 2 or (tokens[0], tokens[1]) not in COMANDOS:
+        validos = ", ".join(f"{g} {a}" for g, a in COMANDOS)
+        raise ValueError(f"comando desconhecido {' '.join(tokens[:2])!r} (válidos: {validos})")
+    grupo, acao, *argv = tokens
+    modulo, funcao = COMANDOS[(grupo, acao)]
+    if grupo == "outbox":
+        argv = [acao, *argv]
+    fn = globals()[funcao] if modulo == "seiko" else getattr(importlib.import_module(modulo), funcao)
+    return fn, argv
+
+
+def _run_job(nome: str, fn: Callable[[list[str]], None], argv: list[str], falhas: dict[str, str]):
+    t0 = time.perf_counter()
+    print(f"[{nome}] início")
+    try:
+        fn(argv)
+    except SystemExit as e:  # argparse / parser.error dentro do job
+        if e.code not in (0, None):
+            falhas[nome] = f"saiu com código {e.code}"
+    except Exception as e:
+        falhas[nome] = f"{type(e).__name__}: {e}"
+        print(f"[ERRO] [{nome}] {falhas[nome]}")
+    print(f"[{nome}] fim em {time.perf_counter() - t0:.1f}s")
+
+
+def run_jobs(jobs: list[str], sequencial: bool = False) -> int:
+    """Roda os jobs (cada um "grupo ação [args]") em threads; devolve o número de falhas."""
+    # resolve (e importa) tudo antes, na thread principal: comando inválido falha antes de
+    # qualquer job começar e os imports não disputam o lock entre threads
+    resolvidos = []
+    for job in jobs:
+        fn, argv = resolve(shlex.split(job))
+        resolvidos.append((job, fn, argv))
+
+    falhas: dict[str, str] = {}
+    if sequencial:
+        for job, fn, argv in resolvidos:
+            _run_job(job, fn, argv, falhas)
+    else:
+        threads = [
+            threading.Thread(target=_run_job, args=(job, fn, argv, falhas), name=job, daemon=True)
+            for job, fn, argv in resolvidos
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            while t.is_alive():
+                t.join(0.5)  # join com timeout: deixa o Ctrl-C chegar à thread principal
+    for job, erro in falhas.items():
+        print(f"[ERRO] {job}: {erro}")
+    return len(falhas)
+
+
+def _finalizar(drenar: bool = False):
+    """Recursos compartilhados entre os jobs: fecha uma vez, no fim (só olha o que foi importado)."""
+    if "notificacao" in sys.modules:
+        notificacao = sys.modules["notificacao"]
+        if drenar:
+            # retries vencidos enquanto os jobs rodavam saem na mesma conexão
+            notificacao.flush_all()
+        notificacao.close_all()
+    if "metricas" in sys.modules:
+        sys.modules["metricas"].METRICS.flush()
+
+
+def _parar(signum, frame):
+    if "monitor" in sys.modules:
+        sys.modules["monitor"].stop_all()
+    raise KeyboardInterrupt
+
+
+def main(argv: list[str] | None = None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0] in ("-h", "--help"):
+        print(__doc__)
+        return 0
+
+    if argv[0] == "run":
+        parser = argparse.ArgumentParser(prog="seiko.py run", description="Roda vários jobs no mesmo processo.")
+        parser.add_argument("jobs", nargs="+", help='ex.: "fii collect --pushdown" "quotes report --no-email"')
+        parser.add_argument("--sequencial", action="store_true", help="um job depois do outro")
+        args = parser.parse_args(argv[1:])
+        signal.signal(signal.SIGTERM, _parar)
+        signal.signal(signal.SIGINT, _parar)
+        try:
+            return 1 if run_jobs(args.jobs, args.sequencial) else 0
+        except ValueError as e:
+            parser.error(str(e))
+        except KeyboardInterrupt:
+            print("[AVISO] Interrompido; fechando os recursos compartilhados.")
+            return 130
+        finally:
+            _finalizar(drenar=True)
+
+    try:
+        fn, rest = resolve(argv)
+    except ValueError as e:
+        print(f"[ERRO] {e}", file=sys.stderr)
+        return 2
+    try:
+        fn(rest)
+    finally:
+        _finalizar()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
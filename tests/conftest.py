@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+import sys
+from contextlib import ExitStack
+from pathlib import Path
+
+import pytest
+
+# servidor de replay do FNET (benchmarks/replay_server.py): os testes de HTTP usam o mesmo
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+
+from replay_server import ReplayServer  # noqa: E402
+
+
+@pytest.fixture
+def replay():
+    """Fábrica de ReplayServer já rodando; todos param no fim do teste."""
+    with ExitStack() as stack:
+        yield lambda n_records=1000: stack.enter_context(ReplayServer(n_records))
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import analise
+from analise import ANUALIZACAO, JANELA_VOL, Analisador
+
+
+TICKERS = ["AMS.MC", "CLNX.MC", "IUSC.DE"]
+
+
+def precos(n: int = 160, seed: int = 0) -> pd.DataFrame:
+    """close_brl largo (coluna Data); CLNX.MC só negocia dia sim, dia não."""
+    rng = np.random.default_rng(seed)
+    datas = pd.bdate_range("2025-09-30", periods=n)
+    df = pd.DataFrame(
+        100 * np.exp(np.cumsum(rng.normal(0, 0.01, (n, len(TICKERS))), axis=0)), index=datas, columns=TICKERS,
+    )
+    df.iloc[1::2, 1] = np.nan
+    return df.rename_axis("Data").reset_index()
+
+
+def assert_mesma_analise(a, b):
+    pd.testing.assert_frame_equal(a.diaria, b.diaria, rtol=1e-12, atol=1e-14)
+    pd.testing.assert_frame_equal(a.resumo, b.resumo, rtol=1e-12, atol=1e-14)
+    pd.testing.assert_frame_equal(a.correlacao, b.correlacao, rtol=1e-12, atol=1e-14)
+
+
+def test_incremental_igual_ao_recalculo(tmp_path):
+    df = precos()
+    inc = Analisador(tmp_path / "inc")
+    for corte in (30, 31, 45, 80, 81, 120):
+        parcial = df.iloc[:corte]
+        if corte == 81:  # IUSC.DE falhou nesta execução
+            parcial = parcial.drop(columns="IUSC.DE")
+        inc.atualizar(parcial, TICKERS)
+    resultado = inc.atualizar(df, TICKERS)
+
+    assert_mesma_analise(resultado, Analisador(tmp_path / "ref").atualizar(df, TICKERS))
+
+
+def test_ticker_novo_entra_sem_recalcular_os_outros(tmp_path):
+    df = precos()
+    inc = Analisador(tmp_path / "inc")
+    inc.atualizar(df.iloc[:100].drop(columns="IUSC.DE"), TICKERS[:2])
+    estado = analise.Estado.load(inc.estado_path)
+    resultado = inc.atualizar(df, TICKERS)
+
+    assert analise.Estado.load(inc.estado_path).ate > estado.ate  # continuou, não recomeçou
+    assert_mesma_analise(resultado, Analisador(tmp_path / "ref").atualizar(df, TICKERS))
+
+
+def test_series_so_nas_datas_de_pregao(tmp_path):
+    df = precos()
+    diaria = Analisador(tmp_path).atualizar(df, TICKERS).diaria
+    clnx = diaria[diaria["Ticker"] == "CLNX.MC"].set_index("Data")
+    negocios = df.set_index("Data")["CLNX.MC"].dropna()
+
+    assert list(clnx.index) == list(negocios.index.astype("datetime64[us]"))
+    retorno = negocios.pct_change()
+    np.testing.assert_allclose(clnx["Retorno"], retorno, rtol=1e-12)
+    vol = retorno.rolling(JANELA_VOL).std() * np.sqrt(ANUALIZACAO)
+    np.testing.assert_allclose(clnx["Vol_Anual"], vol, rtol=1e-9)
+
+
+def test_queda_entre_a_parte_e_o_estado_nao_duplica(tmp_path, monkeypatch):
+    df = precos()
+    inc = Analisador(tmp_path / "inc")
+    inc.atualizar(df.iloc[:60], TICKERS)
+
+    save = analise.Estado.save
+    monkeypatch.setattr(analise.Estado, "save", lambda self, path: (_ for _ in ()).throw(OSError("queda")))
+    with pytest.raises(OSError):
+        inc.atualizar(df.iloc[:100], TICKERS)
+    monkeypatch.setattr(analise.Estado, "save", save)
+
+    resultado = inc.atualizar(df, TICKERS)
+    assert not resultado.diaria.duplicated(["Data", "Ticker"]).any()
+    assert_mesma_analise(resultado, Analisador(tmp_path / "ref").atualizar(df, TICKERS))
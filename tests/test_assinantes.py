@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import json
+import os
+
+import pytest
+
+import retrive_fii as rf
+from assinantes import RuleBook
+from bench_filter import make_df
+
+
+@pytest.fixture
+def regras(monkeypatch, tmp_path):
+    """Troca o RULES do módulo por um RuleBook em tmp_path (sem arquivo: assinante padrão)."""
+    book = RuleBook(tmp_path / "assinantes.json", rf.default_assinantes)
+    monkeypatch.setattr(rf, "RULES", book)
+    return book
+
+
+def escreve(book: RuleBook, assinantes: list[dict], mtime: float):
+    book.path.write_text(json.dumps({"assinantes": assinantes}), encoding="utf-8")
+    os.utime(book.path, (mtime, mtime))  # mtime explícito: duas escritas no mesmo tick contam
+
+
+def test_assinante_padrao_igual_ao_filter_df(regras):
+    df = make_df(5_000)
+    roteado = rf.route_df(df.copy()).df
+    filtrado = rf.filter_df(df.copy())
+    assert len(filtrado) > 0
+    assert roteado["DocNumber"].tolist() == filtrado["DocNumber"].tolist()
+    assert roteado["Codigo_Fundo"].tolist() == filtrado["Codigo_Fundo"].tolist()
+    assert set(roteado["Assinantes"]) == {"padrao"}
+
+
+def test_hot_reload_ao_reescrever_o_arquivo(regras, capsys):
+    df = make_df(5_000)
+    fundo = rf.NOMES_RAW[0][1]
+    escreve(regras, [{"nome": "um_fundo", "emails": ["a@x.com"], "fundos": [fundo]}], mtime=1_000)
+    roteado = rf.route_df(df.copy()).df
+    assert len(roteado) > 0 and set(roteado["Codigo_Fundo"]) == {fundo}
+    assert [a.nome for a in regras.assinantes()] == ["um_fundo"]
+
+    escreve(regras, [
+        {"nome": "um_fundo", "emails": ["a@x.com"], "fundos": [fundo]},
+        {"nome": "relatorios", "emails": ["b@x.com"], "categorias": ["Relatórios"]},
+    ], mtime=2_000)
+    roteamento = rf.route_df(df.copy())
+    assert [a.nome for a in roteamento.assinantes] == ["um_fundo", "relatorios"]
+    por_nome = {a.nome: linhas for a, linhas in roteamento.por_assinante()}
+    assert set(por_nome["relatorios"]["Categoria"]) == {"Relatórios"}
+    assert set(por_nome["relatorios"]["Codigo_Fundo"]) > {fundo}
+
+    # config inválida: avisa e mantém as regras anteriores
+    regras.path.write_text("{", encoding="utf-8")
+    os.utime(regras.path, (3_000, 3_000))
+    assert [a.nome for a in regras.assinantes()] == ["um_fundo", "relatorios"]
+    assert "[AVISO]" in capsys.readouterr().out
+
+    # arquivo removido: volta ao assinante padrão
+    regras.path.unlink()
+    assert [a.nome for a in regras.assinantes()] == ["padrao"]
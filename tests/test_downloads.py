@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import asyncio
+
+from downloads import DocumentCache, download_documents, texts_frame
+
+
+def baixar(docs, cache, srv):
+    return asyncio.run(download_documents(docs, cache, base_url=srv.base_url, retries=0, timeout=10))
+
+
+def test_primeiro_download_e_acerto_no_cache(replay, tmp_path):
+    srv = replay()
+    with DocumentCache(tmp_path / "docs") as cache:
+        primeiro = baixar(["101", "102", "101"], cache, srv)
+        assert sorted(r.doc for r in primeiro) == ["101", "102"]
+        assert {r.status for r in primeiro} == {"ok"}
+        assert srv.requests == 2
+        assert all(r.path.read_bytes() == f"<html><body><p>Documento {r.doc}</p></body></html>".encode()
+                   for r in primeiro)
+
+        segundo = baixar(["101", "102"], cache, srv)
+        assert {r.status for r in segundo} == {"cache"}
+        assert srv.requests == 2  # nada de HTTP novo
+        assert {r.doc: r.path for r in segundo} == {r.doc: r.path for r in primeiro}
+
+        textos = texts_frame(segundo).set_index("DocNumber")["Texto"]
+        assert textos.to_dict() == {"101": "Documento 101", "102": "Documento 102"}
+
+
+def test_conteudo_igual_ocupa_um_blob(replay, tmp_path):
+    srv = replay()
+    with DocumentCache(tmp_path / "docs") as cache:
+        (baixado,) = baixar(["7"], cache, srv)
+        # outro DocNumber com o mesmo conteúdo (ex.: reapresentação): mesmo blob, sem HTTP
+        copia = cache.put("8", baixado.path.read_bytes(), baixado.content_type)
+
+        assert copia == baixado.path
+        assert cache.get("8") == cache.get("7") == baixado.path
+        assert len(list((tmp_path / "docs" / "blobs").rglob("*"))) == 2  # subpasta + um arquivo
+        assert cache.total_bytes() == baixado.path.stat().st_size
+
+        resultado = baixar(["7", "8"], cache, srv)
+        assert {r.status for r in resultado} == {"cache"}
+        assert srv.requests == 1
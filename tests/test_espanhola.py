@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import threading
+import time
+from datetime import date
+
+import pandas as pd
+
+import espanhola
+from espanhola import fetch_quotes
+from precos import FixtureProvider, PriceStore
+from test_precos import cotacoes
+
+
+class GravacaoLenta(PriceStore):
+    """merge() demora: a gravação ainda está em andamento quando o prazo do lote estoura."""
+
+    def merge(self, ticker, novo, desde):
+        time.sleep(0.5)
+        return super().merge(ticker, novo, desde)
+
+
+class Travado:
+    """Provedor que não responde até `solto` (ou 3 s)."""
+
+    def __init__(self):
+        self.solto = threading.Event()
+
+    def fetch(self, tickers, start, end=None):
+        self.solto.wait(3)
+        return pd.DataFrame()
+
+
+def test_sem_linhas_novas_e_sem_dados_mesmo_com_historico(tmp_path):
+    store = PriceStore(tmp_path / "precos")
+    store.update(["AMS.MC"], FixtureProvider(cotacoes(["AMS.MC"], date(2025, 11, 28))))
+
+    vazio = FixtureProvider(cotacoes(["ELE.MC"], date(2025, 12, 31)))
+    resultado = fetch_quotes(["AMS.MC"], store=store, provider=vazio)
+    st = resultado.status["AMS.MC"]
+    assert (st.status, st.linhas) == ("sem_dados", 0)
+    assert "28/11/2025" in st.erro
+    assert resultado.close.empty
+
+
+def test_gravacao_que_termina_no_join_conta(tmp_path, monkeypatch):
+    monkeypatch.setattr(espanhola, "JOIN_S", 2.0)
+    provider = FixtureProvider(cotacoes(["AMS.MC"], date(2025, 12, 31)))
+    resultado = fetch_quotes(["AMS.MC"], store=GravacaoLenta(tmp_path / "precos"), provider=provider, prazo_ticker_s=0.1)
+    assert resultado.status["AMS.MC"].status == "ok"
+    assert list(resultado.close.columns) == ["AMS.MC"]
+
+
+def test_provedor_travado_vira_timeout(tmp_path, monkeypatch):
+    monkeypatch.setattr(espanhola, "JOIN_S", 0.1)
+    travado = Travado()
+    try:
+        resultado = fetch_quotes(["AMS.MC"], store=PriceStore(tmp_path / "precos"), provider=travado, prazo_ticker_s=0.1)
+    finally:
+        travado.solto.set()
+    assert resultado.status["AMS.MC"].status == "timeout"
+    assert resultado.close.empty
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from datetime import date
+
+from estado import DocStore
+from fnet_http import FnetClient
+
+
+def test_queda_antes_do_commit_nao_avanca_a_marca(replay, tmp_path):
+    srv = replay(1000)
+    path = tmp_path / "fnet.sqlite3"
+    with FnetClient(base_url=srv.base_url, page_size=200) as client:
+        with DocStore(path) as store:
+            pages = client.iter_pages(date.today())
+            primeira = next(pages)
+            store.mark_seen(primeira["DocNumber"], committed=False)
+            # a coleta cai aqui: sem commit_run()
+
+        with DocStore(path) as store:
+            assert store.known(primeira["DocNumber"]) == set(primeira["DocNumber"])
+            assert store.known(primeira["DocNumber"], committed_only=True) == set()
+            assert not store.is_page_known(primeira)
+            df = client.collect(date.today(), store=store)
+            assert len(df) == 1000  # nada escondido pelos pendentes
+            assert store.unseen(df)["DocNumber"].tolist() == df["DocNumber"].iloc[200:].tolist()
+
+
+def test_reexecucao_nao_devolve_o_que_ja_foi_commitado(replay, tmp_path):
+    srv = replay(1000)
+    with FnetClient(base_url=srv.base_url, page_size=200) as client, DocStore(tmp_path / "fnet.sqlite3") as store:
+        df = client.collect(date.today(), store=store)
+        assert len(df) == 1000
+        store.mark_seen(df["DocNumber"], committed=False)
+        store.commit_run()
+
+        antes = srv.requests
+        assert client.collect(date.today(), store=store).empty
+        assert srv.requests == antes + 1  # a primeira página já é conhecida: para nela
+        assert store.unseen(df).empty
@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+from datetime import date
+
+from fnet_http import FnetClient
+
+
+def test_collect_pagina_ate_o_fim(replay):
+    srv = replay(1234)
+    with FnetClient(base_url=srv.base_url, page_size=200) as client:
+        pages = list(client.iter_pages(date.today()))
+        df = client.collect(date.today())
+
+    assert [len(p) for p in pages] == [200] * 6 + [34]
+    assert len(df) == 1234
+    assert df["DocNumber"].is_unique
+    assert list(df["DocNumber"].astype(str)) == [str(r["id"]) for r in srv.records]  # mais novo primeiro
+    assert srv.requests == 1 + 7 + 7  # aquecimento da sessão + 7 páginas por coleta
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import socket
+from email import message_from_bytes, policy
+
+import pytest
+from aiosmtpd.controller import Controller
+
+import notificacao
+from notificacao import BACKOFF_S, Mailer, Notifier, Outbox
+
+
+class Caixa:
+    """Handler do aiosmtpd: guarda as mensagens; recusa as `recusar` primeiras com 451."""
+
+    def __init__(self, recusar: int = 0):
+        self.recusar = recusar
+        self.recebidas = []
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.recusar:
+            self.recusar -= 1
+            return "451 4.3.0 tente mais tarde"
+        self.recebidas.append(message_from_bytes(envelope.content, policy=policy.default))
+        return "250 OK"
+
+
+def porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp():
+    def iniciar(recusar: int = 0) -> tuple[Caixa, Mailer]:
+        caixa = Caixa(recusar)
+        controller = Controller(caixa, hostname="127.0.0.1", port=porta_livre())
+        controller.start()
+        controllers.append(controller)
+        return caixa, Mailer("127.0.0.1", controller.port, security="none", sender="fnet@teste", timeout=5)
+
+    controllers = []
+    yield iniciar
+    for controller in controllers:
+        controller.stop()
+
+
+def test_agrupa_por_destinatarios_e_assunto(smtp, tmp_path):
+    caixa, mailer = smtp()
+    notifier = Notifier(mailer, Outbox(tmp_path / "outbox.sqlite3"))
+    notifier.outbox.enqueue(["A@x.com", "b@x.com"], "Relatório", ["doc 1", "doc 2"])
+    notifier.outbox.enqueue(["b@x.com", "a@x.com"], "Relatório", ["doc 2", "doc 3"])
+    notifier.outbox.enqueue(["a@x.com"], "Outro", ["doc 9"])
+
+    assert notifier.flush() == 2
+    assert len(caixa.recebidas) == 2
+    corpos = {m["Subject"]: m.get_content() for m in caixa.recebidas}
+    assert corpos["Relatório"].count("doc 2") == 1
+    assert all(f"doc {i}" in corpos["Relatório"] for i in (1, 2, 3))
+    assert notifier.outbox.counts() == {"enviado": 3}
+    assert mailer.connects == 1  # uma conexão para os dois grupos
+    notifier.close()
+
+
+def test_falha_fica_na_fila_com_backoff(smtp, tmp_path, monkeypatch):
+    caixa, mailer = smtp(recusar=1)
+    notifier = Notifier(mailer, Outbox(tmp_path / "outbox.sqlite3"))
+    agora = notificacao.time.time()
+
+    assert notifier.send(["a@x.com"], "Relatório", ["doc 1"]) == 0
+    assert caixa.recebidas == []
+    (tentativas, proximo, status) = notifier.outbox.conn.execute(
+        "SELECT tentativas, proximo_envio, status FROM mensagens"
+    ).fetchone()
+    assert (tentativas, status) == (1, "pendente")
+    assert agora + 0.5 * BACKOFF_S <= proximo <= notificacao.time.time() + 1.5 * BACKOFF_S
+
+    # antes do backoff vencer nada sai
+    assert notifier.flush() == 0
+
+    monkeypatch.setattr(notificacao.time, "time", lambda: proximo + 1)
+    assert notifier.flush() == 1
+    assert [m["Subject"] for m in caixa.recebidas] == ["Relatório"]
+    assert notifier.outbox.counts() == {"enviado": 1}
+    notifier.close()
+
+
+def test_backoff_dobra_e_desiste_depois_do_maximo(smtp, tmp_path, monkeypatch):
+    caixa, mailer = smtp(recusar=10)
+    notifier = Notifier(mailer, Outbox(tmp_path / "outbox.sqlite3"), max_tentativas=3)
+    notifier.outbox.enqueue(["a@x.com"], "Relatório", ["doc 1"])
+    monkeypatch.setattr(notificacao.random, "random", lambda: 0.5)  # sem jitter
+
+    esperas = []
+    agora = notificacao.time.time()
+    for _ in range(3):
+        monkeypatch.setattr(notificacao.time, "time", lambda agora=agora: agora)
+        assert notifier.flush() == 0
+        (proximo,) = notifier.outbox.conn.execute("SELECT proximo_envio FROM mensagens").fetchone()
+        esperas.append(proximo - agora)
+        agora = proximo
+
+    assert esperas == pytest.approx([BACKOFF_S, 2 * BACKOFF_S, 4 * BACKOFF_S])
+    assert notifier.outbox.counts() == {"falhou": 1}
+    assert notifier.outbox.due(agora + 10 * BACKOFF_S) == []
+    assert caixa.recebidas == []
+    notifier.close()
+
+
+def test_sem_credenciais_imprime_e_envia_depois(smtp, tmp_path):
+    outbox = Outbox(tmp_path / "outbox.sqlite3")
+    sem_smtp = Notifier(Mailer("127.0.0.1", 1), outbox)
+    assert not sem_smtp.mailer.configured
+    assert sem_smtp.send(["a@x.com"], "Relatório", ["doc 1"]) == 0
+    assert outbox.counts() == {"impresso": 1}
+    assert sem_smtp.flush() == 0  # não imprime de novo a cada flush
+    assert outbox.counts() == {"impresso": 1}
+
+    caixa, mailer = smtp()
+    assert Notifier(mailer, outbox).flush() == 1
+    assert [m["Subject"] for m in caixa.recebidas] == ["Relatório"]
+    assert outbox.counts() == {"enviado": 1}
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from precos import INICIO, FixtureProvider, PriceStore, normalize_prices
+
+
+def cotacoes(tickers: list[str], fim: date, inicio: date = INICIO) -> pd.DataFrame:
+    datas = pd.bdate_range(inicio, fim)
+    partes = []
+    for i, t in enumerate(tickers):
+        close = 100.0 + 10 * i + np.arange(len(datas))
+        partes.append(pd.DataFrame({
+            "Ticker": t, "Data": datas,
+            "Open": close - 0.5, "High": close + 1, "Low": close - 1, "Close": close, "Volume": 1000.0,
+        }))
+    return normalize_prices(pd.concat(partes, ignore_index=True))
+
+
+def test_segunda_execucao_baixa_so_o_que_falta(tmp_path):
+    store = PriceStore(tmp_path / "precos")
+    corte, fim = date(2025, 11, 28), date(2025, 12, 31)
+    completo = cotacoes(["AAAA11", "BBBB11", "CCCC11"], fim)
+    # o último pregão antes do corte é revisado depois (ajuste / fechamento parcial)
+    revisado = completo["Data"] == pd.Timestamp(corte)
+    completo.loc[revisado, "Close"] += 0.25
+    provider = FixtureProvider(completo)
+
+    antes = completo[completo["Data"] <= pd.Timestamp(corte)].copy()
+    antes.loc[antes["Data"] == pd.Timestamp(corte), "Close"] -= 0.25
+    primeira = FixtureProvider(antes)
+    antes_close = float(antes.loc[(antes["Ticker"] == "AAAA11") & (antes["Data"] == pd.Timestamp(corte)), "Close"].iloc[0])
+    baixadas = store.update(["AAAA11", "BBBB11"], primeira, end=corte)
+    n_antes = int((antes["Ticker"] != "CCCC11").sum())
+    assert (primeira.calls, primeira.rows_served) == (1, n_antes)
+    assert sum(baixadas.values()) == n_antes
+    assert store.last_date("AAAA11") == corte
+
+    # segunda execução, com um ticker novo: os antigos só desde corte - overlap, o novo desde INICIO
+    desde = corte - timedelta(days=7)
+    assert store.plan(["AAAA11", "BBBB11", "CCCC11"]) == {desde: ["AAAA11", "BBBB11"], INICIO: ["CCCC11"]}
+    baixadas = store.update(["AAAA11", "BBBB11", "CCCC11"], provider, end=fim)
+    rabo = (completo["Data"] >= pd.Timestamp(desde)) & (completo["Ticker"] != "CCCC11")
+    novo = int((completo["Ticker"] == "CCCC11").sum())
+    assert provider.calls == 2
+    assert provider.rows_served == int(rabo.sum()) + novo
+    assert baixadas == {"AAAA11": int(rabo.sum()) // 2, "BBBB11": int(rabo.sum()) // 2, "CCCC11": novo}
+
+    for t in ("AAAA11", "BBBB11", "CCCC11"):
+        esperado = completo[completo["Ticker"] == t].reset_index(drop=True)
+        assert_frame_equal(store.read(t), esperado)
+        assert store.coverage(t) == (INICIO, fim)
+    # a revisão do pregão do corte, rebaixada pelo overlap, prevalece sobre a versão antiga
+    assert store.load(["AAAA11"]).loc[pd.Timestamp(corte), "AAAA11"] == antes_close + 0.25
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import json
+import shutil
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import retrive_fii as rf
+from check_read_table import table_html
+from fnet_http import records_to_df
+from replay_server import FIXTURES
+
+
+PAGINAS = sorted(FIXTURES.glob("tblDocumentosEnviados_*.html"))
+
+
+def referencia(path) -> pd.DataFrame:
+    # o parser original (bs4/html.parser) é a referência dos outros modos
+    return rf.table_data_to_df(rf.parse_table_html(table_html(path)))
+
+
+@pytest.mark.parametrize("path", PAGINAS, ids=lambda p: p.name)
+def test_lxml_igual_ao_bs4(path):
+    ref = referencia(path)
+    assert not ref.empty and ref["DocNumber"].str.isdigit().all()
+    assert_frame_equal(ref, rf.table_data_to_df(rf.parse_table_html_lxml(table_html(path))))
+
+
+@pytest.mark.parametrize("path", PAGINAS, ids=lambda p: p.name)
+def test_json_igual_a_tabela(path):
+    json_path = FIXTURES / path.name.replace("tblDocumentosEnviados", "pesquisarGerenciadorDocumentosDados")
+    json_path = json_path.with_suffix(".json")
+    if not json_path.exists():
+        pytest.skip(f"sem {json_path.name}")
+    records = json.loads(json_path.read_text(encoding="utf-8"))["data"]
+    assert_frame_equal(referencia(path), records_to_df(records))
+
+
+@pytest.fixture(scope="module")
+def driver():
+    if not any(shutil.which(b) for b in ("google-chrome", "chromium", "chromium-browser", "chrome")):
+        pytest.skip("Chrome não instalado")
+    driver = rf.make_driver()
+    yield driver
+    rf.DRIVERS.quit(driver)
+
+
+@pytest.mark.parametrize("path", PAGINAS, ids=lambda p: p.name)
+def test_modos_no_navegador(driver, path):
+    ref = referencia(path)
+    driver.get(path.as_uri())
+    rf.wait_table_ready(driver)
+    for mode in ("js", "lxml", "bs4"):
+        assert_frame_equal(ref, rf.read_table(driver, mode=mode), obj=f"read_table(mode={mode!r})")
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import re
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+def normalize(s) -> str:
+    if s is None or (isinstance(s, float) and pd.isna(s)):
+        return ""
+    s = str(s).strip().casefold()
+    s = unicodedata.normalize("NFD", s)
+    s = re.sub(r"[\u0300-\u036f]", "", s)
+    s = re.sub(r"\s+", " ", s)
+    return s
+
+
+def build_contains_pattern(terms: list[str]) -> str:
+    terms_norm = [normalize(t) for t in terms if t and str(t).strip()]
+    terms_norm = [t for t in terms_norm if t]
+    if not terms_norm:
+        return ""
+    return "|".join(re.escape(t) for t in terms_norm)
+
+
+@lru_cache(maxsize=None)
+def compile_contains(terms: tuple[str, ...]) -> re.Pattern | None:
+    pattern = build_contains_pattern(list(terms))
+    return re.compile(pattern) if pattern else None
+
+
+def factorize_normalized(s: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Normaliza só os valores distintos (nomes/categorias se repetem muito).
+    Devolve (código por linha, valores normalizados); o código -1 (NaN) cai no "" final.
+    """
+    codes, uniques = pd.factorize(s)
+    norm = np.array([normalize(u) for u in uniques] + [""], dtype=object)
+    return codes, norm
+
+
+def contains_mask(s: pd.Series, pattern: re.Pattern) -> np.ndarray:
+    codes, norm = factorize_normalized(s)
+    hits = np.fromiter((pattern.search(u) is not None for u in norm), dtype=bool, count=len(norm))
+    return hits[codes]